@@ -9,7 +9,7 @@ from django.db import transaction
 from django.utils.html import format_html
 from django.utils.timezone import now
 
-from apps.ai.models import Artifacts, Conversation, Job, Message
+from apps.ai.models import Artifacts, Conversation, ConversationCheckpoint, Job, Message
 
 
 class MessageInline(admin.TabularInline):
@@ -28,6 +28,14 @@ class MessageInline(admin.TabularInline):
         return format_html("<pre style='max-height:320px;overflow:auto'>{}</pre>", body)
 
 
+class ConversationCheckpointInline(admin.TabularInline):
+    model = ConversationCheckpoint
+    fields = ("message_count", "tokens_replaced", "summary", "created_at")
+    readonly_fields = fields
+    extra = 0
+    ordering = ("message_count",)
+
+
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
     list_display = (
@@ -37,7 +45,7 @@ class ConversationAdmin(admin.ModelAdmin):
         "created_at",
         "updated_at",
     )
-    inlines = (MessageInline,)
+    inlines = (MessageInline, ConversationCheckpointInline)
 
 
 @admin.register(Message)
@@ -57,6 +65,7 @@ class ArtifactsAdmin(admin.ModelAdmin):
     list_display = (
         "uuid",
         "file",
+        "media_type",
         "created_at",
         "updated_at",
     )
@@ -74,9 +83,11 @@ class JobAdmin(admin.ModelAdmin):
         "started_at",
         "finished_at",
         "duration_ms",
+        "ttft_ms",
+        "mode",
         "celery_task_id_short",
     )
-    list_filter = ("status", "workflow", ("created_at", admin.DateFieldListFilter))
+    list_filter = ("status", "workflow", "mode", ("created_at", admin.DateFieldListFilter))
     search_fields = (
         "uuid",
         "workflow",
@@ -92,12 +103,20 @@ class JobAdmin(admin.ModelAdmin):
         "uuid",
         "user",
         "workflow",
+        "parent",
+        "step",
+        "idempotency_key",
         "payload_pretty",
         "celery_task_id",
         "status",
         "output_text",
         "error_message",
         "runtime_ms",
+        "ttft_ms",
+        "mode",
+        "model_requests",
+        "input_tokens",
+        "output_tokens",
         "created_at",
         "updated_at",
         "started_at",
@@ -108,11 +127,14 @@ class JobAdmin(admin.ModelAdmin):
         "uuid",
         "user",
         "workflow",
+        ("parent", "step"),
+        "idempotency_key",
         "payload_pretty",
         "status",
         ("created_at", "updated_at"),
         ("started_at", "finished_at"),
-        ("runtime_ms", "celery_task_id"),
+        ("runtime_ms", "ttft_ms", "celery_task_id"),
+        ("mode", "model_requests", "input_tokens", "output_tokens"),
         "output_text",
         "error_message",
         "dispatched_at",
@@ -2,18 +2,21 @@ import logging
 from typing import Annotated
 from uuid import UUID
 
+from django.conf import settings
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from ninja import File, Form, Query, Router, UploadedFile
 from pydantic import BaseModel
 
 from apps.ai.engine.celery import enqueue_job
+from apps.ai.engine.workflows import enqueue_workflow, story_brainstorm, story_generation, story_illustration
 from apps.ai.models import Artifacts, Conversation
 from apps.ai.schemas import JobStatus
 from apps.ai.schemas import PageJob as OldPageJob
 from apps.ai.schemas import StoryJob as OldStoryJob
 from apps.ai.services import ConversationDetailSchema, ConversationSchema, ConversationService
 from apps.ai.types import ChatRequest, PageJob, StoryJob
+from apps.stories.services import StoryService
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -112,7 +115,7 @@ def send_chat(
 
 # TODO: Add Auth
 @router.post("/jobs/story/title/suggest")
-def ai_story_title(request, payload: OldStoryJob) -> JobStatus:
+def ai_story_title(request, payload: OldStoryJob, supersede: bool = False) -> JobStatus:
     # API validates via Pydantic (Ninja) here; Celery validates again at run time.
     logger.info(f"ai_story_title received: {payload} (type: {type(payload)})")
     chat_request = ChatRequest()
@@ -122,6 +125,7 @@ def ai_story_title(request, payload: OldStoryJob) -> JobStatus:
         workflow="ai.story_title",
         chat_request=chat_request,
         job=story_job,
+        supersede=supersede,
     )
     if request.htmx:
         return HttpResponse(status=204)
@@ -130,7 +134,7 @@ def ai_story_title(request, payload: OldStoryJob) -> JobStatus:
 
 # TODO: Add Auth
 @router.post("/jobs/story/description/suggest")
-def ai_story_description(request, payload: OldStoryJob) -> JobStatus:
+def ai_story_description(request, payload: OldStoryJob, supersede: bool = False) -> JobStatus:
     # API validates via Pydantic (Ninja) here; Celery validates again at run time.
     logger.info(f"ai_story_description received: {payload} (type: {type(payload)})")
     chat_request = ChatRequest()
@@ -140,6 +144,7 @@ def ai_story_description(request, payload: OldStoryJob) -> JobStatus:
         workflow="ai.story_description",
         chat_request=chat_request,
         job=story_job,
+        supersede=supersede,
     )
     if request.htmx:
         return HttpResponse(status=204)
@@ -148,16 +153,56 @@ def ai_story_description(request, payload: OldStoryJob) -> JobStatus:
 
 # TODO: Add Auth
 @router.post("/jobs/story/brainstorm")
-def ai_story_brainstorm(request, payload: OldStoryJob) -> JobStatus:
+def ai_story_brainstorm(request, payload: OldStoryJob, supersede: bool = False) -> JobStatus:
     # API validates via Pydantic (Ninja) here; Celery validates again at run time.
     logger.info(f"ai_story_brainstorm received: {payload} (type: {type(payload)})")
-    chat_request = ChatRequest()
     story_job = StoryJob(story_uuid=payload.story_uuid)
-    job = enqueue_job(
-        user=request.user,
-        workflow="ai.story_brainstorm",
-        chat_request=chat_request,
-        job=story_job,
+    # The title follows the brainstormed description
+    job = enqueue_workflow(
+        request.user.id,
+        "wf.story_brainstorm",
+        story_brainstorm(story_job.story_uuid),
+        StoryService(uuid=story_job.story_uuid).channel,
+        target=story_job,
+        supersede=supersede,
+    )
+    if request.htmx:
+        return HttpResponse(status=204)
+    return {"job_uuid": str(job.uuid), "status": job.status}
+
+
+@router.post("/jobs/story/generate")
+def ai_story_generate(request, payload: OldStoryJob, supersede: bool = False) -> JobStatus:
+    """Brainstorm, title, then write, describe and illustrate every page, page branches running in parallel."""
+    logger.info(f"ai_story_generate received: {payload} (type: {type(payload)})")
+    story_service = StoryService(uuid=payload.story_uuid)
+    page_uuids = [page.uuid for page in story_service.get_story().pages]
+    job = enqueue_workflow(
+        request.user.id,
+        "wf.story_generation",
+        story_generation(payload.story_uuid, page_uuids),
+        story_service.channel,
+        target=StoryJob(story_uuid=payload.story_uuid),
+        supersede=supersede,
+    )
+    if request.htmx:
+        return HttpResponse(status=204)
+    return {"job_uuid": str(job.uuid), "status": job.status}
+
+
+@router.post("/jobs/story/illustrate")
+def ai_story_illustrate(request, payload: OldStoryJob, supersede: bool = False) -> JobStatus:
+    """Illustrate every page without an image, a few pages at a time, as one summary job."""
+    logger.info(f"ai_story_illustrate received: {payload} (type: {type(payload)})")
+    story_service = StoryService(uuid=payload.story_uuid)
+    job = enqueue_workflow(
+        request.user.id,
+        "wf.story_illustration",
+        story_illustration(story_service.get_story()),
+        story_service.channel,
+        max_parallel=settings.AI_ILLUSTRATION_MAX_PARALLEL,
+        target=StoryJob(story_uuid=payload.story_uuid),
+        supersede=supersede,
     )
     if request.htmx:
         return HttpResponse(status=204)
@@ -165,7 +210,7 @@ def ai_story_brainstorm(request, payload: OldStoryJob) -> JobStatus:
 
 
 @router.post("/jobs/page/content/suggest")
-def ai_page_content(request, payload: OldPageJob) -> JobStatus:
+def ai_page_content(request, payload: OldPageJob, supersede: bool = False) -> JobStatus:
     # API validates via Pydantic (Ninja) here; Celery validates again at run time.
     logger.info(f"ai_page_content received: {payload} (type: {type(payload)})")
     chat_request = ChatRequest()
@@ -175,6 +220,7 @@ def ai_page_content(request, payload: OldPageJob) -> JobStatus:
         workflow="ai.page_content",
         chat_request=chat_request,
         job=page_job,
+        supersede=supersede,
     )
     if request.htmx:
         return HttpResponse(status=204)
@@ -182,7 +228,7 @@ def ai_page_content(request, payload: OldPageJob) -> JobStatus:
 
 
 @router.post("/jobs/page/image_text/suggest")
-def ai_page_image_text(request, payload: OldPageJob) -> JobStatus:
+def ai_page_image_text(request, payload: OldPageJob, supersede: bool = False) -> JobStatus:
     # API validates via Pydantic (Ninja) here; Celery validates again at run time.
     logger.info(f"ai_page_image_text received: {payload} (type: {type(payload)})")
     chat_request = ChatRequest()
@@ -192,6 +238,7 @@ def ai_page_image_text(request, payload: OldPageJob) -> JobStatus:
         workflow="ai.page_image_text",
         chat_request=chat_request,
         job=page_job,
+        supersede=supersede,
     )
     if request.htmx:
         return HttpResponse(status=204)
@@ -199,7 +246,7 @@ def ai_page_image_text(request, payload: OldPageJob) -> JobStatus:
 
 
 @router.post("/jobs/page/image/generate")
-def ai_page_image_generate(request, payload: OldPageJob) -> JobStatus:
+def ai_page_image_generate(request, payload: OldPageJob, supersede: bool = False) -> JobStatus:
     # API validates via Pydantic (Ninja) here; Celery validates again at run time.
     logger.info(f"ai_page_image_generate received: {payload} (type: {type(payload)})")
     chat_request = ChatRequest()
@@ -209,6 +256,7 @@ def ai_page_image_generate(request, payload: OldPageJob) -> JobStatus:
         workflow="ai.page_image",
         chat_request=chat_request,
         job=page_job,
+        supersede=supersede,
     )
     if request.htmx:
         return HttpResponse(status=204)
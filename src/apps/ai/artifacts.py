@@ -0,0 +1,190 @@
+"""
+Out-of-line storage for binary parts of conversation messages.
+
+Images and other ``BinaryContent`` parts are base64-inlined when a pydantic-ai message is serialized, which makes
+every ``Message.content`` that carries one multi-megabyte and has to be re-read and re-validated each turn. On insert
+those parts are written to ``Artifacts`` (deduplicated by SHA-256) and replaced with the matching pydantic-ai URL part
+pointing at ``artifact://<uuid>``, so stored and cached histories stay small. ``rehydrate`` turns the references back
+into model input, and it runs as a history processor so bytes are only loaded for a model call that sends them.
+"""
+
+import base64
+import binascii
+import dataclasses
+import hashlib
+import logging
+import mimetypes
+from collections.abc import Callable
+from urllib.parse import urlparse
+from uuid import UUID
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from pydantic_ai.messages import (
+    AudioUrl,
+    BinaryContent,
+    DocumentUrl,
+    FileUrl,
+    ImageUrl,
+    ModelMessage,
+    VideoUrl,
+)
+
+from apps.common.media import storage_name_for_url
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_SCHEME = "artifact"
+
+# Serialized ``kind`` of the URL part that stands in for a binary part, by media type prefix
+URL_KINDS = {"image/": "image-url", "audio/": "audio-url", "video/": "video-url"}
+URL_CLASSES: dict[str, type[FileUrl]] = {
+    "image-url": ImageUrl,
+    "audio-url": AudioUrl,
+    "video-url": VideoUrl,
+    "document-url": DocumentUrl,
+}
+
+StoreBinary = Callable[[bytes, str], UUID]
+
+
+def artifact_url(artifact_uuid: UUID) -> str:
+    return f"{ARTIFACT_SCHEME}://{artifact_uuid}"
+
+
+def artifact_uuid(url: str) -> UUID | None:
+    """Return the artifact UUID an ``artifact://`` URL points at, or None for any other URL."""
+    parsed = urlparse(url)
+    if parsed.scheme != ARTIFACT_SCHEME:
+        return None
+    try:
+        return UUID(parsed.netloc)
+    except ValueError:
+        return None
+
+
+def decode_data(data: str) -> bytes | None:
+    """Decode a serialized binary part; pydantic may have used either the standard or the URL-safe alphabet."""
+    try:
+        return base64.urlsafe_b64decode(data.replace("+", "-").replace("/", "_"))
+    except (binascii.Error, ValueError):
+        return None
+
+
+def is_binary_part(value) -> bool:
+    return (
+        isinstance(value, dict)
+        and value.get("kind") == "binary"
+        and isinstance(value.get("data"), str)
+        and isinstance(value.get("media_type"), str)
+    )
+
+
+def offload_binary_parts(content, store: StoreBinary, min_bytes: int = 0):
+    """Return serialized message content with binary parts of at least min_bytes replaced by artifact references.
+
+    Works on the JSON form of messages (as stored in ``Message.content``) and never modifies its input.
+    """
+    if is_binary_part(content):
+        data = decode_data(content["data"])
+        if data is None or len(data) < min_bytes:
+            return content
+        media_type = content["media_type"]
+        kind = next((k for prefix, k in URL_KINDS.items() if media_type.startswith(prefix)), "document-url")
+        return {
+            "url": artifact_url(store(data, media_type)),
+            "media_type": media_type,
+            "identifier": content.get("identifier"),
+            "force_download": False,
+            "vendor_metadata": content.get("vendor_metadata"),
+            "kind": kind,
+        }
+    if isinstance(content, dict):
+        return {key: offload_binary_parts(value, store, min_bytes) for key, value in content.items()}
+    if isinstance(content, list):
+        return [offload_binary_parts(value, store, min_bytes) for value in content]
+    return content
+
+
+def store_binary(data: bytes, media_type: str) -> UUID:
+    """Save bytes as an artifact, reusing an existing artifact with the same contents."""
+    from apps.ai.models import Artifacts
+
+    digest = hashlib.sha256(data).hexdigest()
+    existing = Artifacts.objects.filter(sha256=digest).values_list("uuid", flat=True).first()
+    if existing is not None:
+        return existing
+
+    extension = mimetypes.guess_extension(media_type) or ".bin"
+    artifact = Artifacts(sha256=digest, media_type=media_type)
+    artifact.file.save(f"message_{digest[:16]}{extension}", ContentFile(data), save=True)
+    logger.debug(f"Stored {len(data)} byte {media_type} message part as artifact {artifact.uuid}")
+    return artifact.uuid
+
+
+def offload_messages(messages: list[dict]) -> list[dict]:
+    """Move binary parts of serialized messages into artifacts, per ``AI_MESSAGE_INLINE_MAX_BYTES``."""
+    return offload_binary_parts(messages, store_binary, min_bytes=settings.AI_MESSAGE_INLINE_MAX_BYTES + 1)
+
+
+def _artifact_refs(messages: list[ModelMessage]):
+    for message in messages:
+        for part in message.parts:
+            content = getattr(part, "content", None)
+            for item in content if isinstance(content, list) else [content]:
+                if isinstance(item, FileUrl) and artifact_uuid(item.url) is not None:
+                    yield item
+
+
+def _load(ref: FileUrl, name: str | None) -> BinaryContent | FileUrl | str:
+    if name is None:
+        logger.warning(f"Message attachment {ref.url} no longer exists")
+        return f"[Attachment {ref.identifier} is no longer available]"
+    url = default_storage.url(name)
+    if urlparse(url).scheme in ("http", "https") and storage_name_for_url(url) is None:
+        # Remote storage (e.g. a bucket) serves the file itself; the model provider can fetch it there
+        return dataclasses.replace(ref, url=url)
+    with default_storage.open(name, "rb") as f:
+        return BinaryContent(data=f.read(), media_type=ref.media_type, identifier=ref.identifier)
+
+
+def rehydrate(messages: list[ModelMessage]) -> list[ModelMessage]:
+    """Replace artifact references with their contents, leaving the given message objects untouched.
+
+    Messages are shared with the history cache, so parts that change are copied rather than modified in place.
+    """
+    from apps.ai.models import Artifacts
+
+    refs = {artifact_uuid(ref.url) for ref in _artifact_refs(messages)}
+    if not refs:
+        return messages
+    names = dict(Artifacts.objects.filter(uuid__in=refs).values_list("uuid", "file"))
+    loaded: dict[str, BinaryContent | FileUrl | str] = {}
+
+    def resolve(item):
+        if not isinstance(item, FileUrl):
+            return item
+        uuid = artifact_uuid(item.url)
+        if uuid is None:
+            return item
+        if item.url not in loaded:
+            loaded[item.url] = _load(item, names.get(uuid))
+        return loaded[item.url]
+
+    rehydrated = []
+    for message in messages:
+        parts = []
+        for part in message.parts:
+            content = getattr(part, "content", None)
+            if isinstance(content, list):
+                new_content = [resolve(item) for item in content]
+                changed = any(new is not old for new, old in zip(new_content, content, strict=True))
+            else:
+                new_content = resolve(content)
+                changed = new_content is not content
+            parts.append(dataclasses.replace(part, content=new_content) if changed else part)
+        changed = any(new is not old for new, old in zip(parts, message.parts, strict=True))
+        rehydrated.append(dataclasses.replace(message, parts=parts) if changed else message)
+    logger.debug(f"Rehydrated {len(loaded)} message attachments")
+    return rehydrated
@@ -0,0 +1,25 @@
+import logging
+from textwrap import dedent
+
+from pydantic_ai import Agent
+
+logger = logging.getLogger(__name__)
+
+# Answers single-purpose suggestion jobs in one model request: no tools, the job passes the output type it wants
+# and applies the result to the story itself
+suggester_agent = Agent(
+    model="gemini-2.5-flash",
+    instructions=dedent("""\
+        ROLE:
+        You are a children's book ghost author.
+        You receive the current story, then one task. Answer with exactly what the task asks for.
+
+        ## Writing Guidelines
+        - Keep language simple and playful for ages 2-3
+        - Use short sentences and familiar words
+        - Focus on positive, comforting themes
+        - Avoid scary or complex concepts
+        - Make characters relatable and fun
+        - Title should be catchy, memorable, use rhythm/rhyme when possible
+        """),
+)
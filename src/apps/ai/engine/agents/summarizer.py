@@ -0,0 +1,25 @@
+import logging
+from textwrap import dedent
+
+from pydantic_ai import Agent
+
+logger = logging.getLogger(__name__)
+
+# Condenses older conversation turns into checkpoint summaries for the writer agent's history
+summarizer_agent = Agent(
+    model="gemini-2.5-flash",
+    instructions=dedent("""\
+        ROLE:
+        You condense the earlier part of a conversation between a user and a children's book writing assistant.
+
+        You receive the previous summary (if any) followed by a transcript of the turns that came after it.
+        Write one updated summary that replaces both. Keep:
+        - what the user asked for and any preferences or decisions they stated
+        - what the assistant changed in the story (titles, pages, illustrations) and with which tools
+        - open questions or unfinished requests
+
+        Drop greetings, repetition and tool output that the story itself now reflects.
+        Write plain prose or short bullets, at most 300 words.
+        """),
+    output_type=str,
+)
@@ -5,8 +5,10 @@ from textwrap import dedent
 from pydantic_ai import Agent, RunContext
 
 from apps.ai.engine.dependencies import StoryAgentDeps
+from apps.ai.engine.messages import CHARS_PER_TOKEN, compact_history, ensure_story_context, load_artifacts
 from apps.ai.engine.toolsets import book_toolset
 from apps.ai.types import ChatResponse
+from apps.common.db import release_connections
 
 logger = logging.getLogger(__name__)
 
@@ -22,8 +24,10 @@ writer_agent = Agent(
         You are helping ghostwrite children's stories.
 
         ## Story Context
-        You automatically receive the complete current story schema with every interaction,
-        including all content, pages, and structure. This contains everything you need.
+        You automatically receive the current story with every interaction,
+        including the title, description and every page's text and illustration notes:
+        in full the first time, then only what changed since you last saw it. Tools that change
+        the story report the resulting changes too. This contains everything you need.
         DO NOT call get_story() - the context is already fresh and complete.
 
         ## Common Tasks & How to Handle Them
@@ -48,9 +52,12 @@ writer_agent = Agent(
         """),
     output_type=ChatResponse,
     toolsets=[book_toolset],
+    history_processors=[compact_history, ensure_story_context, load_artifacts],
 )
 
 
+# Instructions are joined in registration order after the static ones, from least to most volatile: providers cache
+# prompts by prefix, so the date (daily) goes before the story (every edit)
 @writer_agent.instructions
 def add_the_date() -> str:
     logger.info("instructions.add_the_date")
@@ -58,14 +65,15 @@ def add_the_date() -> str:
 
 
 @writer_agent.instructions
-def add_story_schema(ctx: RunContext[str]) -> str:
-    story_service = ctx.deps.story_service
-    story = story_service.get_story(ctx.deps.story_uuid)
-    story_schema = dedent(f"""\
-        ## Story Schema:
-        ```json
-        {story.model_dump_json(indent=2)}
-        ```
-    """)
-    logger.info("instructions.add_story_schema")
-    return story_schema
+@release_connections
+def add_story_context(ctx: RunContext[StoryAgentDeps]) -> str | None:
+    if ctx.deps.story_context.in_history:
+        # Conversations carry the story in their messages: in full once, then as changes
+        return None
+    story = ctx.deps.story_service.get_story()
+    context = ctx.deps.story_context.full(story)
+    logger.info(
+        f"instructions.add_story_context: ~{len(context) // CHARS_PER_TOKEN} tokens "
+        f"(~{len(story.model_dump_json(indent=2)) // CHARS_PER_TOKEN} as JSON)"
+    )
+    return context
@@ -1,25 +1,105 @@
+import asyncio
+import json
 import logging
-from typing import Any
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field, replace
+from time import monotonic
+from typing import Any, NamedTuple
 
+from django.conf import settings
 from pydantic_ai import RunContext
 from pydantic_ai.toolsets import ToolsetTool, WrapperToolset
 
+from apps.common.outbox import batch_events
+
 logger = logging.getLogger(__name__)
 
+# Tool metadata for tools that only read. Their results are memoized within a run until a write tool is called, and
+# a batch of them runs concurrently; every other tool is mutating and makes its batch run one call at a time, in order
+READ_ONLY = {"read_only": True}
+
+CallKey = tuple[str, str]
+
+
+class ToolTiming(NamedTuple):
+    name: str
+    ms: float
+    memoized: bool
+
+
+@dataclass
+class ToolRunState:
+    """Toolset state for a single agent run."""
+
+    last_call: CallKey | None = None
+    # Read results by call, as futures so a read already in flight is shared rather than repeated
+    results: dict[CallKey, asyncio.Future] = field(default_factory=dict)
+    timings: list[ToolTiming] = field(default_factory=list)
+    read_slots: asyncio.Semaphore = field(default_factory=lambda: asyncio.Semaphore(settings.AI_TOOL_READ_CONCURRENCY))
+    token: Token | None = None
+
+
+_run_state: ContextVar[ToolRunState | None] = ContextVar("toolset_run_state", default=None)
+
+
+def current_run_state() -> ToolRunState | None:
+    return _run_state.get()
+
+
+def is_read_only(tool: ToolsetTool) -> bool:
+    return bool((tool.tool_def.metadata or {}).get("read_only"))
+
 
 class EnhancedToolset(WrapperToolset):
-    """Generic toolset wrapper for preventing duplicate executions and future enhancements."""
+    """Generic toolset wrapper: orders writes, runs reads concurrently, memoizes them and times every call.
+
+    Toolsets are module-level singletons shared by every run in the process, so state lives in a ``ToolRunState``
+    that each run sets up when it enters the toolset and that its tool calls (even concurrent ones, which copy the
+    run's context) find through a context variable.
+
+    pydantic-ai runs the tool calls of one model response concurrently unless one of them is ``sequential``. Tools
+    without ``READ_ONLY`` metadata are marked sequential here, so a batch with a write runs in the order the model
+    gave it, and a batch of reads runs in parallel with at most ``AI_TOOL_READ_CONCURRENCY`` calls in flight per run.
+    Sync tools execute on pydantic-ai's worker threads and bracket their ORM work with ``release_connections``.
+    """
+
+    async def get_tools(self, ctx: RunContext) -> dict[str, ToolsetTool]:
+        tools = await super().get_tools(ctx)
+        return {
+            name: tool if is_read_only(tool) else replace(tool, tool_def=replace(tool.tool_def, sequential=True))
+            for name, tool in tools.items()
+        }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._last_call: tuple[str, dict[str, Any]] | None = None
+    async def __aenter__(self):
+        await super().__aenter__()
+        state = ToolRunState()
+        state.token = _run_state.set(state)
+        return self
+
+    async def __aexit__(self, *args) -> bool | None:
+        state = _run_state.get()
+        if state is not None and state.token is not None:
+            _run_state.reset(state.token)
+            if state.timings:
+                memoized = sum(timing.memoized for timing in state.timings)
+                total_ms = sum(timing.ms for timing in state.timings)
+                logger.info(
+                    f"toolset run finished: {len(state.timings)} calls ({memoized} memoized), "
+                    f"{total_ms:.0f}ms in tools"
+                )
+        return await super().__aexit__(*args)
 
     async def call_tool(self, name: str, tool_args: dict[str, Any], ctx: RunContext, tool: ToolsetTool) -> Any:
         logger.info(f"toolset.call_tool({name}, {tool_args})")
-        call_signature = (name, tool_args)
+        state = _run_state.get() or ToolRunState()
+        call_key = (name, json.dumps(tool_args, sort_keys=True, default=str))
+        read_only = is_read_only(tool)
+
+        if read_only:
+            return await self._call_read(name, tool_args, ctx, tool, state, call_key)
 
         # Block consecutive duplicate calls
-        if self._last_call == call_signature:
+        if state.last_call == call_key:
             logger.warning(f"Blocked duplicate tool call: {name}")
             return {
                 "status": "already_completed",
@@ -29,5 +109,51 @@ class EnhancedToolset(WrapperToolset):
                 ),
             }
 
-        self._last_call = call_signature
-        return await super().call_tool(name, tool_args, ctx, tool)
+        state.last_call = call_key
+        started = monotonic()
+        try:
+            # Send the SSE refreshes triggered by this call as one deduplicated batch once it finishes
+            with batch_events():
+                return await super().call_tool(name, tool_args, ctx, tool)
+        finally:
+            # A write (even a failed one) may have changed anything a read returned
+            state.results.clear()
+            self._record(state, name, (monotonic() - started) * 1000, memoized=False)
+
+    async def _call_read(
+        self, name: str, tool_args: dict[str, Any], ctx: RunContext, tool: ToolsetTool, state: ToolRunState, call_key
+    ) -> Any:
+        started = monotonic()
+        pending = state.results.get(call_key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            finally:
+                self._record(state, name, (monotonic() - started) * 1000, memoized=True)
+
+        future = asyncio.get_running_loop().create_future()
+        state.results[call_key] = future
+        state.last_call = call_key
+        try:
+            async with state.read_slots:
+                started = monotonic()
+                with batch_events():
+                    result = await super().call_tool(name, tool_args, ctx, tool)
+        except BaseException as exc:
+            # Don't memoize failures; callers sharing this read see the same error
+            if state.results.get(call_key) is future:
+                del state.results[call_key]
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()
+            raise
+        finally:
+            self._record(state, name, (monotonic() - started) * 1000, memoized=False)
+        future.set_result(result)
+        return result
+
+    def _record(self, state: ToolRunState, name: str, ms: float, memoized: bool) -> None:
+        state.timings.append(ToolTiming(name, ms, memoized))
+        logger.info(f"toolset.call_tool({name}) took {ms:.1f}ms{' (memoized)' if memoized else ''}")
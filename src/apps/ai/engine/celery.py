@@ -1,60 +1,156 @@
+import logging
 from time import monotonic
 
 from celery import Task, current_app
+from celery.exceptions import Ignore
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.utils import timezone
+from pydantic_ai.usage import RunUsage
 
 from apps.ai.models import Job
-from apps.ai.types import ChatRequest
+from apps.ai.types import ChatRequest, PageJob, StoryJob
 from apps.ai.types import Job as JobType
 from apps.ai.types import User as UserType
+from apps.stories.models import Story
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = (Job.Status.QUEUED, Job.Status.RUNNING)
 
 
 class JobTask(Task):
-    _t0: float | None = None
+    # Task instances are shared by every worker thread, so start times are kept per task id
+    _started: dict[str, float] = {}
 
     def before_start(self, task_id, args, kwargs):
-        self._t0 = monotonic()
-        with transaction.atomic():
-            Job.objects.select_for_update().filter(celery_task_id=task_id).update(
-                status=Job.Status.RUNNING,
-                started_at=timezone.now(),
-            )
+        # Only a queued job is claimed: one revoked (or otherwise finished) before its message was picked up
+        # keeps its status, and Ignore skips the task body without on_success/on_failure running
+        claimed = Job.objects.filter(celery_task_id=task_id, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING,
+            started_at=timezone.now(),
+        )
+        if not claimed:
+            logger.info(f"{self.name}: job {task_id} is no longer queued, skipping")
+            raise Ignore()
+        self._started[task_id] = monotonic()
 
+    # Completion only moves a job still RUNNING: one failed by the stale step sweeper meanwhile keeps its status
     def on_success(self, retval, task_id, args, kwargs):
-        Job.objects.filter(celery_task_id=task_id).update(
+        Job.objects.filter(celery_task_id=task_id, status=Job.Status.RUNNING).update(
             status=Job.Status.SUCCESS,
             output_text=retval if isinstance(retval, str) else str(retval),
             finished_at=timezone.now(),
-            runtime_ms=int((monotonic() - (self._t0 or monotonic())) * 1000),
+            runtime_ms=self._runtime_ms(task_id),
         )
+        self._advance_workflow(task_id)
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
-        Job.objects.filter(celery_task_id=task_id).update(
+        Job.objects.filter(celery_task_id=task_id, status=Job.Status.RUNNING).update(
             status=Job.Status.FAILED,
             error_message=str(exc),
             finished_at=timezone.now(),
-            runtime_ms=int((monotonic() - (self._t0 or monotonic())) * 1000),
+            runtime_ms=self._runtime_ms(task_id),
+        )
+        self._advance_workflow(task_id)
+
+    def record_usage(self, mode: Job.Mode, usage: RunUsage | None = None) -> None:
+        """Store how the running job was executed and its model usage, to compare agent and direct runs.
+
+        usage includes any image model calls: agent runs add text model round trips around the same drawing, and
+        that difference is what the comparison is for.
+        """
+        usage = usage or RunUsage()
+        Job.objects.filter(celery_task_id=self.request.id).update(
+            mode=mode,
+            model_requests=usage.requests,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
         )
 
+    def _advance_workflow(self, task_id) -> None:
+        """Let the workflow this job is a step of, if any, queue the steps that were waiting for it."""
+        step = Job.objects.filter(celery_task_id=task_id).values_list("uuid", "parent_id").first()
+        if step and step[1] is not None:
+            from apps.ai.engine.workflows import advance
+
+            advance(step[1], finished=step[0])
+
+    def _runtime_ms(self, task_id) -> int:
+        started = self._started.pop(task_id, None)
+        return int((monotonic() - started) * 1000) if started is not None else 0
+
 
 def ensure_task_exists(name: str):
     if name not in current_app.tasks:
         raise ValueError(f"Unknown workflow '{name}'")
 
 
-def enqueue_job(user: User, workflow: str, chat_request: ChatRequest, job: JobType | None = None) -> Job:
+def audit_payload(task_payload) -> dict:
+    """The payload stored on the Job row, for audit/replay."""
+    return {
+        "user_id": task_payload.user.user_id,
+        "chat_request": task_payload.chat_request.model_dump(mode="json"),
+        "job": task_payload.job.model_dump(mode="json") if task_payload.job else None,
+    }
+
+
+def stored_task_payload(job_record: Job):
+    """Rebuild the task payload from a Job row's stored payload."""
+    from apps.ai.types import TaskPayload
+
+    payload = job_record.payload_json
+    return TaskPayload.model_validate(
+        {"user": {"user_id": payload["user_id"]}, "chat_request": payload["chat_request"], "job": payload["job"]}
+    )
+
+
+def dispatch_job(job_record: Job, task_payload) -> None:
+    """Send the job's task once the current transaction commits; the task id is the job's uuid."""
+
+    def _publish():
+        Job.objects.filter(uuid=job_record.uuid).update(celery_task_id=job_record.uuid)
+        task = current_app.tasks[job_record.workflow]
+        # Serialize to dict to preserve discriminated union through Celery
+        task.apply_async(kwargs={"payload": task_payload.model_dump(mode="json")}, task_id=str(job_record.uuid))
+        Job.objects.filter(uuid=job_record.uuid).update(dispatched_at=timezone.now())
+
+    transaction.on_commit(_publish)
+
+
+def idempotency_key(workflow: str, job: JobType | None) -> str:
+    """Key a job by workflow, target and the story's current version, or "" for jobs without a story target.
+
+    Must be called in a transaction: the story row stays locked until it ends, so concurrent requests for the
+    same story are keyed and deduplicated one at a time.
+    """
+    if isinstance(job, StoryJob):
+        target, stories = f"story:{job.story_uuid}", Story.objects.filter(uuid=job.story_uuid)
+    elif isinstance(job, PageJob):
+        target, stories = f"page:{job.page_uuid}", Story.objects.filter(pages__uuid=job.page_uuid)
+    else:
+        return ""
+    version = stories.select_for_update().values_list("version", flat=True).first()
+    return f"{workflow}:{target}:v{version}"
+
+
+def enqueue_job(
+    user: User, workflow: str, chat_request: ChatRequest, job: JobType | None = None, supersede: bool = False
+) -> Job:
     """
     Enqueue a job with ChatRequest and optional Job.
 
+    A request for a story or page that matches a job still queued or running (same workflow, target and story
+    version) gets that job back instead of a new one. With supersede, a matching job that is still only queued
+    is revoked and replaced by the new request; a running one is still returned.
+
     Args:
         user: Django User instance
         workflow: Task workflow name
         chat_request: ChatRequest with conversation/message data
         job: Optional job with story_uuid or page_uuid
+        supersede: Replace a matching queued job instead of returning it
     """
     ensure_task_exists(workflow)
 
@@ -63,26 +159,35 @@ def enqueue_job(user: User, workflow: str, chat_request: ChatRequest, job: JobTy
 
     task_payload = TaskPayload(user=UserType(user_id=user.id), chat_request=chat_request, job=job)
 
-    # Store serialized version for audit/replay
-    audit_payload = {
-        "user_id": user.id,
-        "chat_request": chat_request.model_dump(mode="json"),
-        "job": job.model_dump(mode="json") if job else None,
-    }
-
-    job_record = Job.objects.create(
-        user=user,
-        workflow=workflow,
-        status=Job.Status.QUEUED,
-        payload_json=audit_payload,
-    )
+    with transaction.atomic():
+        key = idempotency_key(workflow, job)
+        existing = (
+            Job.objects.filter(user=user, idempotency_key=key, status__in=IN_FLIGHT).order_by("-created_at").first()
+            if key
+            else None
+        )
+        if existing and not (supersede and revoke_queued(existing)):
+            logger.info(f"enqueue_job({workflow}): reusing in-flight job {existing.uuid} for {key}")
+            return existing
+
+        job_record = Job.objects.create(
+            user=user,
+            workflow=workflow,
+            status=Job.Status.QUEUED,
+            payload_json=audit_payload(task_payload),
+            idempotency_key=key,
+        )
+        dispatch_job(job_record, task_payload)
+    return job_record
 
-    def _publish():
-        Job.objects.filter(uuid=job_record.uuid).update(celery_task_id=job_record.uuid)
-        task = current_app.tasks[workflow]
-        # Serialize to dict to preserve discriminated union through Celery
-        task.apply_async(kwargs={"payload": task_payload.model_dump(mode="json")}, task_id=str(job_record.uuid))
-        Job.objects.filter(uuid=job_record.uuid).update(dispatched_at=timezone.now())
 
-    transaction.on_commit(_publish)
-    return job_record
+def revoke_queued(job_record: Job) -> bool:
+    """Revoke a job that hasn't started yet; False if it already has."""
+    revoked = Job.objects.filter(pk=job_record.pk, status=Job.Status.QUEUED).update(
+        status=Job.Status.REVOKED, error_message="Superseded by a newer request", finished_at=timezone.now()
+    )
+    if not revoked:
+        return False
+    # The task id is the job's uuid (see dispatch_job)
+    transaction.on_commit(lambda: current_app.control.revoke(str(job_record.uuid)))
+    return True
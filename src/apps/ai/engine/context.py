@@ -0,0 +1,173 @@
+"""
+Compact story context for agent instructions.
+
+The writer sees the whole story on every model request, so the rendering is plain labelled text rather than indented
+JSON: no UUIDs, URLs, image sizes or cache versions, and empty fields left out. Providers cache prompts by prefix, so
+the context is also ordered from stable to volatile: pages are listed least recently edited first, which leaves an
+edit to change only the tail of the prompt instead of everything after the edited page.
+
+Within a conversation the story goes into the history rather than the instructions (which are only sent for the
+latest request): in full once, then as the changes since the model last saw it, in later turns and in the results of
+tools that change the story. ``StoryContext`` keeps track of what the model has been shown.
+"""
+
+from datetime import UTC, datetime
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from apps.stories.services import PageSchema, StorySchema
+
+EPOCH = datetime.min.replace(tzinfo=UTC)
+STORY_HEADER = "## Story"
+CHANGES_HEADER = "## Story changes since you last saw it"
+
+
+def is_full_context(text: str) -> bool:
+    return text.startswith(f"{STORY_HEADER}\n")
+
+
+def is_story_context(text: str) -> bool:
+    return is_full_context(text) or text.startswith(CHANGES_HEADER)
+
+
+def page_header(page: PageSchema, *notes: str) -> str:
+    return f"[{', '.join([f'Page {page.page_number}', *(['illustrated'] if page.image else []), *notes])}]"
+
+
+def page_text(text: str | None) -> str:
+    return text.strip() if text else "(empty)"
+
+
+def render_page(page: PageSchema, *notes: str) -> str:
+    lines = [page_header(page, *notes), f"Text: {page_text(page.content)}"]
+    if page.image_text:
+        lines.append(f"Illustration notes: {page.image_text.strip()}")
+    return "\n".join(lines)
+
+
+def render_story_context(story: StorySchema) -> str:
+    """Render the story for the model: story fields, then pages from least to most recently edited, then the count.
+
+    The page count goes last and page headers leave it out, so adding a page doesn't change the text of the others.
+    """
+    lines = [STORY_HEADER]
+    if story.title:
+        lines.append(f"Title: {story.title}")
+    if story.description:
+        lines.append(f"Description: {story.description.strip()}")
+    if not story.pages:
+        lines.append("The story has no pages yet.")
+        return "\n".join(lines)
+
+    pages = sorted(story.pages, key=lambda page: (page.updated_at or EPOCH, page.page_number))
+    footer = f"{story.page_count} pages in total, listed least recently edited first; page numbers give story order."
+    return "\n\n".join(["\n".join(lines), *(render_page(page) for page in pages), footer])
+
+
+class SeenPage(BaseModel):
+    uuid: UUID
+    content: str | None
+    image_text: str | None
+    illustrated: bool
+
+
+class SeenStory(BaseModel):
+    """The parts of a story snapshot the model is shown, in story order."""
+
+    version: int
+    title: str | None
+    description: str | None
+    pages: list[SeenPage]
+
+    @classmethod
+    def of(cls, story: StorySchema) -> "SeenStory":
+        return cls(
+            version=story.version,
+            title=story.title,
+            description=story.description,
+            pages=[
+                SeenPage(
+                    uuid=page.uuid, content=page.content, image_text=page.image_text, illustrated=bool(page.image)
+                )
+                for page in story.pages
+            ],
+        )
+
+
+def render_story_changes(seen: SeenStory, story: StorySchema) -> str:
+    """Render what changed between the seen story and the current one, or "" when nothing the model sees did.
+
+    Removed pages and reordering are given by previous page number; added pages are rendered in full and edited
+    pages with only the fields that changed.
+    """
+    lines = []
+    if story.title != seen.title:
+        lines.append(f"Title: {story.title or '(none)'}")
+    if story.description != seen.description:
+        lines.append(f"Description: {story.description.strip() if story.description else '(none)'}")
+
+    previous = {page.uuid: (number, page) for number, page in enumerate(seen.pages, start=1)}
+    current = {page.uuid for page in story.pages}
+    removed = [str(number) for uuid, (number, _page) in previous.items() if uuid not in current]
+    if removed:
+        lines.append(f"Removed pages, by previous number: {', '.join(removed)}")
+    if any(previous[page.uuid][0] != page.page_number for page in story.pages if page.uuid in previous):
+        order = [str(previous[page.uuid][0]) if page.uuid in previous else "new" for page in story.pages]
+        lines.append(f"Page order now, by previous number: {', '.join(order)}")
+
+    blocks = []
+    for page in story.pages:
+        if page.uuid not in previous:
+            blocks.append(render_page(page, "new"))
+            continue
+        before = previous[page.uuid][1]
+        changed = []
+        if page.content != before.content:
+            changed.append(f"Text: {page_text(page.content)}")
+        if page.image_text != before.image_text:
+            changed.append(f"Illustration notes: {page_text(page.image_text)}")
+        if bool(page.image) != before.illustrated:
+            changed.append("Illustration: " + ("new" if page.image else "removed"))
+        if changed:
+            blocks.append("\n".join([page_header(page, "edited"), *changed]))
+
+    if not lines and not blocks:
+        return ""
+    if len(story.pages) != len(seen.pages):
+        lines.append(f"{story.page_count} pages in total.")
+    return "\n\n".join(["\n".join([CHANGES_HEADER, *lines]), *blocks])
+
+
+class StoryContext:
+    """What the model has been shown of one story, so it gets the story in full once and only changes after that.
+
+    ``in_history`` is set for conversations, where what the model saw is carried in the message history; otherwise
+    the instructions render the full story on every request.
+    """
+
+    def __init__(self, seen: SeenStory | None = None, in_history: bool = False):
+        self.seen = seen
+        self.in_history = in_history
+
+    def full(self, story: StorySchema) -> str:
+        self.seen = SeenStory.of(story)
+        return render_story_context(story)
+
+    def changes(self, story: StorySchema) -> str:
+        """Return the changes since the model last saw the story, or the full story when that is shorter."""
+        if self.seen is None:
+            return self.full(story)
+        if story.version == self.seen.version:
+            return ""
+        changes = render_story_changes(self.seen, story)
+        full = render_story_context(story)
+        self.seen = SeenStory.of(story)
+        return full if len(changes) >= len(full) else changes
+
+    def to_json(self) -> dict | None:
+        return self.seen.model_dump(mode="json") if self.seen else None
+
+    @classmethod
+    def from_json(cls, data: dict | None, in_history: bool = False) -> "StoryContext":
+        return cls(SeenStory.model_validate(data) if data else None, in_history=in_history)
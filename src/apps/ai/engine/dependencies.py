@@ -6,7 +6,9 @@ import logging
 from uuid import UUID
 
 from google.genai import Client as GoogleClient
+from pydantic_ai.usage import RunUsage
 
+from apps.ai.engine.context import StoryContext
 from apps.ai.services import ArtifactService
 from apps.stories.services import StoryService
 
@@ -17,11 +19,16 @@ class StoryAgentDeps:
     """Container for all agent dependencies."""
 
     user_id: int
+    conversation_uuid: UUID | None
     story_uuid: UUID | None
+    page_uuid: UUID | None
     story_service: StoryService
+    story_context: StoryContext
+    illustration_context: list[str] | None
     artifact_service: ArtifactService
     image_client: GoogleClient
     image_model: str
+    image_usage: RunUsage
 
     def __init__(
         self,
@@ -58,12 +65,20 @@ class StoryAgentDeps:
             StoryService.load_from_page_uuid(page_uuid) if page_uuid else StoryService(uuid=story_uuid)
         )
         self.story_uuid = self.story_service.uuid
+        self.page_uuid = page_uuid
+        self.conversation_uuid = conversation_uuid
         self.user_id = user_id
+        # What the model has seen of the story; conversations restore it with ConversationService.story_context()
+        self.story_context = StoryContext()
+        # Story text for drawings, prepared once when a workflow illustrates many pages (see StoryService.text_parts)
+        self.illustration_context = None
 
         logger.debug("Initializing artifact service, image client, and image model")
         self.artifact_service = ArtifactService()
         self.image_client = GoogleClient()
         self.image_model = image_model
+        # Image model usage of the drawings made through the artist_request tool, which the run's usage leaves out
+        self.image_usage = RunUsage()
 
         # Verify user has access to the story
         self._auth()
@@ -1,4 +1,24 @@
-from pydantic_ai.messages import ModelMessage, ToolReturnPart
+import logging
+from dataclasses import replace
+
+from django.conf import settings
+from pydantic_ai import RunContext
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    RetryPromptPart,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+from apps.ai.engine.context import is_full_context, is_story_context
+from apps.ai.engine.runtime import database_sync_to_async
+
+logger = logging.getLogger(__name__)
 
 MESSAGE_WINDOW = 15
 
@@ -15,3 +35,169 @@ async def keep_recent_messages(messages: list[ModelMessage]) -> list[ModelMessag
     if await message_at_index_contains_tool_return_parts(messages, len(messages) - message_window):
         return messages
     return messages[-message_window:]
+
+
+# Rough token estimate for budgeting: serialized size over average characters per token
+CHARS_PER_TOKEN = 4
+# Tool returns are clipped to this many characters when rendered for the summarizer
+TRANSCRIPT_RETURN_CHARS = 500
+CHECKPOINT_HEADER = "Summary of the earlier conversation (older messages were condensed to save space):"
+
+
+def estimate_tokens(message: ModelMessage) -> int:
+    return len(ModelMessagesTypeAdapter.dump_json([message])) // CHARS_PER_TOKEN + 1
+
+
+def is_turn_start(message: ModelMessage) -> bool:
+    """True for a request that opens a user turn and answers no tool calls, i.e. a safe place to cut history.
+
+    Cutting only here keeps every tool call in the same slice as its return.
+    """
+    if not isinstance(message, ModelRequest):
+        return False
+    has_prompt = any(isinstance(part, UserPromptPart) for part in message.parts)
+    answers_tools = any(isinstance(part, ToolReturnPart | RetryPromptPart) for part in message.parts)
+    return has_prompt and not answers_tools
+
+
+def is_compacted(messages: list[ModelMessage]) -> bool:
+    return bool(messages) and any(
+        isinstance(part, UserPromptPart) and str(part.content).startswith(CHECKPOINT_HEADER)
+        for part in messages[0].parts
+    )
+
+
+def find_cut(messages: list[ModelMessage], tokens: list[int], start: int, keep_tokens: int) -> int | None:
+    """Return the earliest turn start after start whose suffix fits keep_tokens, else the last turn start."""
+    suffix = sum(tokens[start:])
+    last_turn_start = None
+    for index in range(start, len(messages)):
+        if index > start and is_turn_start(messages[index]):
+            if suffix <= keep_tokens:
+                return index
+            last_turn_start = index
+        suffix -= tokens[index]
+    return last_turn_start
+
+
+def prompt_texts(part: UserPromptPart) -> list[str]:
+    return (
+        [part.content] if isinstance(part.content, str) else [item for item in part.content if isinstance(item, str)]
+    )
+
+
+def user_text(part: UserPromptPart) -> str:
+    """The user's words in a prompt, without attachments or the story context sent along with them."""
+    return "\n".join(text for text in prompt_texts(part) if not is_story_context(text)) or "[user sent attachments]"
+
+
+def render_transcript(messages: list[ModelMessage]) -> str:
+    lines = []
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, UserPromptPart):
+                lines.append(f"USER: {user_text(part)}")
+            elif isinstance(part, TextPart):
+                lines.append(f"ASSISTANT: {part.content}")
+            elif isinstance(part, ToolCallPart):
+                lines.append(f"TOOL CALL {part.tool_name}: {part.args_as_json_str()}")
+            elif isinstance(part, ToolReturnPart):
+                lines.append(f"TOOL RESULT {part.tool_name}: {part.model_response_str()[:TRANSCRIPT_RETURN_CHARS]}")
+    return "\n".join(lines)
+
+
+def with_checkpoint(summary: str, messages: list[ModelMessage], cut: int) -> list[ModelMessage]:
+    """Replace messages[:cut] with one request carrying their system prompts and the checkpoint summary."""
+    system_parts = [part for message in messages[:cut] for part in message.parts if isinstance(part, SystemPromptPart)]
+    checkpoint = ModelRequest(parts=[*system_parts, UserPromptPart(content=f"{CHECKPOINT_HEADER}\n\n{summary}")])
+    return [checkpoint, *messages[cut:]]
+
+
+async def summarize(previous_summary: str, messages: list[ModelMessage]) -> str:
+    from apps.ai.engine.agents.summarizer import summarizer_agent
+
+    prompt = f"PREVIOUS SUMMARY:\n{previous_summary or '(none)'}\n\nTRANSCRIPT:\n{render_transcript(messages)}"
+    result = await summarizer_agent.run(prompt)
+    return result.output
+
+
+async def compact_history(ctx: RunContext, messages: list[ModelMessage]) -> list[ModelMessage]:
+    """Keep the history sent to the model within AI_HISTORY_TOKEN_BUDGET using stored summary checkpoints.
+
+    Over budget, the oldest turns are replaced by the conversation's latest checkpoint. A new checkpoint, summarizing
+    the previous one plus the turns after it, is generated only when that still doesn't fit, and it leaves about
+    AI_HISTORY_KEEP_TOKENS of recent turns verbatim. Cuts fall on turn starts, so tool calls stay paired with their
+    returns; system prompts from replaced messages are carried over, and agent instructions are not part of the
+    history at all.
+    """
+    from apps.ai.models import ConversationCheckpoint
+
+    conversation_uuid = getattr(ctx.deps, "conversation_uuid", None)
+    if conversation_uuid is None or is_compacted(messages):
+        return messages
+    tokens = [estimate_tokens(message) for message in messages]
+    budget = settings.AI_HISTORY_TOKEN_BUDGET
+    if sum(tokens) <= budget:
+        return messages
+
+    checkpoint = await database_sync_to_async(ConversationCheckpoint.latest_for)(conversation_uuid, len(messages))
+    if checkpoint is not None and not is_turn_start(messages[checkpoint.message_count]):
+        # The stored history no longer lines up with this checkpoint; summarize from the beginning
+        checkpoint = None
+    start = checkpoint.message_count if checkpoint else 0
+    summary = checkpoint.summary if checkpoint else ""
+    summary_tokens = len(summary) // CHARS_PER_TOKEN
+    if checkpoint and summary_tokens + sum(tokens[start:]) <= budget:
+        return with_checkpoint(summary, messages, start)
+
+    cut = find_cut(messages, tokens, start, settings.AI_HISTORY_KEEP_TOKENS)
+    if cut is None:
+        # A single turn larger than the budget can't be split without breaking tool pairing
+        return with_checkpoint(summary, messages, start) if checkpoint else messages
+
+    summary = await summarize(summary, messages[start:cut])
+    tokens_replaced = (checkpoint.tokens_replaced if checkpoint else 0) + sum(tokens[start:cut])
+    await database_sync_to_async(ConversationCheckpoint.store)(conversation_uuid, cut, summary, tokens_replaced)
+    logger.info(
+        f"compact_history({conversation_uuid}): checkpoint through message {cut}, "
+        f"{tokens_replaced} tokens replaced by {len(summary) // CHARS_PER_TOKEN}"
+    )
+    return with_checkpoint(summary, messages, cut)
+
+
+async def ensure_story_context(ctx: RunContext, messages: list[ModelMessage]) -> list[ModelMessage]:
+    """Put the full story back in the latest user prompt when the history no longer holds a full copy.
+
+    Conversations send the story in full once and only changes after that, so the changes are meaningless once
+    compaction has summarized that first copy away. Runs after compact_history; the replaced prompt is what gets
+    stored, so later turns find the full copy in it.
+    """
+    story_context = getattr(ctx.deps, "story_context", None)
+    if story_context is None or not story_context.in_history:
+        return messages
+    prompts = [part for message in messages for part in message.parts if isinstance(part, UserPromptPart)]
+    if any(is_full_context(text) for part in prompts for text in prompt_texts(part)):
+        return messages
+    turn = next((index for index in reversed(range(len(messages))) if is_turn_start(messages[index])), None)
+    if turn is None:
+        return messages
+
+    story = await database_sync_to_async(ctx.deps.story_service.get_story)()
+    context = story_context.full(story)
+    request = messages[turn]
+    index, part = next((i, part) for i, part in enumerate(request.parts) if isinstance(part, UserPromptPart))
+    content = [part.content] if isinstance(part.content, str) else list(part.content)
+    content = [context, *(item for item in content if not (isinstance(item, str) and is_story_context(item)))]
+    parts = [*request.parts[:index], replace(part, content=content), *request.parts[index + 1 :]]
+    logger.info(f"ensure_story_context: no full story left in the history, resending it with message {turn}")
+    return [*messages[:turn], replace(request, parts=parts), *messages[turn + 1 :]]
+
+
+async def load_artifacts(messages: list[ModelMessage]) -> list[ModelMessage]:
+    """Swap artifact:// references in the history for the stored bytes right before they go to the model.
+
+    Runs after compaction, so attachments of turns that were summarized away are never loaded.
+    """
+    from apps.ai.artifacts import rehydrate
+
+    return await database_sync_to_async(rehydrate)(messages)
@@ -0,0 +1,187 @@
+"""
+Asyncio execution of agent runs inside Celery workers.
+
+An agent run spends nearly all of its time waiting on the model provider, so running one per worker process with
+``run_sync`` wastes the process. In async mode (``AI_AGENT_ASYNC``) each worker process keeps one event loop on a
+background thread; task threads (``--pool=threads``) do their ORM work as usual, submit ``agent.run()`` to that loop
+and wait for the result, so up to ``AI_AGENT_CONCURRENCY`` runs share the process.
+
+ORM access never happens on the loop itself. pydantic-ai runs sync tools and instructions on worker threads, which
+wrap their work in ``release_connections`` (see ``apps.common.db``). Async code such as history processors goes
+through ``database_sync_to_async``: there is no outer ``async_to_sync`` on the loop thread, so plain thread-sensitive
+``sync_to_async`` calls from every run would queue on one shared thread whose connections are never closed. On the
+loop it runs the call on the runtime's own executor instead and closes the thread's connections when it returns.
+"""
+
+import asyncio
+import logging
+import threading
+from collections.abc import Awaitable, Callable, Coroutine
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from time import monotonic
+from typing import Any, NamedTuple
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import connections
+from pydantic_ai import Agent
+from pydantic_ai.agent import AgentRunResult
+from pydantic_ai.usage import RunUsage
+
+logger = logging.getLogger(__name__)
+
+
+class AgentRuntime:
+    """A per-process event loop on a daemon thread, running submitted coroutines with bounded concurrency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.executor: ThreadPoolExecutor | None = None
+        self.active = 0
+
+    @property
+    def concurrency(self) -> int:
+        return settings.AI_AGENT_CONCURRENCY
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="agent-orm")
+                self._thread = threading.Thread(target=loop.run_forever, name="agent-runtime", daemon=True)
+                self._thread.start()
+                self._loop = loop
+                logger.info(f"Started agent runtime loop with concurrency {self.concurrency}")
+            return self._loop
+
+    async def _run[T](self, factory: Callable[[], Awaitable[T]]) -> T:
+        async with self._semaphore:
+            self.active += 1
+            try:
+                return await factory()
+            finally:
+                self.active -= 1
+
+    def run[T](self, factory: Callable[[], Awaitable[T]], timeout: float | None = None) -> T:
+        """Run the coroutine made by factory on the loop and block the calling thread until it finishes."""
+        future = asyncio.run_coroutine_threadsafe(self._run(factory), self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def is_current(self) -> bool:
+        """Whether the caller is running on this runtime's loop."""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def shutdown(self) -> None:
+        with self._lock:
+            loop, thread, executor = self._loop, self._thread, self.executor
+            self._loop = self._thread = self._semaphore = self.executor = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        executor.shutdown()
+
+
+agent_runtime = AgentRuntime()
+
+
+def run_coroutine[T](factory: Callable[[], Awaitable[T]]) -> T:
+    """Run the coroutine made by factory from sync code: on the worker's event loop in async mode, else inline."""
+    if settings.AI_AGENT_ASYNC:
+        return agent_runtime.run(factory)
+
+    async def run() -> T:
+        return await factory()
+
+    return async_to_sync(run)()
+
+
+def database_sync_to_async[**P, R](func: Callable[P, R]) -> Callable[P, Coroutine[Any, Any, R]]:
+    """Make a sync ORM call awaitable from agent code.
+
+    On the runtime's loop the call runs on the runtime's executor and the thread's connections are closed once it
+    returns. Anywhere else, such as sync mode under ``async_to_sync``, it is a plain ``sync_to_async`` call, which
+    runs on the calling thread and so sees the same connection and transaction.
+    """
+
+    def closing(*args: P.args, **kwargs: P.kwargs) -> R:
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+
+    @wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        if agent_runtime.is_current():
+            return await sync_to_async(closing, thread_sensitive=False, executor=agent_runtime.executor)(
+                *args, **kwargs
+            )
+        return await sync_to_async(func)(*args, **kwargs)
+
+    return wrapper
+
+
+def log_usage(agent: Agent, usage: RunUsage) -> None:
+    """Log a run's token usage; cache reads show how much of the prompt prefix the provider reused."""
+    logger.info(
+        f"{agent.name or 'agent'} run: {usage.requests} requests, {usage.input_tokens} input tokens "
+        f"({usage.cache_read_tokens} cached), {usage.output_tokens} output tokens"
+    )
+
+
+def run_agent(agent: Agent, prompt, **kwargs) -> AgentRunResult:
+    """Run an agent to completion from sync code: on the worker's event loop in async mode, else with run_sync."""
+    if settings.AI_AGENT_ASYNC:
+        result = agent_runtime.run(partial(agent.run, prompt, **kwargs))
+    else:
+        result = agent.run_sync(prompt, **kwargs)
+    log_usage(agent, result.usage())
+    return result
+
+
+class StreamedRun(NamedTuple):
+    output: Any
+    new_messages_json: bytes
+    ttft_ms: int | None
+
+
+async def stream_agent(
+    agent: Agent, prompt, on_partial: Callable[[Any], Awaitable[None]], interval: float, **kwargs
+) -> StreamedRun:
+    """Run an agent with a streamed response, passing partial output to on_partial at most once per interval.
+
+    The first partial output goes out as soon as it arrives and the latest one is always delivered before the run
+    ends. Time to first token is measured from the start of the run to that first partial output, so it includes
+    any tool calls the model makes before it starts answering.
+    """
+    started = monotonic()
+    ttft_ms = None
+    last_sent = float("-inf")
+    pending = None
+    async with agent.run_stream(prompt, **kwargs) as result:
+        async for output in result.stream_output(debounce_by=None):
+            now = monotonic()
+            if ttft_ms is None:
+                ttft_ms = int((now - started) * 1000)
+            pending = output
+            if now - last_sent >= interval:
+                await on_partial(pending)
+                last_sent, pending = now, None
+        if pending is not None:
+            await on_partial(pending)
+        output = await result.get_output()
+    log_usage(agent, result.usage())
+    return StreamedRun(output, result.new_messages_json(), ttft_ms)
@@ -1,27 +1,92 @@
 import logging
 from textwrap import dedent
+from typing import NamedTuple
 
 from pydantic_ai import RunContext
 from pydantic_ai.messages import ToolReturn
+from pydantic_ai.usage import RunUsage
 
 from apps.ai.engine.dependencies import StoryAgentDeps
 from apps.ai.types import tool_return
+from apps.common.db import release_connections
+from apps.stories.services import PageKey, ReferenceImage
 
 logger = logging.getLogger(__name__)
 
+INSTRUCTIONS = dedent("""\
+    # INSTRUCTIONS
+    ## ROLE:
+    You are a talented children's book illustrator creating artwork for this story.
 
-def artist_request(ctx: RunContext[StoryAgentDeps], prompt: str) -> ToolReturn:
+    ## SYSTEM_INSTRUCTION:
+    * Always include the story text in the generated image.
+    * Ensure the text is readable & consistent with other images.
+    * Text should be thoroughly proofread.
+    * Draw the illustration described under PROMPT, after the story context.
+""")
+
+
+class Drawing(NamedTuple):
+    images: list[bytes]
+    references: list[ReferenceImage]
+    usage: RunUsage = RunUsage()
+
+
+def draw(deps: StoryAgentDeps, prompt: str, page_key: PageKey | None = None) -> Drawing:
+    """Generate illustrations for prompt with the story's text and the references picked for page_key as context."""
+    # Use story service to prepare properly formatted story context with a bounded set of reference images
+    story_service = deps.story_service
+    references = story_service.reference_images(page_key, query=prompt)
+
+    if deps.illustration_context is not None:
+        # Shared by every page of the workflow; only the references are picked for this page
+        story_parts = [*deps.illustration_context, *story_service.reference_parts(references)]
+    else:
+        story_parts = story_service.gemini_parts(references)
+    # The page's prompt goes last, so drawings of the same story share everything before it
+    contents = [
+        INSTRUCTIONS,
+        "## STORY_CONTEXT:",
+        *story_parts,
+        f"## PROMPT:\n{prompt}",
+    ]
+
+    # Use direct Gemini client instead of nested Agent to avoid binary content issues
+    resp = deps.image_client.models.generate_content(
+        model=deps.image_model,
+        contents=contents,
+    )
+    images = [
+        part.inline_data.data
+        for cand in resp.candidates or []
+        for part in cand.content.parts or []
+        if part.inline_data
+    ]
+    metadata = resp.usage_metadata
+    usage = RunUsage(
+        requests=1,
+        input_tokens=(metadata and metadata.prompt_token_count) or 0,
+        output_tokens=(metadata and metadata.candidates_token_count) or 0,
+    )
+    return Drawing(images, references, usage)
+
+
+@release_connections
+def artist_request(ctx: RunContext[StoryAgentDeps], prompt: str, page_num: int | None = None) -> ToolReturn:
     """Generate illustrations using AI image generation for the story.
 
     This tool creates custom illustrations based on the provided prompt and
     automatically includes comprehensive story context. The generator already has
-    access to the complete story (all pages, text, and existing images), so you
-    only need to specify the visual requirements for the new illustration.
+    access to the text of every page plus the existing illustrations most relevant
+    to the page being drawn, so you only need to specify the visual requirements
+    for the new illustration.
 
     Args:
         ctx: The runtime context containing story dependencies and image client.
         prompt: Detailed description of the illustration to generate.
             Story context is automatically provided - no need to repeat story details.
+        page_num: The page number (1-indexed) the illustration is for, used to pick
+            reference images from its neighbouring and similar pages. Optional.
 
     Returns:
         ToolReturn: Contains success/failure message and URLs of generated
@@ -32,52 +97,24 @@ def artist_request(ctx: RunContext[StoryAgentDeps], prompt: str) -> ToolReturn:
         The tool automatically provides complete story context to ensure illustrations
         match the narrative and maintain visual consistency.
     """
-    logger.info(f"tool.artist_request({ctx.deps.story_uuid}, {prompt})")
-
-    # Use story service to prepare properly formatted story context with images
-    story_service = ctx.deps.story_service
-
-    instructions = dedent(f"""\
-        # INSTRUCTIONS
-        ## ROLE:
-        You are a talented children's book illustrator creating artwork for this story.
-
-        ## SYSTEM_INSTRUCTION:
-        * Always include the story text in the generated image.
-        * Ensure the text is readable & consistent with other images.
-        * Text should be thoroughly proofread.
-
-        ## PROMPT:
-        {prompt}
-        ------
-    """)
+    logger.info(f"tool.artist_request({ctx.deps.story_uuid}, {prompt}, page_num={page_num})")
 
-    contents = [
-        instructions,
-        "## STORY_CONTEXT:",
-        *story_service.gemini_parts(),
-    ]
-
-    # Use direct Gemini client instead of nested Agent to avoid binary content issues
-    resp = ctx.deps.image_client.models.generate_content(
-        model=ctx.deps.image_model,
-        contents=contents,
-    )
+    drawing = draw(ctx.deps, prompt, page_num or ctx.deps.page_uuid)
+    ctx.deps.image_usage.incr(drawing.usage)
+    references = drawing.references
 
     content_blocks = []
     image_urls = []
-    for cand in resp.candidates or []:
-        for part in cand.content.parts or []:
-            if part.inline_data:
-                data = part.inline_data.data
-                image_url = ctx.deps.artifact_service.save_image(data)
-                image_urls.append(image_url)
-                logger.info(f"Artist created image: {image_url}")
+    for data in drawing.images:
+        image_url = ctx.deps.artifact_service.save_image(data)
+        image_urls.append(image_url)
+        logger.info(f"Artist created image: {image_url}")
 
+    metadata = {"reference_pages": [{"page_num": r.page_number, "reason": r.reason} for r in references]}
     if image_urls:
         return_msg = f"Artist created {len(image_urls)} illustration(s): {', '.join(image_urls)}"
         content_blocks.append(return_msg)
-        return tool_return("Artifacts saved", content=content_blocks)
+        return tool_return("Artifacts saved", content=content_blocks, metadata=metadata)
     else:
         content_blocks.append("Artist request completed but no images were generated")
-        return tool_return("No artifacts", content=content_blocks)
+        return tool_return("No artifacts", content=content_blocks, metadata=metadata)
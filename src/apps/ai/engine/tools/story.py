@@ -1,19 +1,27 @@
 import logging
 
 from pydantic_ai import RunContext
-from pydantic_ai.messages import ImageUrl, ToolReturn
+from pydantic_ai.messages import ToolReturn
 
 from apps.ai.engine.dependencies import StoryAgentDeps
 from apps.ai.types import tool_return
+from apps.common.db import release_connections
+from apps.common.media import model_media
 from apps.stories.services import PageSchema
 
 logger = logging.getLogger(__name__)
 
 
+def story_changes(ctx: RunContext[StoryAgentDeps]) -> str:
+    """The story changes the model hasn't seen yet, for the result of a tool that changed the story."""
+    return ctx.deps.story_context.changes(ctx.deps.story_service.get_story())
+
+
 # Read operations - inspect existing content
 
 
 # TODO: Add flag to get_story to include page images
+@release_connections
 def get_story(ctx: RunContext[StoryAgentDeps]) -> ToolReturn:
     """Get comprehensive story information including title, description, and all pages.
 
@@ -37,6 +45,7 @@ def get_story(ctx: RunContext[StoryAgentDeps]) -> ToolReturn:
 
 
 # TODO: Add flag to get_story to include page images
+@release_connections
 def get_page(ctx: RunContext[StoryAgentDeps], page_num: int) -> PageSchema:
     """Get detailed information for a specific page in the story.
 
@@ -60,6 +69,7 @@ def get_page(ctx: RunContext[StoryAgentDeps], page_num: int) -> PageSchema:
     return tool_return(page)
 
 
+@release_connections
 def get_page_image(ctx: RunContext[StoryAgentDeps], page_num: int) -> ToolReturn:
     """Retrieve the image associated with a specific page.
 
@@ -72,7 +82,7 @@ def get_page_image(ctx: RunContext[StoryAgentDeps], page_num: int) -> ToolReturn
         page_num: The page number to get the image for (1-indexed).
 
     Returns:
-        ToolReturn: Contains either the page image as ImageUrl content or
+        ToolReturn: Contains either the page image (bytes, or a link when storage is remote) or
         a message indicating no image was found.
     """
     logger.info(f"tool.get_page_image({page_num})")
@@ -83,13 +93,14 @@ def get_page_image(ctx: RunContext[StoryAgentDeps], page_num: int) -> ToolReturn
     return tool_return(
         f"Found image for page {page_num}",
         content=[
-            # BinaryContent(data=image_binary, media_type=media_type),
-            ImageUrl(url=page.image.url, force_download=True),
+            # Read from (or linked through) storage rather than downloaded back from our own /media/
+            model_media(page.image.name),
         ],
     )
 
 
 # Create operations - add new content
+@release_connections
 def create_page(
     ctx: RunContext[StoryAgentDeps],
     content: str | None = None,
@@ -111,7 +122,8 @@ def create_page(
             artist_request tool or external source. Optional.
 
     Returns:
-        dict: Confirmation object with 'action' key and created page details.
+        dict: Confirmation object with 'action' key and 'changes', the story changes since you last saw it,
+        including the new page and its number.
 
     Note:
         At least one of the optional parameters should typically be provided
@@ -121,23 +133,14 @@ def create_page(
     story_service = ctx.deps.story_service
     story_service.create_page(content=content, image_text=image_text, image_data=image_url)
 
-    # Get the updated story to find the new page number
-    story = story_service.get_story()
-    new_page_num = story.page_count
-
-    out = {"action": "created_page", "page_num": new_page_num}
-    if content:
-        out["content"] = content
-    if image_text:
-        out["image_text"] = image_text
-    if image_url:
-        out["image_url"] = image_url
-
-    logger.info(f"tool.create_page created page {new_page_num}: {out}")
+    # The changes include the new page, under its page number
+    out = {"action": "created_page", "changes": story_changes(ctx)}
+    logger.info(f"tool.create_page: {out}")
     return tool_return(out)
 
 
 # Tools that have side effects
+@release_connections
 def update_story(ctx: RunContext[StoryAgentDeps], title: str | None = None, description: str | None = None):
     """Update the story's title and/or description.
 
@@ -153,7 +156,7 @@ def update_story(ctx: RunContext[StoryAgentDeps], title: str | None = None, desc
         Must provide one or more of: title, description.
 
     Returns:
-        dict: Confirmation object with 'action' key and updated fields.
+        dict: Confirmation object with 'action' key and 'changes', the story changes since you last saw it.
 
     Raises:
         ValueError: If neither title nor description is provided.
@@ -165,16 +168,12 @@ def update_story(ctx: RunContext[StoryAgentDeps], title: str | None = None, desc
     story_service = ctx.deps.story_service
     story_service.update_story(title, description)
 
-    out = {}
-    if title:
-        out["title"] = title
-    if description:
-        out["description"] = description
-    out = {"action": "updated_story", **out}
+    out = {"action": "updated_story", "changes": story_changes(ctx)}
     logger.info(f"tool.update_story updated story: {out}")
     return tool_return(out)
 
 
+@release_connections
 def update_page(
     ctx: RunContext[StoryAgentDeps],
     page_num: int,
@@ -200,7 +199,8 @@ def update_page(
         Must provide one or more of: content, image_text, image_url.
 
     Returns:
-        dict: Confirmation object with 'action' key and updated fields.
+        dict: Confirmation object with 'action' key, the page number and 'changes', the story changes
+        since you last saw it.
 
     Raises:
         ValueError: If no parameters are provided for update.
@@ -212,19 +212,13 @@ def update_page(
     story_service = ctx.deps.story_service
     story_service.update_page(page_key=page_num, content=content, image_text=image_text, image_data=image_url)
 
-    out = {}
-    if content:
-        out["content"] = content
-    if image_text:
-        out["image_text"] = image_text
-    if image_url:
-        out["image_url"] = image_url
-    out = {"action": "updated_page", **out}
+    out = {"action": "updated_page", "page_num": page_num, "changes": story_changes(ctx)}
     logger.info(f"tool.update_page updated page {page_num}: {out}")
     return tool_return(out)
 
 
 # Reorganize operations - change structure
+@release_connections
 def move_page(ctx: RunContext[StoryAgentDeps], page_num: int, target: str | int):
     """Move a page to a new position within the story.
 
@@ -243,7 +237,8 @@ def move_page(ctx: RunContext[StoryAgentDeps], page_num: int, target: str | int)
             - int: Move to specific page number (1-indexed, not 0-indexed)
 
     Returns:
-        dict: Confirmation object with 'action' key, original and new positions.
+        dict: Confirmation object with 'action' key, original and new positions, and 'changes', the story
+        changes since you last saw it (including the new page order).
 
     Raises:
         ValueError: If page_num or target is out of range or invalid.
@@ -260,12 +255,18 @@ def move_page(ctx: RunContext[StoryAgentDeps], page_num: int, target: str | int)
 
     story_service.move_page(page_key=page_num, target=target)
 
-    out = {"action": "moved_page", "original_position": original_pos, "target": target}
+    out = {
+        "action": "moved_page",
+        "original_position": original_pos,
+        "target": target,
+        "changes": story_changes(ctx),
+    }
     logger.info(f"tool.move_page moved page from {original_pos} to {target}: {out}")
     return tool_return(out)
 
 
 # Destructive operations - remove content (use carefully)
+@release_connections
 def delete_page(ctx: RunContext[StoryAgentDeps], page_num: int):
     """Delete a specific page from the story.
 
@@ -278,7 +279,8 @@ def delete_page(ctx: RunContext[StoryAgentDeps], page_num: int):
         page_num: The page number to delete (1-indexed).
 
     Returns:
-        dict: Confirmation object with 'action' key and deleted page number.
+        dict: Confirmation object with 'action' key, deleted page number and 'changes', the story changes
+        since you last saw it.
 
     Raises:
         ValueError: If page_num is out of range or invalid.
@@ -291,6 +293,6 @@ def delete_page(ctx: RunContext[StoryAgentDeps], page_num: int):
     story_service = ctx.deps.story_service
     story_service.delete_page(page_key=page_num)
 
-    out = {"action": "deleted_page", "page_num": page_num}
+    out = {"action": "deleted_page", "page_num": page_num, "changes": story_changes(ctx)}
     logger.info(f"tool.delete_page deleted page {page_num}: {out}")
     return tool_return(out)
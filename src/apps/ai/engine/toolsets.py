@@ -1,9 +1,10 @@
 # Create toolsets
 import logging
 
+from pydantic_ai import Tool
 from pydantic_ai.toolsets import FunctionToolset
 
-from apps.ai.engine.base.toolsets import EnhancedToolset
+from apps.ai.engine.base.toolsets import READ_ONLY, EnhancedToolset
 from apps.ai.engine.tools.art import artist_request
 from apps.ai.engine.tools.story import (
     create_page,
@@ -20,10 +21,10 @@ logger = logging.getLogger(__name__)
 
 _book_function_toolset = FunctionToolset(
     [
-        # Read operations - inspect existing content
-        get_story,
-        get_page,
-        get_page_image,
+        # Read operations - inspect existing content (memoized within a run until the next write)
+        Tool(get_story, metadata=READ_ONLY),
+        Tool(get_page, metadata=READ_ONLY),
+        Tool(get_page_image, metadata=READ_ONLY),
         # Create operations - add new content
         create_page,
         # Update operations - modify existing content
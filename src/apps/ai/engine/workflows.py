@@ -0,0 +1,349 @@
+"""
+Workflows: DAGs of jobs.
+
+A workflow is a root ``Job`` (named ``wf.<name>``, with no Celery task of its own) whose steps are ``Job`` rows
+pointing at it through ``parent``, with ``depends_on`` naming the steps that must succeed first. Steps start
+PENDING. ``advance`` queues the ones whose dependencies have all succeeded, at most ``AI_WORKFLOW_MAX_PARALLEL`` at
+a time (or the workflow's own ``max_parallel``), and runs again whenever a step finishes (see ``JobTask``), so
+independent branches such as the pages of a story run side by side. A failed step fails the steps that depend on
+it (as does a revoked one), and the root finishes once every step has, summing the runtime and model usage of its
+steps. Steps whose task never reports back, because a worker died or a message was lost, are failed by
+``fail_stale_steps`` once they have been queued or running for ``AI_WORKFLOW_STEP_TIMEOUT`` seconds. Each advance sends
+the workflow's progress to the story's SSE channel as a ``workflow_progress`` event, and each finished step a
+``workflow_step#<step>`` event of its own.
+
+Steps can share data through the root: ``share_context`` stores a bundle, such as the story text prepared once for
+every page drawn by ``story_illustration``, and ``shared_context`` reads it back.
+
+All state lives in the ``Job`` rows; the root row is locked while advancing, so steps finishing at the same time
+don't dispatch the same dependent twice.
+"""
+
+import logging
+from collections import Counter
+from datetime import timedelta
+from typing import NamedTuple
+from uuid import UUID
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from apps.ai.engine.celery import (
+    IN_FLIGHT,
+    audit_payload,
+    dispatch_job,
+    ensure_task_exists,
+    idempotency_key,
+    revoke_queued,
+    stored_task_payload,
+)
+from apps.ai.models import Job
+from apps.ai.types import ChatRequest, PageJob, StoryJob, TaskPayload
+from apps.ai.types import Job as JobType
+from apps.ai.types import User as UserType
+from apps.common.outbox import queue_event
+from apps.stories.services import StorySchema
+
+logger = logging.getLogger(__name__)
+
+FINISHED = {Job.Status.SUCCESS, Job.Status.FAILED, Job.Status.REVOKED}
+UNSUCCESSFUL = {Job.Status.FAILED, Job.Status.REVOKED}
+
+
+class Step(NamedTuple):
+    key: str
+    workflow: str
+    job: JobType
+    after: tuple[str, ...] = ()
+
+
+def story_brainstorm(story_uuid: UUID) -> list[Step]:
+    """Brainstorm a story concept into the description, then title it."""
+    return [
+        Step("brainstorm", "ai.story_brainstorm", StoryJob(story_uuid=story_uuid)),
+        Step("title", "ai.story_title", StoryJob(story_uuid=story_uuid), after=("brainstorm",)),
+    ]
+
+
+def page_illustration(page_uuid: UUID) -> list[Step]:
+    """Describe a page's scene, then illustrate it."""
+    return [
+        Step("image_text", "ai.page_image_text", PageJob(page_uuid=page_uuid)),
+        Step("image", "ai.page_image", PageJob(page_uuid=page_uuid), after=("image_text",)),
+    ]
+
+
+def story_generation(story_uuid: UUID, page_uuids: list[UUID]) -> list[Step]:
+    """Brainstorm and title the story, then write, describe and illustrate each page, one branch per page."""
+    steps = story_brainstorm(story_uuid)
+    for page_uuid in page_uuids:
+        content, image_text = f"content:{page_uuid}", f"image_text:{page_uuid}"
+        steps += [
+            Step(content, "ai.page_content", PageJob(page_uuid=page_uuid), after=("title",)),
+            Step(image_text, "ai.page_image_text", PageJob(page_uuid=page_uuid), after=(content,)),
+            Step(f"image:{page_uuid}", "ai.page_image", PageJob(page_uuid=page_uuid), after=(image_text,)),
+        ]
+    return steps
+
+
+def story_illustration(story: StorySchema) -> list[Step]:
+    """Illustrate every page without an image, each page on its own branch.
+
+    A context step prepares the story text the drawings share, alongside the missing scene descriptions; each
+    drawing waits for the context and its own page's scene only, so one page failing doesn't cancel the others.
+    Scenes written during the run reach each drawing through its page's prompt rather than the shared text.
+    """
+    pages = [page for page in story.pages if not page.image]
+    if not pages:
+        return []
+    steps = [Step("context", "ai.story_illustration_context", StoryJob(story_uuid=story.uuid))]
+    images = []
+    for page in pages:
+        after = ("context",)
+        if not page.image_text:
+            steps.append(Step(f"image_text:{page.uuid}", "ai.page_image_text", PageJob(page_uuid=page.uuid)))
+            after += (f"image_text:{page.uuid}",)
+        images.append(Step(f"image:{page.uuid}", "ai.page_image", PageJob(page_uuid=page.uuid), after=after))
+    return [*steps, *images]
+
+
+def enqueue_workflow(
+    user_id: int,
+    name: str,
+    steps: list[Step],
+    channel: str,
+    max_parallel: int | None = None,
+    target: JobType | None = None,
+    supersede: bool = False,
+) -> Job:
+    """Create the root job and a PENDING job per step, and queue the steps that have no dependencies.
+
+    Steps may only depend on steps listed before them, which keeps the graph acyclic. Steps listed earlier are
+    also dispatched first when more are ready than the fan-out limit (max_parallel, by default
+    ``AI_WORKFLOW_MAX_PARALLEL``) allows.
+
+    As with ``enqueue_job``, a workflow for a target story or page gets the user's running workflow of the same
+    name and story version back instead of a second one. With supersede, a matching workflow none of whose steps
+    has started yet is revoked and replaced.
+    """
+    seen = set()
+    for step in steps:
+        ensure_task_exists(step.workflow)
+        if step.key in seen or not seen.issuperset(step.after):
+            raise ValueError(f"Step '{step.key}' is repeated or depends on a step not listed before it")
+        seen.add(step.key)
+
+    with transaction.atomic():
+        key = idempotency_key(name, target)
+        existing = (
+            Job.objects.filter(user_id=user_id, idempotency_key=key, status=Job.Status.RUNNING)
+            .order_by("-created_at")
+            .first()
+            if key
+            else None
+        )
+        if existing and not (supersede and revoke_workflow(existing)):
+            logger.info(f"enqueue_workflow({name}): reusing running workflow {existing.uuid} for {key}")
+            return existing
+
+        root = Job.objects.create(
+            user_id=user_id,
+            workflow=name,
+            status=Job.Status.RUNNING,
+            started_at=timezone.now(),
+            payload_json={"channel": channel, "steps": [step.key for step in steps], "max_parallel": max_parallel},
+            idempotency_key=key,
+        )
+        jobs: dict[str, Job] = {}
+        for step in steps:
+            task_payload = TaskPayload(user=UserType(user_id=user_id), chat_request=ChatRequest(), job=step.job)
+            jobs[step.key] = Job.objects.create(
+                user_id=user_id,
+                workflow=step.workflow,
+                parent=root,
+                step=step.key,
+                status=Job.Status.PENDING,
+                payload_json=audit_payload(task_payload),
+            )
+            if step.after:
+                jobs[step.key].depends_on.set([jobs[key] for key in step.after])
+        logger.info(f"enqueue_workflow({name}): {len(steps)} steps for {channel}")
+        advance(root.uuid)
+    return root
+
+
+def revoke_workflow(root: Job) -> bool:
+    """Revoke a workflow none of whose steps has started yet; False if one already has."""
+    root = Job.objects.select_for_update().get(pk=root.pk)
+    started = root.steps.exclude(status__in=(Job.Status.PENDING, Job.Status.QUEUED)).exists()
+    if root.status != Job.Status.RUNNING or started:
+        return False
+    for job in root.steps.filter(status=Job.Status.QUEUED):
+        revoke_queued(job)
+    now = timezone.now()
+    root.steps.filter(status=Job.Status.PENDING).update(
+        status=Job.Status.REVOKED, error_message="Superseded by a newer request", finished_at=now, updated_at=now
+    )
+    root.status, root.error_message, root.finished_at = Job.Status.REVOKED, "Superseded by a newer request", now
+    root.save(update_fields=["status", "error_message", "finished_at", "updated_at"])
+    return True
+
+
+def advance(root_uuid: UUID, finished: UUID | None = None) -> None:
+    """Fail steps whose dependencies failed, queue the ready ones within the fan-out limit and finish the root.
+
+    finished is the step whose completion triggered this advance, if any; its own event is sent along.
+    """
+    with transaction.atomic():
+        root = Job.objects.select_for_update().get(uuid=root_uuid)
+        if root.status != Job.Status.RUNNING:
+            return
+        order = {key: index for index, key in enumerate(root.payload_json["steps"])}
+        steps = sorted(root.steps.all(), key=lambda job: order[job.step])
+        by_uuid = {job.uuid: job for job in steps}
+        dependencies: dict[UUID, list[Job]] = {job.uuid: [] for job in steps}
+        for job_id, dependency_id in Job.depends_on.through.objects.filter(from_job__parent=root).values_list(
+            "from_job_id", "to_job_id"
+        ):
+            dependencies[job_id].append(by_uuid[dependency_id])
+
+        now = timezone.now()
+        # Steps are in dependency order, so one pass also fails the dependents of steps failed in it
+        for job in steps:
+            failed = next((dep for dep in dependencies[job.uuid] if dep.status in UNSUCCESSFUL), None)
+            if job.status == Job.Status.PENDING and failed:
+                job.status, job.error_message, job.finished_at = (
+                    Job.Status.FAILED,
+                    f"Skipped: {failed.step} {failed.status.lower()}",
+                    now,
+                )
+                job.save(update_fields=["status", "error_message", "finished_at", "updated_at"])
+
+        max_parallel = root.payload_json.get("max_parallel") or settings.AI_WORKFLOW_MAX_PARALLEL
+        slots = max_parallel - sum(job.status in IN_FLIGHT for job in steps)
+        for job in steps:
+            if slots <= 0:
+                break
+            if job.status == Job.Status.PENDING and all(
+                dep.status == Job.Status.SUCCESS for dep in dependencies[job.uuid]
+            ):
+                job.status = Job.Status.QUEUED
+                job.save(update_fields=["status", "updated_at"])
+                dispatch_job(job, stored_task_payload(job))
+                slots -= 1
+
+        if all(job.status in FINISHED for job in steps):
+            finish(root, steps, now)
+
+        if finished in by_uuid:
+            publish_step(root, by_uuid[finished])
+        publish_progress(root, steps)
+
+
+def finish(root: Job, steps: list[Job], now) -> None:
+    """Close the root: its status, wall-clock runtime, and the summed runtime and model usage of its steps."""
+    failed = sum(job.status in UNSUCCESSFUL for job in steps)
+    totals = root.steps.aggregate(
+        step_ms=Sum("runtime_ms"),
+        model_requests=Sum("model_requests"),
+        input_tokens=Sum("input_tokens"),
+        output_tokens=Sum("output_tokens"),
+    )
+    root.status = Job.Status.FAILED if failed else Job.Status.SUCCESS
+    root.error_message = f"{failed} of {len(steps)} steps failed" if failed else ""
+    root.finished_at = now
+    root.runtime_ms = int((now - root.started_at).total_seconds() * 1000)
+    root.model_requests = totals["model_requests"] or 0
+    root.input_tokens = totals["input_tokens"] or 0
+    root.output_tokens = totals["output_tokens"] or 0
+    root.output_text = (
+        f"{len(steps) - failed} of {len(steps)} steps succeeded in {root.runtime_ms}ms, "
+        f"{totals['step_ms'] or 0}ms of step time"
+    )
+    root.save(
+        update_fields=[
+            "status",
+            "error_message",
+            "finished_at",
+            "runtime_ms",
+            "model_requests",
+            "input_tokens",
+            "output_tokens",
+            "output_text",
+            "updated_at",
+        ]
+    )
+    logger.info(f"workflow {root.workflow} ({root.uuid}) finished: {root.status}, {root.output_text}")
+
+
+def fail_stale_steps() -> int:
+    """Fail workflow steps queued or running for longer than ``AI_WORKFLOW_STEP_TIMEOUT`` and advance their roots.
+
+    Roots of running workflows with a revoked step are advanced too, so the steps after it are skipped. Returns the
+    number of steps failed.
+    """
+    timeout = settings.AI_WORKFLOW_STEP_TIMEOUT
+    now = timezone.now()
+    deadline = now - timedelta(seconds=timeout)
+    stale = Job.objects.filter(parent__status=Job.Status.RUNNING).filter(
+        Q(status=Job.Status.QUEUED, updated_at__lt=deadline) | Q(status=Job.Status.RUNNING, started_at__lt=deadline)
+    )
+    roots = set(stale.values_list("parent_id", flat=True))
+    failed = stale.update(
+        status=Job.Status.FAILED, error_message=f"Timed out after {timeout}s", finished_at=now, updated_at=now
+    )
+    roots.update(
+        Job.objects.filter(status=Job.Status.RUNNING, steps__status=Job.Status.REVOKED).values_list("uuid", flat=True)
+    )
+    for root_uuid in roots:
+        advance(root_uuid)
+    if failed:
+        logger.warning(f"fail_stale_steps: failed {failed} steps stuck past {timeout}s")
+    return failed
+
+
+def in_workflow(task_id: str) -> bool:
+    """Whether the running job is a step of a workflow."""
+    return Job.objects.filter(celery_task_id=task_id, parent__isnull=False).exists()
+
+
+def share_context(task_id: str, context) -> None:
+    """Store data on the workflow of the running step, for the steps after it to read with shared_context."""
+    with transaction.atomic():
+        root = Job.objects.select_for_update().get(steps__celery_task_id=task_id)
+        root.payload_json["context"] = context
+        root.save(update_fields=["payload_json", "updated_at"])
+
+
+def shared_context(task_id: str):
+    """Return the data shared on the workflow of the running step, or None outside a workflow."""
+    payload = Job.objects.filter(steps__celery_task_id=task_id).values_list("payload_json", flat=True).first()
+    return payload.get("context") if payload else None
+
+
+def publish_step(root: Job, job: Job) -> None:
+    target = (job.payload_json.get("job") or {}).get("page_uuid")
+    queue_event(
+        root.payload_json["channel"],
+        f"workflow_step#{job.step}",
+        {"workflow": str(root.uuid), "step": job.step, "status": job.status, "page_uuid": target},
+    )
+
+
+def publish_progress(root: Job, steps: list[Job]) -> None:
+    counts = Counter(job.status for job in steps)
+    queue_event(
+        root.payload_json["channel"],
+        "workflow_progress",
+        {
+            "workflow": str(root.uuid),
+            "name": root.workflow,
+            "status": root.status,
+            "done": sum(counts[status] for status in FINISHED),
+            "failed": sum(counts[status] for status in UNSUCCESSFUL),
+            "total": len(steps),
+            "steps": {job.step: job.status for job in steps},
+        },
+    )
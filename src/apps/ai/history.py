@@ -0,0 +1,122 @@
+"""
+Process-level cache of validated conversation histories.
+
+Each entry holds a conversation's already-validated ``ModelMessage`` list together with the position and UUID
+of its last row. A read fetches only the rows from that position on: if the last cached row is still there, the
+new rows are validated and appended; if it is gone (history rewritten or truncated), the entry is rebuilt from
+scratch. Per-turn work therefore grows with the messages added since the last turn, not with the history length.
+
+Entries are evicted least-recently-used past ``AI_HISTORY_CACHE_SIZE`` conversations.
+"""
+
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple
+from uuid import UUID
+
+from django.conf import settings
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 64
+
+
+class CachedHistory(NamedTuple):
+    last_position: int
+    last_uuid: UUID
+    messages: tuple[ModelMessage, ...]
+
+
+class HistoryCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, CachedHistory] = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def max_size(self) -> int:
+        return getattr(settings, "AI_HISTORY_CACHE_SIZE", DEFAULT_CACHE_SIZE)
+
+    def get(self, conversation_id: int) -> list[ModelMessage]:
+        """Return the conversation's validated history, reading and validating only rows added since last time."""
+        from apps.ai.models import Message
+
+        with self._lock:
+            cached = self._entries.get(conversation_id)
+
+        rows = Message.objects.filter(conversation_id=conversation_id).order_by("position")
+        if cached is not None:
+            rows = rows.filter(position__gte=cached.last_position)
+        rows = list(rows.values_list("position", "uuid", "content"))
+
+        if cached is not None and rows and rows[0][1] == cached.last_uuid:
+            new_rows = rows[1:]
+            messages = cached.messages
+            hit = True
+        else:
+            # Nothing cached, or the last cached row is gone: rebuild from the full history
+            if cached is not None:
+                self.invalidate(conversation_id)
+                rows = list(
+                    Message.objects.filter(conversation_id=conversation_id)
+                    .order_by("position")
+                    .values_list("position", "uuid", "content")
+                )
+            new_rows = rows
+            messages = ()
+            hit = False
+
+        if new_rows:
+            messages += tuple(ModelMessagesTypeAdapter.validate_python([content for _p, _u, content in new_rows]))
+            last_position, last_uuid, _content = new_rows[-1]
+            self._store(conversation_id, CachedHistory(last_position, last_uuid, messages))
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        logger.debug(
+            f"HistoryCache.get({conversation_id}) {'hit' if hit else 'miss'}: "
+            f"{len(new_rows)} new of {len(messages)} messages"
+        )
+        return list(messages)
+
+    def _store(self, conversation_id: int, entry: CachedHistory) -> None:
+        with self._lock:
+            current = self._entries.get(conversation_id)
+            # A concurrent reader may already have stored a longer history; keep the newest
+            if current is None or current.last_position <= entry.last_position:
+                self._entries[conversation_id] = entry
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, conversation_id: int) -> None:
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "conversations": len(self._entries),
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,80 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from apps.ai.engine.runtime import AgentRuntime
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure agent runs per second in one process: run_sync one at a time (the solo pool) against the async "
+        "runtime at several concurrency levels, using a fake model with injected latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=64, help="Agent runs per scenario")
+        parser.add_argument("--latency-ms", type=float, default=200, help="Latency of each fake model call")
+        parser.add_argument("--tool-calls", type=int, default=1, help="Tool calls per run (each costs a model call)")
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Async concurrency levels")
+
+    def handle(self, *args, **options):
+        agent = self._agent(options["latency_ms"] / 1000, options["tool_calls"])
+        runs = options["runs"]
+        self.stdout.write(f"{'mode':>6} {'concurrency':>12} {'runs':>5} {'seconds':>8} {'runs/s':>7} {'p50 ms':>7}")
+
+        latencies, elapsed = self._measure(runs, 1, lambda: agent.run_sync("Go"))
+        self._report("sync", 1, latencies, elapsed)
+
+        for concurrency in options["concurrency"]:
+            with override_settings(AI_AGENT_CONCURRENCY=concurrency):
+                runtime = AgentRuntime()
+                try:
+                    latencies, elapsed = self._measure(runs, concurrency, lambda rt=runtime: rt.run(self._run(agent)))
+                finally:
+                    runtime.shutdown()
+            self._report("async", concurrency, latencies, elapsed)
+
+    def _agent(self, latency: float, tool_calls: int) -> Agent:
+        async def respond(messages, info: AgentInfo):
+            await asyncio.sleep(latency)
+            returns = sum(isinstance(part, ToolReturnPart) for message in messages for part in message.parts)
+            if returns < tool_calls:
+                return ModelResponse(parts=[ToolCallPart(tool_name="lookup", args={}, tool_call_id=f"call-{returns}")])
+            return ModelResponse(parts=[TextPart(content="Done.")])
+
+        agent = Agent(FunctionModel(respond))
+
+        @agent.tool_plain
+        def lookup() -> str:
+            return "ok"
+
+        return agent
+
+    @staticmethod
+    def _run(agent: Agent):
+        return lambda: agent.run("Go")
+
+    def _measure(self, runs: int, threads: int, run_one) -> tuple[list[float], float]:
+        # Submitting threads stand in for a threads-pool worker's task threads
+        def timed(_index):
+            t0 = time.perf_counter()
+            run_one()
+            return (time.perf_counter() - t0) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = list(executor.map(timed, range(runs)))
+        return latencies, time.perf_counter() - started
+
+    def _report(self, mode: str, concurrency: int, latencies: list[float], elapsed: float) -> None:
+        self.stdout.write(
+            f"{mode:>6} {concurrency:>12} {len(latencies):>5} {elapsed:>8.2f} {len(latencies) / elapsed:>7.1f} "
+            f"{statistics.median(latencies):>7.0f}"
+        )
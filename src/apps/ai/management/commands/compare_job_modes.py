@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from apps.ai.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare suggestion jobs run through the writer agent with direct runs (AI_DIRECT_JOBS): average runtime, "
+        "model requests and tokens (image generation included) of successful jobs, per workflow and mode"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7, help="Only count jobs created in the last N days")
+
+    def handle(self, *args, **options):
+        rows = (
+            Job.objects.filter(
+                status=Job.Status.SUCCESS,
+                created_at__gte=timezone.now() - timedelta(days=options["days"]),
+            )
+            .exclude(mode="")
+            .values("workflow", "mode")
+            .annotate(
+                jobs=Count("uuid"),
+                runtime_ms=Avg("runtime_ms"),
+                requests=Avg("model_requests"),
+                input_tokens=Avg("input_tokens"),
+                output_tokens=Avg("output_tokens"),
+            )
+            .order_by("workflow", "mode")
+        )
+        self.stdout.write(
+            f"{'workflow':<20} {'mode':>6} {'jobs':>5} {'avg ms':>8} {'requests':>8} {'in tok':>8} {'out tok':>8}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['workflow']:<20} {row['mode']:>6} {row['jobs']:>5} {row['runtime_ms'] or 0:>8.0f} "
+                f"{row['requests'] or 0:>8.1f} {row['input_tokens'] or 0:>8.0f} {row['output_tokens'] or 0:>8.0f}"
+            )
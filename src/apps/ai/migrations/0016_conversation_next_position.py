@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:12
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_next_position(apps, schema_editor):
+    """Start each conversation's counter after its highest existing message position."""
+    Conversation = apps.get_model("ai", "Conversation")
+    Message = apps.get_model("ai", "Message")
+    last_position = (
+        Message.objects.filter(conversation=OuterRef("pk"))
+        .values("conversation")
+        .annotate(last=Max("position"))
+        .values("last")
+    )
+    Conversation.objects.update(next_position=Coalesce(Subquery(last_position), 0) + 1)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai", "0015_message_position_autoincrement"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="next_position",
+            field=models.PositiveIntegerField(
+                default=1,
+                editable=False,
+                help_text="Next free message position; advanced atomically by allocate_positions",
+            ),
+        ),
+        migrations.RunPython(backfill_next_position, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai", "0016_conversation_next_position"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConversationCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "message_count",
+                    models.PositiveIntegerField(help_text="Number of leading messages this summary replaces"),
+                ),
+                ("summary", models.TextField()),
+                (
+                    "tokens_replaced",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Estimated tokens of the replaced messages, including earlier checkpoints"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "conversation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="checkpoints", to="ai.conversation"
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["conversation", "message_count"],
+                "unique_together": {("conversation", "message_count")},
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:17
+
+import base64
+import binascii
+import hashlib
+import mimetypes
+
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+
+# Frozen copies of the AI_MESSAGE_INLINE_MAX_BYTES default and of apps.ai.artifacts as they were when this migration
+# was written, so later changes to either can't change what it does
+INLINE_MAX_BYTES = 1024
+URL_KINDS = {"image/": "image-url", "audio/": "audio-url", "video/": "video-url"}
+
+
+def decode_data(data):
+    try:
+        return base64.urlsafe_b64decode(data.replace("+", "-").replace("/", "_"))
+    except (binascii.Error, ValueError):
+        return None
+
+
+def is_binary_part(value):
+    return (
+        isinstance(value, dict)
+        and value.get("kind") == "binary"
+        and isinstance(value.get("data"), str)
+        and isinstance(value.get("media_type"), str)
+    )
+
+
+def offload_binary_parts(content, store, min_bytes):
+    if is_binary_part(content):
+        data = decode_data(content["data"])
+        if data is None or len(data) < min_bytes:
+            return content
+        media_type = content["media_type"]
+        kind = next((k for prefix, k in URL_KINDS.items() if media_type.startswith(prefix)), "document-url")
+        return {
+            "url": f"artifact://{store(data, media_type)}",
+            "media_type": media_type,
+            "identifier": content.get("identifier"),
+            "force_download": False,
+            "vendor_metadata": content.get("vendor_metadata"),
+            "kind": kind,
+        }
+    if isinstance(content, dict):
+        return {key: offload_binary_parts(value, store, min_bytes) for key, value in content.items()}
+    if isinstance(content, list):
+        return [offload_binary_parts(value, store, min_bytes) for value in content]
+    return content
+
+
+def move_binary_parts(apps, schema_editor):
+    """Move base64-inlined binary parts of existing messages into artifacts, leaving artifact:// references."""
+    Artifacts = apps.get_model("ai", "Artifacts")
+    Message = apps.get_model("ai", "Message")
+
+    def store(data, media_type):
+        digest = hashlib.sha256(data).hexdigest()
+        existing = Artifacts.objects.filter(sha256=digest).values_list("uuid", flat=True).first()
+        if existing is not None:
+            return existing
+        artifact = Artifacts(sha256=digest, media_type=media_type)
+        extension = mimetypes.guess_extension(media_type) or ".bin"
+        artifact.file.save(f"message_{digest[:16]}{extension}", ContentFile(data), save=True)
+        return artifact.uuid
+
+    for message in Message.objects.filter(content__icontains='"binary"').only("content").iterator():
+        content = offload_binary_parts(message.content, store, min_bytes=INLINE_MAX_BYTES + 1)
+        if content != message.content:
+            message.content = content
+            message.save(update_fields=["content"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai", "0017_conversation_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="artifacts",
+            name="media_type",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="artifacts",
+            name="sha256",
+            field=models.CharField(
+                blank=True, db_index=True, help_text="SHA-256 of message parts stored here, for reuse", max_length=64
+            ),
+        ),
+        migrations.RunPython(move_binary_parts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai", "0018_artifacts_message_parts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="ttft_ms",
+            field=models.IntegerField(help_text="Time to the first streamed output of the reply", null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai", "0019_job_ttft_ms"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="input_tokens",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="mode",
+            field=models.CharField(
+                blank=True,
+                choices=[("agent", "Agent"), ("direct", "Direct")],
+                help_text="Whether the job ran the agent loop or a direct call",
+                max_length=16,
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="model_requests",
+            field=models.IntegerField(help_text="Text model requests made by the job", null=True),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="output_tokens",
+            field=models.IntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai", "0020_job_usage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="depends_on",
+            field=models.ManyToManyField(
+                blank=True, help_text="Steps that must succeed first", related_name="dependents", to="ai.job"
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Workflow this job is a step of",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="steps",
+                to="ai.job",
+            ),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="step",
+            field=models.CharField(blank=True, help_text="Key of this step within its workflow", max_length=64),
+        ),
+        migrations.AlterField(
+            model_name="job",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("QUEUED", "Queued"),
+                    ("RUNNING", "Running"),
+                    ("SUCCESS", "Success"),
+                    ("FAILED", "Failed"),
+                ],
+                default="QUEUED",
+                max_length=16,
+            ),
+        ),
+    ]
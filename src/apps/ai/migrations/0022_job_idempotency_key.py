@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ai", "0021_job_workflow_steps"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="idempotency_key",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="Workflow, target and story version; requests with the key of an in-flight job get that job",
+                max_length=160,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="job",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("QUEUED", "Queued"),
+                    ("RUNNING", "Running"),
+                    ("SUCCESS", "Success"),
+                    ("FAILED", "Failed"),
+                    ("REVOKED", "Revoked"),
+                ],
+                default="QUEUED",
+                max_length=16,
+            ),
+        ),
+    ]
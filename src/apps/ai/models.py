@@ -2,8 +2,7 @@ from collections import defaultdict
 from uuid import uuid4
 
 from django.contrib.auth import get_user_model
-from django.db import models, transaction
-from django.db.models import Max
+from django.db import connections, models, router, transaction
 from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
 from pydantic_core import to_jsonable_python
 
@@ -17,6 +16,9 @@ class Conversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=240, blank=True)
     meta = models.JSONField(default=dict, blank=True)
+    next_position = models.PositiveIntegerField(
+        default=1, editable=False, help_text="Next free message position; advanced atomically by allocate_positions"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -26,6 +28,26 @@ class Conversation(models.Model):
     def __str__(self):
         return self.title or f"Conversation: {str(self.uuid)}"
 
+    @classmethod
+    def allocate_positions(cls, conversation_id: int, count: int = 1, using: str | None = None) -> int:
+        """Reserve count consecutive message positions and return the first.
+
+        One UPDATE ... RETURNING bumps the counter, so concurrent writers queue on the conversation row for the
+        rest of their transaction and never scan or lock the message rows. It runs on using, or on the
+        conversation's write database, so it joins the caller's transaction there.
+        """
+        connection = connections[using or router.db_for_write(cls)]
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET next_position = next_position + %s WHERE id = %s RETURNING next_position",
+                [count, conversation_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise cls.DoesNotExist(f"Conversation {conversation_id} does not exist")
+        return row[0] - count
+
     def get_ordered_messages(self):
         """Return messages ordered by position."""
         return self.messages.all().order_by("position")
@@ -37,7 +59,10 @@ class Conversation(models.Model):
         return ModelMessagesTypeAdapter.validate_python(messages)
 
     def insert_model_messages(self, messages: list[ModelMessage]):
-        messages = to_jsonable_python(messages)
+        from apps.ai.artifacts import offload_messages
+
+        # Binary parts go to Artifacts; rows keep an artifact:// reference that is rehydrated for model calls
+        messages = offload_messages(to_jsonable_python(messages, bytes_mode="base64"))
         messages_to_create = [Message(conversation=self, content=msg_data) for msg_data in messages]
         Message.objects.bulk_create(messages_to_create)
 
@@ -56,7 +81,12 @@ class Conversation(models.Model):
         if response:
             for part in response.get("parts", []):
                 if part.get("tool_name") == "final_result":
-                    chat_response = chat_response_adapter.validate_python(part["args"])
+                    # Streamed tool calls keep their arguments as the JSON string they arrived as
+                    args = part["args"]
+                    if isinstance(args, str):
+                        chat_response = chat_response_adapter.validate_json(args)
+                    else:
+                        chat_response = chat_response_adapter.validate_python(args)
                     break
 
         if chat_response is None:
@@ -74,26 +104,18 @@ class Conversation(models.Model):
 
 class MessageManager(models.Manager):
     def bulk_create(self, objs, **kwargs):
+        objs = list(objs)
         messages_by_conv = defaultdict(list)
         for msg in objs:
-            # Ensure conversation is attached if only conversation_id is set
-            if msg.conversation_id and not hasattr(msg, '_conversation_cache'):
-                # This is a simplification; direct access like this is tricky.
-                # The logic in insert_model_messages already provides the conversation object.
-                pass
             messages_by_conv[msg.conversation_id].append(msg)
 
-        with transaction.atomic():
+        # Reserving and inserting in one transaction means a failed insert hands its positions back
+        with transaction.atomic(using=self.db):
             for conv_id, messages in messages_by_conv.items():
-                last_position = (
-                    self.get_queryset()
-                    .filter(conversation_id=conv_id)
-                    .aggregate(Max("position"))["position__max"]
-                    or 0
-                )
+                first_position = Conversation.allocate_positions(conv_id, len(messages), using=self.db)
                 for i, msg in enumerate(messages):
-                    msg.position = last_position + i + 1
-        return super().bulk_create(objs, **kwargs)
+                    msg.position = first_position + i
+            return super().bulk_create(objs, **kwargs)
 
 
 class Message(models.Model):
@@ -104,7 +126,8 @@ class Message(models.Model):
     - Single create: Message.objects.create(conversation=conv, content=data)
     - Bulk create: Message.objects.bulk_create([Message(conversation=conv, content=data), ...])
 
-    Both operations will automatically assign sequential positions within each conversation.
+    Both operations will automatically assign sequential positions within each conversation, taken from the
+    conversation's next_position counter in the same transaction as the insert.
     """
 
     uuid = models.UUIDField(default=uuid4, editable=False, unique=True)
@@ -126,16 +149,12 @@ class Message(models.Model):
         return f"{self.conversation} - Message {self.position}"
 
     def save(self, *args, **kwargs):
-        if self.position is None:
-            with transaction.atomic():
-                last_position = (
-                    Message.objects.filter(conversation=self.conversation)
-                    .select_for_update()
-                    .aggregate(Max("position"))["position__max"]
-                    or 0
-                )
-                self.position = last_position + 1
-        super().save(*args, **kwargs)
+        if self.position is not None:
+            return super().save(*args, **kwargs)
+        using = kwargs.get("using") or router.db_for_write(Message, instance=self)
+        with transaction.atomic(using=using):
+            self.position = Conversation.allocate_positions(self.conversation_id, using=using)
+            super().save(*args, **kwargs)
 
     @classmethod
     def from_pydantic_message(cls, conversation, message):
@@ -151,19 +170,79 @@ class Message(models.Model):
         return self.content
 
 
+class ConversationCheckpoint(models.Model):
+    """
+    Summary of a conversation's first message_count messages.
+
+    Once a history outgrows its token budget the agent is sent the latest checkpoint in place of the messages it
+    covers. Each checkpoint is generated once and builds on the previous one, so older turns are never summarized
+    twice.
+    """
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="checkpoints")
+    message_count = models.PositiveIntegerField(help_text="Number of leading messages this summary replaces")
+    summary = models.TextField()
+    tokens_replaced = models.PositiveIntegerField(
+        default=0, help_text="Estimated tokens of the replaced messages, including earlier checkpoints"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["conversation", "message_count"]
+        unique_together = [["conversation", "message_count"]]
+
+    def __str__(self):
+        return f"{self.conversation} - Checkpoint through message {self.message_count}"
+
+    @classmethod
+    def latest_for(cls, conversation_uuid, message_count: int) -> "ConversationCheckpoint | None":
+        """Return the newest checkpoint that leaves at least one of message_count messages uncovered."""
+        return (
+            cls.objects.filter(conversation__uuid=conversation_uuid, message_count__lt=message_count)
+            .order_by("-message_count")
+            .first()
+        )
+
+    @classmethod
+    def store(cls, conversation_uuid, message_count: int, summary: str, tokens_replaced: int) -> None:
+        """Save a checkpoint; if a concurrent turn already stored one for the same messages, keep that one."""
+        conversation_id = Conversation.objects.filter(uuid=conversation_uuid).values_list("pk", flat=True).get()
+        cls.objects.bulk_create(
+            [
+                cls(
+                    conversation_id=conversation_id,
+                    message_count=message_count,
+                    summary=summary,
+                    tokens_replaced=tokens_replaced,
+                )
+            ],
+            ignore_conflicts=True,
+        )
+
+
 class Artifacts(models.Model):
     uuid = models.UUIDField(default=uuid4, editable=False, unique=True)
     file = models.FileField(upload_to="artifacts")
+    media_type = models.CharField(max_length=100, blank=True)
+    sha256 = models.CharField(
+        max_length=64, blank=True, db_index=True, help_text="SHA-256 of message parts stored here, for reuse"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
 
 class Job(models.Model):
     class Status(models.TextChoices):
+        PENDING = "PENDING"  # A workflow step waiting for its dependencies
         QUEUED = "QUEUED"
         RUNNING = "RUNNING"
         SUCCESS = "SUCCESS"
         FAILED = "FAILED"
+        REVOKED = "REVOKED"  # Superseded by a newer request before it started
+
+    class Mode(models.TextChoices):
+        AGENT = "agent"
+        DIRECT = "direct"
 
     uuid = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -174,6 +253,34 @@ class Job(models.Model):
     output_text = models.TextField(blank=True)
     error_message = models.TextField(blank=True)
     runtime_ms = models.IntegerField(null=True)
+    ttft_ms = models.IntegerField(null=True, help_text="Time to the first streamed output of the reply")
+    mode = models.CharField(
+        max_length=16,
+        choices=Mode.choices,
+        blank=True,
+        help_text="Whether the job ran the agent loop or a direct call",
+    )
+    model_requests = models.IntegerField(null=True, help_text="Text model requests made by the job")
+    input_tokens = models.IntegerField(null=True)
+    output_tokens = models.IntegerField(null=True)
+    parent = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="steps",
+        help_text="Workflow this job is a step of",
+    )
+    step = models.CharField(max_length=64, blank=True, help_text="Key of this step within its workflow")
+    idempotency_key = models.CharField(
+        max_length=160,
+        blank=True,
+        db_index=True,
+        help_text="Workflow, target and story version; requests with the key of an in-flight job get that job",
+    )
+    depends_on = models.ManyToManyField(
+        "self", symmetrical=False, blank=True, related_name="dependents", help_text="Steps that must succeed first"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     started_at = models.DateTimeField(null=True)
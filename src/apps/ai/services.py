@@ -6,16 +6,20 @@ import logging
 import mimetypes
 import uuid
 from datetime import datetime
+from functools import cached_property
 from typing import Annotated
 from uuid import UUID
 
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django.db import connection
+from django.db import connection, transaction
 from django.db.models import Q
+from django.utils import timezone
 from pydantic import BaseModel, BeforeValidator, TypeAdapter
-from pydantic_ai.messages import BinaryContent, ImageUrl, ModelMessagesTypeAdapter
+from pydantic_ai.messages import BinaryContent, ImageUrl, ModelMessage, ModelMessagesTypeAdapter
 
+from apps.ai.engine.context import StoryContext
+from apps.ai.history import history_cache
 from apps.ai.models import Artifacts, Conversation
 from apps.ai.types import ChatResponse
 from apps.common.sse import send_template
@@ -87,15 +91,31 @@ class ConversationService:
         conversation = Conversation.objects.get(uuid=self.uuid)
         return ConversationDetailSchema.model_validate(conversation, from_attributes=True)
 
-    def get_model_messages(self):
-        """Get model messages for this conversation."""
-        conversation = Conversation.objects.get(uuid=self.uuid)
-        return conversation.model_messages
+    @cached_property
+    def conversation(self) -> Conversation:
+        """The conversation row, looked up once per service instance (one chat turn)."""
+        return Conversation.objects.get(uuid=self.uuid)
+
+    def get_model_messages(self) -> list[ModelMessage]:
+        """Get model messages for this conversation, validating only rows added since the last turn."""
+        return history_cache.get(self.conversation.pk)
 
     def add_model_messages(self, messages):
         """Add model messages to this conversation."""
-        conversation = Conversation.objects.get(uuid=self.uuid)
-        conversation.insert_model_messages(messages)
+        self.conversation.insert_model_messages(messages)
+
+    def story_context(self) -> StoryContext:
+        """What the model has been shown of the conversation's story in earlier turns."""
+        return StoryContext.from_json(self.conversation.meta.get("story_context"), in_history=True)
+
+    def save_story_context(self, story_context: StoryContext) -> None:
+        """Store what the model was shown, merged into the current meta rather than the copy read at turn start."""
+        with transaction.atomic():
+            conversations = Conversation.objects.select_for_update().filter(pk=self.conversation.pk)
+            meta = conversations.values_list("meta", flat=True).get()
+            meta["story_context"] = story_context.to_json()
+            conversations.update(meta=meta, updated_at=timezone.now())
+        self.conversation.meta = meta
 
     def send_chat_response(self, chat_response: ChatResponse) -> None:
         """
@@ -119,6 +139,10 @@ class ConversationService:
         # Send chips update event
         self._send_chips_event(chat_response.chips)
 
+    def stream_message(self, message: str) -> None:
+        """Send the partial text of a reply that is still being generated to the prompt row."""
+        self._send_message_event(message)
+
     def sync_chat_display(self) -> None:
         """
         Sync the AI panel with the current conversation's chat display.
@@ -126,8 +150,7 @@ class ConversationService:
         This fetches the conversation's current chat_display and sends it via SSE
         to update the AI panel with the latest message and chips.
         """
-        conversation = Conversation.objects.get(uuid=self.uuid)
-        chat_display = conversation.chat_display
+        chat_display = self.conversation.chat_display
 
         logger.info(f"Syncing chat display for conversation {self.uuid}")
         self.send_chat_response(chat_display)
@@ -135,7 +158,14 @@ class ConversationService:
     def _send_message_event(self, message: str) -> None:
         """Send SSE event to update the prompt row with new message."""
         channel_name = f"conversation-{self.uuid}"
-        send_template(channel_name, "prompt_row", "cotton/ai/panel/content/prompt_row.html", {"slot": message})
+        # Streamed replies are throttled to AI_STREAM_INTERVAL already; the default coalescing window would slow them
+        send_template(
+            channel_name,
+            "prompt_row",
+            "cotton/ai/panel/content/prompt_row.html",
+            {"slot": message},
+            window=settings.AI_STREAM_INTERVAL,
+        )
         logger.debug(f"Sent prompt_row event to {channel_name}")
 
     def _send_chips_event(self, chips: list) -> None:
@@ -7,20 +7,91 @@ import logging
 from textwrap import dedent
 
 from celery import shared_task
-from pydantic_ai.usage import UsageLimits
+from django.conf import settings
+from pydantic_ai.agent import AgentRunResult
+from pydantic_ai.usage import RunUsage, UsageLimits
 
+from apps.ai.engine.agents.suggester import suggester_agent
 from apps.ai.engine.agents.writer import writer_agent
 from apps.ai.engine.celery import JobTask
+from apps.ai.engine.context import render_story_context
 from apps.ai.engine.dependencies import StoryAgentDeps
+from apps.ai.engine.messages import CHARS_PER_TOKEN
+from apps.ai.engine.runtime import database_sync_to_async, run_agent, run_coroutine, stream_agent
+from apps.ai.engine.tools.art import draw
+from apps.ai.engine.workflows import (
+    enqueue_workflow,
+    fail_stale_steps,
+    in_workflow,
+    page_illustration,
+    share_context,
+    shared_context,
+)
+from apps.ai.models import Job
 from apps.ai.services import ConversationService
-from apps.ai.types import PageJob, StoryJob, TaskPayload
+from apps.ai.types import (
+    ChatResponse,
+    PageContent,
+    PageJob,
+    SceneDescription,
+    StoryJob,
+    StoryTitle,
+    TaskPayload,
+)
 from apps.stories.services import StoryService
 
 logger = logging.getLogger(__name__)
 
+# Guidance for the direct suggestion prompts, taken from the agent prompts of the same jobs below
+PAGE_ROLES = dedent("""\
+    - Beginning (first 25% of pages): Introduce characters, setting, and main problem
+    - Middle (middle 50% of pages): Develop adventure and build toward turning point
+    - End (last 25% of pages): Resolve problem and provide happy conclusion""")
+
+SCENE_GUIDELINES = dedent("""\
+    Focus on these scene elements:
+     - Characters: Who is in the scene? What are they doing? What expressions?
+     - Setting/Environment: Where does this take place? Physical environment?
+     - Actions: What specific actions or movements are happening?
+     - Objects/Props: What important objects or items are visible?
+     - Composition: How are elements arranged? Foreground/background?
+    Guidelines:
+     - Be purely descriptive and objective
+     - Do NOT include artistic style, mood, lighting, or color descriptions
+     - Focus on WHAT is happening and WHERE, not HOW it should look
+     - Keep it concise but detailed for accurate visual representation""")
+
+
+def suggest[T](story_service: StoryService, task: str, output_type: type[T]) -> AgentRunResult[T]:
+    """Ask the suggester for output_type in a single model request, with the whole story ahead of the task."""
+    prompt = [render_story_context(story_service.get_story()), task]
+    return run_agent(suggester_agent, prompt, output_type=output_type)
+
+
+def suggest_scene(story_service: StoryService, page_num: int) -> AgentRunResult[SceneDescription]:
+    task = (
+        dedent(f"""\
+        Create a descriptive scene description for page {page_num} of this children's picture book,
+        capturing what should be visually depicted.
+    """)
+        + SCENE_GUIDELINES
+    )
+    return suggest(story_service, task, SceneDescription)
+
+
+def illustration_prompt(page_num: int, image_text: str, content: str) -> str:
+    return dedent(f"""\
+        Create a watercolor style illustration for page {page_num}.
+        Scene description: {image_text}
+        Include this text at the bottom of the image: '{content}'
+        Review all previous pages to maintain consistent character designs, art style, colors,
+        font style, and visual elements throughout the story.
+        Style: watercolor painting with soft, flowing colors, child-friendly and whimsical,
+        suitable for ages 2-3, with readable text at the bottom that matches previous pages.""")
+
 
-@shared_task(name="ai.agent_task")
-def agent_task(payload: dict) -> str:
+@shared_task(name="ai.agent_task", bind=True)
+def agent_task(self, payload: dict) -> str:
     """Orchestrate pydantic-ai agent conversation."""
     # Deserialize payload with proper type discrimination
     task_payload = TaskPayload.model_validate(payload)
@@ -32,27 +103,53 @@ def agent_task(payload: dict) -> str:
 
     # Get conversation using service
     conversation_service = ConversationService(uuid=conversation_uuid)
-    conversation_data = conversation_service.get_conversation()
-
-    # Run agent with message (sync version)
-    deps = StoryAgentDeps(user_id=task_payload.user.user_id, story_uuid=conversation_data.meta["story_uuid"])
+    conversation = conversation_service.conversation
 
-    result = agent.run_sync(
-        message,
-        deps=deps,
-        message_history=conversation_service.get_model_messages(),
+    deps = StoryAgentDeps(
+        user_id=task_payload.user.user_id,
+        conversation_uuid=conversation_uuid,
+        story_uuid=conversation.meta["story_uuid"],
     )
-    logger.info(f"agent_orchestration result: {result}")
+    message_history = conversation_service.get_model_messages()
+
+    # Send the story along with the message: in full on the first turn, then only what changed since the last one
+    deps.story_context = conversation_service.story_context()
+    story_update = deps.story_context.changes(deps.story_service.get_story())
+    logger.info(f"agent_orchestration story context: ~{len(story_update) // CHARS_PER_TOKEN} tokens")
+    prompt = [story_update, message] if story_update else message
+
+    if settings.AI_STREAM_REPLIES:
+        # Stream the reply text into the panel as it is generated; chips follow with the final response
+        async def send_partial(output: ChatResponse) -> None:
+            if output.message:
+                await database_sync_to_async(conversation_service.stream_message)(output.message)
+
+        streamed = run_coroutine(
+            lambda: stream_agent(
+                agent,
+                prompt,
+                send_partial,
+                settings.AI_STREAM_INTERVAL,
+                deps=deps,
+                message_history=message_history,
+            )
+        )
+        output, new_messages_json = streamed.output, streamed.new_messages_json
+        logger.info(f"agent_orchestration first token after {streamed.ttft_ms}ms")
+        Job.objects.filter(celery_task_id=self.request.id).update(ttft_ms=streamed.ttft_ms)
+    else:
+        result = run_agent(agent, prompt, deps=deps, message_history=message_history)
+        output, new_messages_json = result.output, result.new_messages_json()
 
     # Add new messages using service
-    new_messages_json = result.new_messages_json()
     if new_messages_json:
         # Decode JSON bytes to Python objects for storage
         messages_data = json.loads(new_messages_json.decode("utf-8"))
         logger.info(f"agent_orchestration creating {len(messages_data)} messages")
         conversation_service.add_model_messages(messages_data)
+    conversation_service.save_story_context(deps.story_context)
 
-    logger.info(f"agent_orchestration completed with {repr(result.output)}")
+    logger.info(f"agent_orchestration completed with {repr(output)}")
 
     # Sync the chat display via SSE when task completes
     conversation_service.sync_chat_display()
@@ -60,8 +157,8 @@ def agent_task(payload: dict) -> str:
     return f"Conversation {conversation_uuid} updated"
 
 
-@shared_task(name="ai.story_title", base=JobTask)
-def ai_story_title_job(payload: dict) -> str:
+@shared_task(name="ai.story_title", base=JobTask, bind=True)
+def ai_story_title_job(self, payload: dict) -> str:
     # Deserialize payload with proper type discrimination
     task_payload = TaskPayload.model_validate(payload)
     if not isinstance(task_payload.job, StoryJob):
@@ -73,7 +170,13 @@ def ai_story_title_job(payload: dict) -> str:
     deps = StoryAgentDeps(
         user_id=task_payload.user.user_id, conversation_uuid=None, story_uuid=task_payload.job.story_uuid
     )
-    result = agent.run_sync(prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+    if settings.AI_DIRECT_JOBS:
+        result = suggest(deps.story_service, prompt, StoryTitle)
+        deps.story_service.update_story(title=result.output.title)
+        self.record_usage(Job.Mode.DIRECT, result.usage())
+    else:
+        result = run_agent(agent, prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+        self.record_usage(Job.Mode.AGENT, result.usage())
     logger.info(f"story_title result: {result}")
     return f"task:ai_story_title_job:{task_payload.job.story_uuid}"
 
@@ -116,7 +219,7 @@ def ai_story_description_job(payload: dict) -> str:
     """)
     agent = writer_agent
     deps = StoryAgentDeps(user_id=task_payload.user.user_id, story_uuid=task_payload.job.story_uuid)
-    result = agent.run_sync(prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+    result = run_agent(agent, prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
     logger.info(f"story_description result: {result}")
     return f"task:ai_story_description_job:{task_payload.job.story_uuid}"
 
@@ -164,16 +267,13 @@ def ai_story_brainstorm_job(payload: dict) -> str:
     deps = StoryAgentDeps(
         user_id=task_payload.user.user_id, conversation_uuid=None, story_uuid=task_payload.job.story_uuid
     )
-    result = agent.run_sync(prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+    result = run_agent(agent, prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
     logger.info(f"story_brainstorm result: {result}")
-
-    # Let's update the title to reflect the new description!
-    ai_story_title_job.apply_async(kwargs={"payload": payload})
     return f"task:ai_story_brainstorm_job:{task_payload.job.story_uuid}"
 
 
-@shared_task(name="ai.page_content", base=JobTask)
-def ai_page_content_job(payload: dict) -> str:
+@shared_task(name="ai.page_content", base=JobTask, bind=True)
+def ai_page_content_job(self, payload: dict) -> str:
     # Deserialize payload with proper type discrimination
     task_payload = TaskPayload.model_validate(payload)
     if not isinstance(task_payload.job, PageJob):
@@ -184,6 +284,29 @@ def ai_page_content_job(payload: dict) -> str:
     # Get page context first to determine page number and story
     story_service = StoryService.load_from_page_uuid(task_payload.job.page_uuid)
     page_obj = story_service.get_page_obj(task_payload.job.page_uuid)
+    deps = StoryAgentDeps(
+        user_id=task_payload.user.user_id, conversation_uuid=None, page_uuid=task_payload.job.page_uuid
+    )
+
+    if settings.AI_DIRECT_JOBS:
+        task = (
+            dedent(f"""\
+            Write the content for page {page_obj.page_number} of this children's picture book.
+            Consider the page's role in the story:
+        """)
+            + PAGE_ROLES
+            + dedent("""
+            The content should directly advance the story arc from the previous page, keep the narrative flowing,
+            use simple, engaging language for 2-3 year olds (1-3 short sentences) and avoid repeating the previous
+            page's structure.
+        """)
+        )
+        result = suggest(deps.story_service, task, PageContent)
+        deps.story_service.set_page_content(page_obj.uuid, result.output.content)
+        self.record_usage(Job.Mode.DIRECT, result.usage())
+        logger.info(f"page_content result: {result}")
+        return f"task:ai_page_content_job:{task_payload.job.page_uuid}"
+
     prompt = dedent(f"""\
         Write and save content for page {page_obj.page_number} of this children's picture book.
 
@@ -212,16 +335,14 @@ def ai_page_content_job(payload: dict) -> str:
     """)
 
     agent = writer_agent
-    deps = StoryAgentDeps(
-        user_id=task_payload.user.user_id, conversation_uuid=None, page_uuid=task_payload.job.page_uuid
-    )
-    result = agent.run_sync(prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+    result = run_agent(agent, prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+    self.record_usage(Job.Mode.AGENT, result.usage())
     logger.info(f"page_content result: {result}")
     return f"task:ai_page_content_job:{task_payload.job.page_uuid}"
 
 
-@shared_task(name="ai.page_image_text", base=JobTask)
-def ai_page_image_text_job(payload: dict) -> str:
+@shared_task(name="ai.page_image_text", base=JobTask, bind=True)
+def ai_page_image_text_job(self, payload: dict) -> str:
     # Deserialize payload with proper type discrimination
     task_payload = TaskPayload.model_validate(payload)
     if not isinstance(task_payload.job, PageJob):
@@ -232,6 +353,17 @@ def ai_page_image_text_job(payload: dict) -> str:
     # Get page context first to determine page number and story
     story_service = StoryService.load_from_page_uuid(task_payload.job.page_uuid)
     page_obj = story_service.get_page_obj(task_payload.job.page_uuid)
+    deps = StoryAgentDeps(
+        user_id=task_payload.user.user_id, conversation_uuid=None, page_uuid=task_payload.job.page_uuid
+    )
+
+    if settings.AI_DIRECT_JOBS:
+        result = suggest_scene(deps.story_service, page_obj.page_number)
+        deps.story_service.set_page_image_text(page_obj.uuid, result.output.image_text)
+        self.record_usage(Job.Mode.DIRECT, result.usage())
+        logger.info(f"page_image_text result: {result}")
+        return f"task:ai_page_image_text_job:{task_payload.job.page_uuid}"
+
     prompt = dedent(f"""\
         Create and save a descriptive scene description for page {page_obj.page_number}
         of this children's picture book.
@@ -265,16 +397,34 @@ def ai_page_image_text_job(payload: dict) -> str:
     """)
 
     agent = writer_agent
-    deps = StoryAgentDeps(
-        user_id=task_payload.user.user_id, conversation_uuid=None, page_uuid=task_payload.job.page_uuid
-    )
-    result = agent.run_sync(prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+    result = run_agent(agent, prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=3))
+    self.record_usage(Job.Mode.AGENT, result.usage())
     logger.info(f"page_image_text result: {result}")
     return f"task:ai_page_image_text_job:{task_payload.job.page_uuid}"
 
 
-@shared_task(name="ai.page_image", base=JobTask)
-def ai_page_image_job(payload: dict) -> str:
+@shared_task(name="ai.story_illustration_context", base=JobTask, bind=True)
+def ai_story_illustration_context_job(self, payload: dict) -> str:
+    """Prepare the story text once for all the pages a workflow illustrates (see ``story_illustration``)."""
+    task_payload = TaskPayload.model_validate(payload)
+    if not isinstance(task_payload.job, StoryJob):
+        raise ValueError("ai_story_illustration_context_job requires StoryJob")
+
+    deps = StoryAgentDeps(user_id=task_payload.user.user_id, story_uuid=task_payload.job.story_uuid)
+    parts = deps.story_service.text_parts()
+    share_context(self.request.id, parts)
+    logger.info(f"story_illustration_context prepared {sum(len(part) for part in parts)} chars of story text")
+    return f"task:ai_story_illustration_context_job:{task_payload.job.story_uuid}"
+
+
+@shared_task(name="ai.fail_stale_steps")
+def fail_stale_steps_job() -> int:
+    """Fail workflow steps that never reported back (see ``fail_stale_steps``); scheduled by Celery beat."""
+    return fail_stale_steps()
+
+
+@shared_task(name="ai.page_image", base=JobTask, bind=True)
+def ai_page_image_job(self, payload: dict) -> str:
     # Deserialize payload with proper type discrimination
     task_payload = TaskPayload.model_validate(payload)
     if not isinstance(task_payload.job, PageJob):
@@ -285,40 +435,61 @@ def ai_page_image_job(payload: dict) -> str:
     page_obj = story_service.get_page_obj(task_payload.job.page_uuid)
     page_num = page_obj.page_number
 
-    # If no image_text, generate it first and return early
+    deps = StoryAgentDeps(user_id=task_payload.user.user_id, page_uuid=task_payload.job.page_uuid)
+    deps.illustration_context = shared_context(self.request.id)
+
+    if settings.AI_DIRECT_JOBS:
+        # Write the missing scene description in the same job, then draw straight from it
+        usage = RunUsage()
+        if not page_obj.image_text:
+            scene = suggest_scene(deps.story_service, page_num)
+            deps.story_service.set_page_image_text(page_obj.uuid, scene.output.image_text)
+            page_obj.image_text, usage = scene.output.image_text, scene.usage()
+        drawing = draw(deps, illustration_prompt(page_num, page_obj.image_text, page_obj.content or ""), page_obj.uuid)
+        self.record_usage(Job.Mode.DIRECT, usage + drawing.usage)
+        if not drawing.images:
+            raise RuntimeError(f"No illustration was generated for page {page_num}")
+        deps.story_service.set_page_image(page_obj.uuid, drawing.images[0])
+        logger.info(f"page_image drew page {page_num} with references {[r.page_number for r in drawing.references]}")
+        return f"job:{page_obj.story.channel}:ai_page_image_job"
+
+    # If no image_text, hand over to a workflow that writes it and then runs this job again. A workflow step can't
+    # hand over: its workflow would count the page as drawn, so it fails and lets the workflow skip what follows
     if not page_obj.image_text:
+        if in_workflow(self.request.id):
+            raise RuntimeError(f"Page {page_num} has no scene description to illustrate")
         logger.info(f"No image_text for page {page_obj.uuid}, generating image text first")
-        ai_page_image_text_job.apply_async(kwargs={"payload": payload})
-        # Return early - the image generation will be triggered again after image_text is ready
+        enqueue_workflow(
+            task_payload.user.user_id, "wf.page_image", page_illustration(page_obj.uuid), story_service.channel
+        )
+        self.record_usage(Job.Mode.AGENT)
         return f"task:ai_page_image_job:generating_image_text:{task_payload.job.page_uuid}"
 
     # Build focused prompt for image generation only
     content = page_obj.content or ""
     image_text = page_obj.image_text or ""
 
-    enhanced_prompt = dedent(f"""\
-        Generate an illustration for page {page_num} using the artist_request tool,
-        then update the page image using update_page tool.
+    enhanced_prompt = (
+        dedent(f"""\
+            Generate an illustration for page {page_num} using the artist_request tool with page_num={page_num},
+            then update the page image using update_page tool.
 
-        Use this prompt for artist_request:
-        Create a watercolor style illustration for page {page_num}.
-        Scene description: {image_text}
-        Include this text at the bottom of the image: '{content}'
-        Review all previous pages to maintain consistent character designs, art style, colors,
-        font style, and visual elements throughout the story.
-        Style: watercolor painting with soft, flowing colors, child-friendly and whimsical,
-        suitable for ages 2-3, with readable text at the bottom that matches previous pages.
+            Use this prompt for artist_request:
+        """)
+        + illustration_prompt(page_num, image_text, content)
+        + dedent(f"""
 
-        After generating the image, use update_page tool with page_num={page_num} and
-        the image_url from artist_request. Do NOT modify the image_text field - only update the image.
+            After generating the image, use update_page tool with page_num={page_num} and
+            the image_url from artist_request. Do NOT modify the image_text field - only update the image.
 
-        Once you've successfully generated the image and updated the page, respond with a simple
-        confirmation that the task is complete. Keep your response brief.
-    """)
+            Once you've successfully generated the image and updated the page, respond with a simple
+            confirmation that the task is complete. Keep your response brief.
+        """)
+    )
 
     # Use the writer agent with generate_image tool
-    deps = StoryAgentDeps(user_id=task_payload.user.user_id, page_uuid=task_payload.job.page_uuid)
-    result = writer_agent.run_sync(enhanced_prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=6))
+    result = run_agent(writer_agent, enhanced_prompt, deps=deps, usage_limits=UsageLimits(tool_calls_limit=6))
+    self.record_usage(Job.Mode.AGENT, result.usage() + deps.image_usage)
     logger.info(f"page_image result: {result}")
 
     # The image generation and page update will be handled by the writer agent using tools
@@ -0,0 +1,128 @@
+"""
+Tests for running agents on the worker's shared event loop.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from pydantic_ai import Agent, RunContext
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, ToolCallPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from apps.ai.engine.agents.summarizer import summarizer_agent
+from apps.ai.engine.messages import compact_history
+from apps.ai.engine.runtime import AgentRuntime, agent_runtime, run_agent
+from apps.ai.models import Conversation, ConversationCheckpoint
+from apps.common.db import release_connections
+from apps.stories.models import Story
+
+User = get_user_model()
+
+
+@override_settings(AI_AGENT_CONCURRENCY=2)
+class AgentRuntimeTest(SimpleTestCase):
+    """Test that runs submitted from many threads share one loop with bounded concurrency."""
+
+    def setUp(self):
+        """Start a fresh runtime and count the model calls in flight."""
+        self.runtime = AgentRuntime()
+        self.addCleanup(self.runtime.shutdown)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loops = set()
+
+        async def respond(messages, info: AgentInfo):
+            self.loops.add(id(asyncio.get_running_loop()))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+            return ModelResponse(parts=[TextPart(content=messages[-1].parts[-1].content.upper())])
+
+        self.agent = Agent(FunctionModel(respond))
+
+    def test_runs_share_one_loop_with_bounded_concurrency(self):
+        """Test that six runs from six threads all finish, at most two at a time, on a single loop."""
+        prompts = [f"run {n}" for n in range(6)]
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            outputs = list(executor.map(lambda p: self.runtime.run(lambda: self.agent.run(p)).output, prompts))
+
+        self.assertEqual(outputs, [p.upper() for p in prompts])
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertEqual(len(self.loops), 1)
+
+    def test_errors_propagate_to_the_caller(self):
+        """Test that an exception raised inside a run is re-raised in the submitting thread."""
+
+        async def fail():
+            raise ValueError("boom")
+
+        with self.assertRaisesMessage(ValueError, "boom"):
+            self.runtime.run(fail)
+
+    @override_settings(AI_AGENT_ASYNC=False)
+    def test_sync_mode_runs_on_the_calling_thread(self):
+        """Test that with async mode off, run_agent falls back to run_sync."""
+        threads = set()
+
+        def respond(messages, info: AgentInfo):
+            threads.add(threading.current_thread())
+            return ModelResponse(parts=[TextPart(content="ok")])
+
+        result = run_agent(Agent(FunctionModel(respond)), "Hi")
+        self.assertEqual(result.output, "ok")
+        self.assertNotIn("agent-runtime", {thread.name for thread in threads})
+
+
+@override_settings(AI_AGENT_ASYNC=True, AI_HISTORY_TOKEN_BUDGET=300, AI_HISTORY_KEEP_TOKENS=100)
+class AsyncAgentDatabaseTest(TransactionTestCase):
+    """Test that agent runs on the shared loop reach the database from tools and history processors."""
+
+    def setUp(self):
+        """Set up a story and a conversation whose history is over the token budget."""
+        self.addCleanup(agent_runtime.shutdown)
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="The Sleepy Dragon")
+        self.conversation = Conversation.objects.create(user=self.user)
+        for n in range(6):
+            self.conversation.insert_model_messages(
+                [
+                    ModelRequest(parts=[UserPromptPart(content=f"Tell me about page {n} " * 20)]),
+                    ModelResponse(parts=[TextPart(content=f"Page {n} is about a dragon. " * 10)]),
+                ]
+            )
+
+    def test_tools_and_history_processors_use_the_database(self):
+        """Test that compaction stores a checkpoint and a tool reads the story, closing the executor connections."""
+        agent = Agent(FunctionModel(self._respond), history_processors=[compact_history])
+
+        @agent.tool
+        @release_connections
+        def story_title(ctx: RunContext) -> str:
+            return Story.objects.get(uuid=self.story.uuid).title
+
+        deps = SimpleNamespace(conversation_uuid=self.conversation.uuid)
+        summarize = FunctionModel(lambda messages, info: ModelResponse(parts=[TextPart(content="Earlier pages.")]))
+        with (
+            summarizer_agent.override(model=summarize),
+            patch.object(connections, "close_all", wraps=connections.close_all) as close_all,
+        ):
+            result = run_agent(
+                agent, "What is the title?", deps=deps, message_history=self.conversation.model_messages
+            )
+
+        self.assertEqual(result.output, "The Sleepy Dragon")
+        self.assertEqual(ConversationCheckpoint.objects.get(conversation=self.conversation).summary, "Earlier pages.")
+        self.assertGreaterEqual(close_all.call_count, 2)
+
+    def _respond(self, messages, info: AgentInfo):
+        returns = [part for part in messages[-1].parts if part.part_kind == "tool-return"]
+        if returns:
+            return ModelResponse(parts=[TextPart(content=returns[0].content)])
+        return ModelResponse(parts=[ToolCallPart("story_title", {})])
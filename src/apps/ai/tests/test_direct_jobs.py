@@ -0,0 +1,121 @@
+"""
+Tests for suggestion jobs that ask for structured output directly instead of running the writer agent.
+"""
+
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.usage import RunUsage
+
+from apps.ai.engine.agents.suggester import suggester_agent
+from apps.ai.engine.tools.art import Drawing
+from apps.ai.models import Job
+from apps.ai.tasks import ai_page_content_job, ai_page_image_job, ai_story_title_job
+from apps.stories.models import Page, Story
+
+User = get_user_model()
+
+# A 1x1 transparent PNG
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6300010000000500010d0a2db40000000049454e44ae426082"
+)
+
+IMAGE_USAGE = RunUsage(requests=1, input_tokens=1200, output_tokens=1290)
+
+
+@override_settings(AI_DIRECT_JOBS=True)
+class DirectJobTest(TestCase):
+    """Test that direct jobs make one model request per suggestion and apply the result themselves."""
+
+    def setUp(self):
+        """Set up a story with two pages, and point the default storage at a temporary directory."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="Untitled", description="A dragon can't sleep.")
+        self.first = Page.objects.create(story=self.story, content="Once there was a dragon.")
+        self.second = Page.objects.create(story=self.story, content="He counted sheep.")
+        self.prompts = []
+
+    def _model(self, **output):
+        def respond(messages, info: AgentInfo):
+            self.prompts.append(messages[-1].parts[-1].content)
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+
+        return FunctionModel(respond)
+
+    def _run(self, task, job_payload: dict):
+        job = Job.objects.create(user=self.user, workflow=task.name)
+        Job.objects.filter(pk=job.pk).update(celery_task_id=job.uuid)
+        payload = {"user": {"user_id": self.user.id}, "chat_request": {}, "job": job_payload}
+        task.apply(kwargs={"payload": payload}, task_id=str(job.uuid))
+        job.refresh_from_db()
+        return job
+
+    def test_title_is_one_request_applied_by_the_job(self):
+        """Test that the title job asks for a title with the story in the prompt and saves it."""
+        with suggester_agent.override(model=self._model(title="Sleepy Dragon")):
+            job = self._run(ai_story_title_job, {"job_type": "story", "story_uuid": str(self.story.uuid)})
+
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.title, "Sleepy Dragon")
+        self.assertIn("Text: He counted sheep.", self.prompts[0][0])
+        self.assertEqual((job.status, job.mode, job.model_requests), (Job.Status.SUCCESS, Job.Mode.DIRECT, 1))
+
+    def test_page_content_is_saved_to_the_page(self):
+        """Test that the page job writes the suggested text to its page."""
+        with suggester_agent.override(model=self._model(content="The moon said goodnight.")):
+            job = self._run(ai_page_content_job, {"job_type": "page", "page_uuid": str(self.second.uuid)})
+
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.content, "The moon said goodnight.")
+        self.assertIn("page 2", self.prompts[0][1])
+        self.assertEqual(job.model_requests, 1)
+
+    def test_image_job_writes_the_missing_scene_then_draws(self):
+        """Test that an image job without a scene description writes one and draws in the same job."""
+        with (
+            suggester_agent.override(model=self._model(image_text="A dragon yawning under the moon.")),
+            patch("apps.ai.tasks.draw", return_value=Drawing([PNG], [], IMAGE_USAGE)) as draw,
+        ):
+            job = self._run(ai_page_image_job, {"job_type": "page", "page_uuid": str(self.first.uuid)})
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.image_text, "A dragon yawning under the moon.")
+        self.assertTrue(self.first.image)
+        self.assertIn("A dragon yawning under the moon.", draw.call_args.args[1])
+        self.assertEqual((job.status, job.mode, job.model_requests), (Job.Status.SUCCESS, Job.Mode.DIRECT, 2))
+        self.assertGreater(job.input_tokens, IMAGE_USAGE.input_tokens)
+
+    def test_image_job_with_a_scene_records_the_drawing(self):
+        """Test that drawing from an existing scene records the image model's request and tokens."""
+        Page.objects.filter(pk=self.first.pk).update(image_text="A dragon yawning under the moon.")
+        with patch("apps.ai.tasks.draw", return_value=Drawing([PNG], [], IMAGE_USAGE)):
+            job = self._run(ai_page_image_job, {"job_type": "page", "page_uuid": str(self.first.uuid)})
+
+        self.assertEqual(
+            (job.mode, job.model_requests, job.input_tokens, job.output_tokens), (Job.Mode.DIRECT, 1, 1200, 1290)
+        )
+
+    def test_comparison_report_groups_by_workflow_and_mode(self):
+        """Test that the report lists recorded jobs by workflow and mode."""
+        Job.objects.create(user=self.user, workflow="ai.story_title", status=Job.Status.SUCCESS, mode="agent")
+        Job.objects.create(user=self.user, workflow="ai.story_title", status=Job.Status.SUCCESS, mode="direct")
+        out = StringIO()
+        call_command("compare_job_modes", stdout=out)
+        lines = out.getvalue().splitlines()[1:]
+        self.assertEqual(
+            [line.split()[:2] for line in lines], [["ai.story_title", "agent"], ["ai.story_title", "direct"]]
+        )
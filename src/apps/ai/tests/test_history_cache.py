@@ -0,0 +1,83 @@
+"""
+Tests for the incremental conversation history cache.
+"""
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from pydantic_ai.messages import (
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    UserPromptPart,
+)
+
+from apps.ai.history import history_cache
+from apps.ai.models import Conversation
+from apps.ai.services import ConversationService
+
+User = get_user_model()
+
+
+class HistoryCacheTest(TestCase):
+    """Test that each turn validates only the messages added since the previous one."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.conversation = Conversation.objects.create(user=self.user, meta={"story_uuid": "none"})
+        history_cache.clear()
+        history_cache.reset_stats()
+        self.addCleanup(history_cache.clear)
+
+    def _turn(self, n):
+        return [
+            ModelRequest(parts=[UserPromptPart(content=f"Question {n}")]),
+            ModelResponse(parts=[TextPart(content=f"Answer {n}")]),
+        ]
+
+    def _validated_counts(self, service):
+        with patch(
+            "apps.ai.history.ModelMessagesTypeAdapter.validate_python", wraps=ModelMessagesTypeAdapter.validate_python
+        ) as validate:
+            messages = service.get_model_messages()
+        return messages, [len(call.args[0]) for call in validate.call_args_list]
+
+    def test_history_is_extended_incrementally(self):
+        """Test that later turns validate only new rows and still return the full, ordered history."""
+        for n in range(10):
+            self.conversation.insert_model_messages(self._turn(n))
+
+        messages, validated = self._validated_counts(ConversationService(self.conversation.uuid))
+        self.assertEqual((len(messages), validated), (20, [20]))
+
+        self.conversation.insert_model_messages(self._turn(10))
+        messages, validated = self._validated_counts(ConversationService(self.conversation.uuid))
+        self.assertEqual((len(messages), validated), (22, [2]))
+        self.assertEqual(messages, self.conversation.model_messages)
+
+        messages, validated = self._validated_counts(ConversationService(self.conversation.uuid))
+        self.assertEqual((len(messages), validated), (22, []))
+        self.assertEqual(history_cache.stats()["hits"], 2)
+
+    def test_rewritten_history_is_rebuilt(self):
+        """Test that deleting the last cached row makes the next read start over."""
+        for n in range(3):
+            self.conversation.insert_model_messages(self._turn(n))
+        service = ConversationService(self.conversation.uuid)
+        service.get_model_messages()
+
+        self.conversation.messages.order_by("-position").first().delete()
+        messages, validated = self._validated_counts(service)
+        self.assertEqual((len(messages), validated), (5, [5]))
+        self.assertEqual(messages, self.conversation.model_messages)
+
+    def test_turn_looks_up_the_conversation_once(self):
+        """Test that reading history and saving a turn share one conversation lookup."""
+        service = ConversationService(self.conversation.uuid)
+        with self.assertNumQueries(1):
+            self.assertEqual(service.conversation.meta, {"story_uuid": "none"})
+        with self.assertNumQueries(1):
+            service.get_model_messages()
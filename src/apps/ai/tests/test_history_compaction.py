@@ -0,0 +1,105 @@
+"""
+Tests for token-budgeted history compaction with stored checkpoints.
+"""
+
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelRequest,
+    ModelResponse,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from apps.ai.engine.agents.summarizer import summarizer_agent
+from apps.ai.engine.messages import CHECKPOINT_HEADER, compact_history
+from apps.ai.models import Conversation, ConversationCheckpoint
+
+User = get_user_model()
+
+
+@override_settings(AI_HISTORY_TOKEN_BUDGET=1500, AI_HISTORY_KEEP_TOKENS=800)
+class HistoryCompactionTest(TestCase):
+    """Test that long histories are replaced by reusable summary checkpoints."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.deps = SimpleNamespace(conversation_uuid=self.conversation.uuid)
+        self.sent: list[list] = []
+        self.summaries: list[str] = []
+        self.agent = Agent(FunctionModel(self._respond), history_processors=[compact_history])
+
+    def _respond(self, messages, info: AgentInfo):
+        self.sent.append(messages)
+        return ModelResponse(parts=[TextPart(content="Done.")])
+
+    def _summarize(self, messages, info: AgentInfo):
+        self.summaries.append(messages[-1].parts[-1].content)
+        return ModelResponse(parts=[TextPart(content=f"Summary {len(self.summaries)}")])
+
+    def _turn(self, n, first=False):
+        request_parts = [UserPromptPart(content=f"Please rewrite page {n} with more dragons " * 3)]
+        if first:
+            request_parts.insert(0, SystemPromptPart(content="You are a helpful writer."))
+        return [
+            ModelRequest(parts=request_parts),
+            ModelResponse(parts=[ToolCallPart(tool_name="update_page", args={"page_num": n}, tool_call_id=f"c{n}")]),
+            ModelRequest(parts=[ToolReturnPart(tool_name="update_page", content="ok " * 40, tool_call_id=f"c{n}")]),
+            ModelResponse(parts=[TextPart(content=f"Page {n} now has more dragons.")]),
+        ]
+
+    def _run(self, prompt):
+        history = self.conversation.model_messages
+        with summarizer_agent.override(model=FunctionModel(self._summarize)):
+            result = async_to_sync(self.agent.run)(prompt, message_history=history, deps=self.deps)
+        self.conversation.insert_model_messages(result.new_messages())
+        return result
+
+    def test_short_history_is_sent_unchanged(self):
+        """Test that histories within budget are not summarized."""
+        self.conversation.insert_model_messages(self._turn(1, first=True))
+        self._run("Hello")
+        self.assertEqual(len(self.sent[0]), 5)
+        self.assertEqual(self.summaries, [])
+
+    def test_long_history_is_compacted_and_checkpoint_reused(self):
+        """Test that old turns become one checkpoint that later turns reuse without summarizing again."""
+        for n in range(12):
+            self.conversation.insert_model_messages(self._turn(n, first=n == 0))
+
+        result = self._run("Add a final page")
+        sent = self.sent[-1]
+        self.assertEqual(len(self.summaries), 1)
+        # The checkpoint request carries the replaced system prompt and is merged into the first kept turn
+        self.assertIsInstance(sent[0].parts[0], SystemPromptPart)
+        self.assertTrue(sent[0].parts[1].content.startswith(CHECKPOINT_HEADER))
+        # Recent turns are kept verbatim after the checkpoint
+        self.assertGreater(len(sent), 2)
+        self.assertLess(len(sent), 49)
+        # Every tool return sent to the model follows its call
+        calls = set()
+        for message in sent:
+            for part in message.parts:
+                if isinstance(part, ToolCallPart):
+                    calls.add(part.tool_call_id)
+                elif isinstance(part, ToolReturnPart):
+                    self.assertIn(part.tool_call_id, calls)
+        # Only the new turn is persisted; the checkpoint lives in its own table
+        self.assertEqual([type(m) for m in result.new_messages()], [ModelRequest, ModelResponse])
+        checkpoint = ConversationCheckpoint.objects.get(conversation=self.conversation)
+        self.assertEqual(checkpoint.summary, "Summary 1")
+
+        self._run("And one more")
+        self.assertEqual(len(self.summaries), 1)
+        self.assertIn("Summary 1", self.sent[-1][0].parts[1].content)
+        self.assertIn("Add a final page", str(self.sent[-1]))
@@ -0,0 +1,104 @@
+"""
+Tests for enqueueing jobs: repeated requests for the same target and story version reuse the in-flight job.
+"""
+
+from unittest.mock import patch
+
+from celery import current_app, shared_task
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from apps.ai.engine.celery import JobTask, enqueue_job
+from apps.ai.models import Job
+from apps.ai.types import ChatRequest, PageJob, StoryJob
+from apps.stories.models import Page, Story
+from apps.stories.services import StoryService
+
+User = get_user_model()
+
+ran: list[dict] = []
+
+
+@shared_task(name="test.enqueued_job", base=JobTask)
+def enqueued_job(payload: dict) -> str:
+    ran.append(payload)
+    return "done"
+
+
+class EnqueueJobTest(TestCase):
+    """Test that duplicate requests get the in-flight job back, and that supersede replaces a queued one."""
+
+    def setUp(self):
+        ran.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="The Sleepy Dragon")
+        self.page = Page.objects.create(story=self.story, content="Once there was a dragon.")
+
+    def _enqueue(self, job=None, supersede: bool = False) -> Job:
+        with self.captureOnCommitCallbacks(execute=True):
+            return enqueue_job(self.user, "test.enqueued_job", ChatRequest(), job, supersede=supersede)
+
+    def test_duplicate_request_returns_the_queued_job(self):
+        """Test that a second click while the job is queued returns the same job and dispatches nothing."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            first = enqueue_job(self.user, "test.enqueued_job", ChatRequest(), PageJob(page_uuid=self.page.uuid))
+            second = enqueue_job(self.user, "test.enqueued_job", ChatRequest(), PageJob(page_uuid=self.page.uuid))
+
+        self.assertEqual(first.uuid, second.uuid)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(first.idempotency_key, f"test.enqueued_job:page:{self.page.uuid}:v{self.story.version}")
+
+    def test_new_story_version_or_finished_job_gets_a_new_job(self):
+        """Test that an edit to the story, or the earlier job having finished, makes the request a new job."""
+        with self.captureOnCommitCallbacks():
+            first = enqueue_job(self.user, "test.enqueued_job", ChatRequest(), StoryJob(story_uuid=self.story.uuid))
+        StoryService(uuid=self.story.uuid).set_title("The Wide Awake Dragon")
+        second = self._enqueue(StoryJob(story_uuid=self.story.uuid))
+        self.assertNotEqual(first.uuid, second.uuid)
+
+        third = self._enqueue(StoryJob(story_uuid=self.story.uuid))
+        self.assertEqual(Job.objects.get(pk=second.pk).status, Job.Status.SUCCESS)
+        self.assertNotEqual(second.uuid, third.uuid)
+
+    def test_supersede_revokes_the_queued_job(self):
+        """Test that supersede revokes a queued duplicate and queues the new request."""
+        with self.captureOnCommitCallbacks():
+            first = enqueue_job(self.user, "test.enqueued_job", ChatRequest(), PageJob(page_uuid=self.page.uuid))
+        with patch.object(current_app.control, "revoke") as revoke:
+            second = self._enqueue(PageJob(page_uuid=self.page.uuid), supersede=True)
+
+        first.refresh_from_db()
+        self.assertNotEqual(first.uuid, second.uuid)
+        self.assertEqual((first.status, first.error_message), (Job.Status.REVOKED, "Superseded by a newer request"))
+        revoke.assert_called_once_with(str(first.uuid))
+        self.assertEqual(Job.objects.get(pk=second.pk).status, Job.Status.SUCCESS)
+
+    def test_supersede_keeps_a_running_job(self):
+        """Test that a job that already started is returned rather than revoked."""
+        with self.captureOnCommitCallbacks():
+            first = enqueue_job(self.user, "test.enqueued_job", ChatRequest(), PageJob(page_uuid=self.page.uuid))
+        Job.objects.filter(pk=first.pk).update(status=Job.Status.RUNNING)
+
+        second = self._enqueue(PageJob(page_uuid=self.page.uuid), supersede=True)
+        self.assertEqual(first.uuid, second.uuid)
+
+    def test_jobs_without_a_target_are_never_reused(self):
+        """Test that chat turns, which have no story target, always get a job of their own."""
+        with self.captureOnCommitCallbacks():
+            first = enqueue_job(self.user, "test.enqueued_job", ChatRequest(message="Hi"))
+            second = enqueue_job(self.user, "test.enqueued_job", ChatRequest(message="Hi"))
+        self.assertNotEqual(first.uuid, second.uuid)
+        self.assertEqual(first.idempotency_key, "")
+
+    def test_revoked_job_is_not_run_when_its_task_arrives(self):
+        """Test that a task whose job was revoked before it started skips its body and leaves the job revoked."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = enqueue_job(self.user, "test.enqueued_job", ChatRequest(), PageJob(page_uuid=self.page.uuid))
+        Job.objects.filter(pk=job.pk).update(status=Job.Status.REVOKED, error_message="Superseded")
+
+        for callback in callbacks:
+            callback()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error_message, job.started_at), (Job.Status.REVOKED, "Superseded", None))
+        self.assertEqual(ran, [])
@@ -0,0 +1,101 @@
+"""
+Tests for out-of-line storage of binary message parts.
+"""
+
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    BinaryContent,
+    ImageUrl,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    UserPromptPart,
+)
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from apps.ai.artifacts import artifact_uuid, rehydrate
+from apps.ai.engine.messages import load_artifacts
+from apps.ai.models import Artifacts, Conversation
+from apps.ai.services import ConversationService
+
+User = get_user_model()
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+@override_settings(AI_MESSAGE_INLINE_MAX_BYTES=64)
+class MessageArtifactsTest(TestCase):
+    """Test that binary parts are stored as artifacts and only loaded for model calls."""
+
+    def setUp(self):
+        """Set up test data and point the default storage at a temporary directory."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.conversation = Conversation.objects.create(user=self.user, meta={"story_uuid": "none"})
+
+    def _turn(self, data=IMAGE):
+        return [
+            ModelRequest(
+                parts=[UserPromptPart(content=["Draw it like this", BinaryContent(data=data, media_type="image/png")])]
+            ),
+            ModelResponse(parts=[TextPart(content="Lovely picture.")]),
+        ]
+
+    def test_binary_parts_are_stored_out_of_line(self):
+        """Test that rows hold a reference, identical images share one artifact, and small parts stay inline."""
+        self.conversation.insert_model_messages(self._turn())
+        self.conversation.insert_model_messages(self._turn())
+        self.conversation.insert_model_messages(self._turn(data=b"tiny"))
+
+        contents = [message.content for message in self.conversation.get_ordered_messages()]
+        self.assertTrue(all(len(str(content)) < 1000 for content in contents))
+        self.assertEqual(Artifacts.objects.count(), 1)
+
+        messages = self.conversation.model_messages
+        reference = messages[0].parts[0].content[1]
+        self.assertIsInstance(reference, ImageUrl)
+        self.assertEqual(artifact_uuid(reference.url), Artifacts.objects.get().uuid)
+        self.assertEqual(messages[4].parts[0].content[1], BinaryContent(data=b"tiny", media_type="image/png"))
+
+        rehydrated = rehydrate(messages)
+        self.assertEqual(rehydrated[0].parts[0].content[1].data, IMAGE)
+        self.assertEqual(rehydrated[0].parts[0].content[1].identifier, reference.identifier)
+        # The (cached) input messages are left with their references
+        self.assertIs(messages[0].parts[0].content[1], reference)
+        self.assertIs(rehydrated[1], messages[1])
+
+    def test_model_receives_bytes_and_new_messages_are_offloaded(self):
+        """Test that the history processor sends bytes to the model while stored history keeps references."""
+        self.conversation.insert_model_messages(self._turn())
+        sent = []
+
+        def respond(messages, info: AgentInfo):
+            sent.append(messages)
+            return ModelResponse(parts=[TextPart(content="Done.")])
+
+        agent = Agent(FunctionModel(respond), history_processors=[load_artifacts])
+        service = ConversationService(self.conversation.uuid)
+        result = async_to_sync(agent.run)(
+            ["And this one", BinaryContent(data=IMAGE[::-1], media_type="image/png")],
+            message_history=service.get_model_messages(),
+            deps=SimpleNamespace(),
+        )
+        service.add_model_messages(result.new_messages())
+
+        self.assertEqual(sent[0][0].parts[0].content[1].data, IMAGE)
+        self.assertEqual(Artifacts.objects.count(), 2)
+        history = ConversationService(self.conversation.uuid).get_model_messages()
+        self.assertIsInstance(history[2].parts[0].content[1], ImageUrl)
+        self.assertIsInstance(history[0].parts[0].content[1], ImageUrl)
@@ -0,0 +1,131 @@
+"""
+Tests for streaming chat replies into the AI panel.
+"""
+
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from pydantic_ai import Agent
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+
+from apps.ai.engine.agents.writer import writer_agent
+from apps.ai.engine.runtime import stream_agent
+from apps.ai.models import Conversation, Job
+from apps.ai.services import ConversationService
+from apps.ai.tasks import agent_task
+from apps.ai.types import ChatResponse
+from apps.common.outbox import coalescer
+from apps.stories.models import Story
+from apps.stories.services import StoryService
+
+User = get_user_model()
+
+REPLY = {"message": "Once upon a time there was a very sleepy dragon.", "chips": [{"emoji": "🐉", "value": "More!"}]}
+
+
+def streamed_reply(delay: float = 0.0):
+    """A streaming model that answers with the final_result tool, a few characters of arguments at a time."""
+
+    async def stream(messages, info: AgentInfo):
+        await asyncio.sleep(delay)
+        args = json.dumps(REPLY)
+        for start in range(0, len(args), 8):
+            await asyncio.sleep(delay)
+            name = info.output_tools[0].name if start == 0 else None
+            yield {0: DeltaToolCall(name=name, json_args=args[start : start + 8])}
+
+    return FunctionModel(stream_function=stream)
+
+
+class StreamAgentTest(TestCase):
+    """Test throttled delivery of partial output."""
+
+    def test_partials_are_throttled_and_the_last_one_is_complete(self):
+        """Test that partial messages arrive in growing, throttled batches ending with the full reply."""
+        partials = []
+
+        async def on_partial(output):
+            partials.append(output.message)
+
+        agent = Agent(streamed_reply(delay=0.005), output_type=ChatResponse)
+        streamed = async_to_sync(stream_agent)(agent, "Tell me a story", on_partial, 0.03)
+
+        self.assertEqual(streamed.output.message, REPLY["message"])
+        self.assertEqual(partials[-1], REPLY["message"])
+        self.assertLess(len(partials), len(json.dumps(REPLY)) // 8)
+        self.assertEqual(partials, sorted(partials, key=len))
+        self.assertGreaterEqual(streamed.ttft_ms, 0)
+        self.assertTrue(streamed.new_messages_json)
+
+
+class AgentTaskStreamingTest(TestCase):
+    """Test that the chat task streams its reply and records time to first token on its job."""
+
+    def setUp(self):
+        """Set up a story, its conversation and the job that enqueued the turn."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        story = Story.objects.create(user=self.user, title="Test Story")
+        # Instructions run on a worker thread, which can't see the test transaction; hand them the snapshot
+        self.snapshot = StoryService(uuid=story.uuid).get_story()
+        self.conversation = Conversation.objects.create(user=self.user, meta={"story_uuid": str(story.uuid)})
+        self.job = Job.objects.create(user=self.user, workflow="ai.agent_task")
+        Job.objects.filter(pk=self.job.pk).update(celery_task_id=self.job.uuid)
+
+    @override_settings(AI_STREAM_INTERVAL=0)
+    def test_reply_is_streamed_then_stored(self):
+        """Test that partial messages go out before the final chips and the messages are stored."""
+        payload = {
+            "user": {"user_id": self.user.id},
+            "chat_request": {"conversation_uuid": str(self.conversation.uuid), "message": "Tell me a story"},
+        }
+        with (
+            writer_agent.override(model=streamed_reply()),
+            patch.object(ConversationService, "_send_message_event") as send_message,
+            patch.object(ConversationService, "_send_chips_event") as send_chips,
+            patch.object(StoryService, "get_story", return_value=self.snapshot),
+        ):
+            agent_task.apply(kwargs={"payload": payload}, task_id=str(self.job.uuid))
+
+        messages = [call.args[0] for call in send_message.call_args_list]
+        self.assertGreater(len(messages), 2)
+        self.assertEqual(messages[-1], REPLY["message"])
+        self.assertEqual(send_chips.call_count, 1)
+        self.assertEqual(self.conversation.chat_display.message, REPLY["message"])
+        self.job.refresh_from_db()
+        self.assertIsNotNone(self.job.ttft_ms)
+
+
+@override_settings(SSE_COALESCE_WINDOW=0.25, AI_STREAM_INTERVAL=0.02)
+class StreamedEventWindowTest(TestCase):
+    """Test that streamed reply text is sent at the stream interval, not the slower default coalescing window."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.conversation = Conversation.objects.create(user=self.user)
+        self.addCleanup(coalescer.reset)
+
+    def test_partials_are_not_held_back_by_the_coalescing_window(self):
+        """Test that partials spaced by the stream interval each go out right away, while other events coalesce."""
+        service = ConversationService(self.conversation.uuid)
+        with (
+            patch("apps.common.outbox.transaction.get_connection") as get_connection,
+            patch("apps.common.outbox.publish_events") as publish,
+        ):
+            # Partials are streamed from a worker thread, outside any transaction
+            get_connection.return_value.in_atomic_block = False
+            for text in ["Once", "Once upon", "Once upon a time"]:
+                service.stream_message(text)
+                time.sleep(0.03)
+            sent = [next(iter(call.args[0].values())) for call in publish.call_args_list]
+
+            service._send_chips_event([])
+            service._send_chips_event([])
+            self.assertEqual(publish.call_count, 4)
+
+        self.assertEqual(len(sent), 3)
+        self.assertIn("Once upon a time", sent[-1])
@@ -0,0 +1,210 @@
+"""
+Tests for the compact story context given to the writer agent, and for sending it as changes in conversations.
+"""
+
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from pydantic_ai.messages import ModelRequest, ModelResponse, ToolCallPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from apps.ai.engine.agents.writer import writer_agent
+from apps.ai.engine.context import CHANGES_HEADER, StoryContext, is_full_context, render_story_context
+from apps.ai.engine.messages import CHECKPOINT_HEADER, ensure_story_context
+from apps.ai.models import Conversation
+from apps.ai.services import ConversationService
+from apps.ai.tasks import agent_task
+from apps.stories.models import Page, Story
+from apps.stories.services import StoryService
+
+User = get_user_model()
+
+
+class StoryContextTest(TestCase):
+    """Test that the story context is compact and ordered from stable to volatile."""
+
+    def setUp(self):
+        """Set up a story with three pages, edited in page order."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="The Sleepy Dragon", description="A bedtime story.")
+        self.service = StoryService(uuid=self.story.uuid)
+        edited = timezone.now() - timedelta(hours=1)
+        for n in range(1, 4):
+            page = Page.objects.create(story=self.story, content=f"Page {n} text.", image_text=f"Scene {n}.")
+            Page.objects.filter(pk=page.pk).update(updated_at=edited + timedelta(minutes=n))
+
+    def test_context_is_smaller_than_the_json_schema(self):
+        """Test that the rendering keeps the text the writer needs and drops identifiers."""
+        story = self.service.get_story()
+        context = render_story_context(story)
+
+        self.assertIn("Title: The Sleepy Dragon", context)
+        self.assertIn("Text: Page 2 text.", context)
+        self.assertIn("Illustration notes: Scene 3.", context)
+        self.assertNotIn(str(story.pages[0].uuid), context)
+        self.assertLess(len(context), len(story.model_dump_json(indent=2)) / 2)
+
+    def test_an_edit_only_changes_the_tail(self):
+        """Test that editing a page moves it last and leaves the text before it unchanged."""
+        before = render_story_context(self.service.get_story())
+        self.service.set_page_content(1, "Page 1 rewritten.")
+        after = render_story_context(self.service.get_story())
+
+        headers = [line for line in after.splitlines() if line.startswith("[Page")]
+        self.assertEqual(headers, ["[Page 2]", "[Page 3]", "[Page 1]"])
+        unchanged = before[before.index("[Page 2]") : before.index("\n\n3 pages")]
+        self.assertTrue(after.startswith(before[: before.index("[Page 1]")] + unchanged))
+
+    def test_adding_a_page_keeps_existing_pages_unchanged(self):
+        """Test that a new page is appended after the existing pages without rewriting them."""
+        before = render_story_context(self.service.get_story())
+        self.service.create_page(content="Page 4 text.")
+        after = render_story_context(self.service.get_story())
+
+        self.assertTrue(after.startswith(before[: before.index("\n\n3 pages")]))
+        self.assertTrue(
+            after.endswith("4 pages in total, listed least recently edited first; page numbers give story order.")
+        )
+
+
+class StoryChangesTest(TestCase):
+    """Test that a story seen once is sent again only as what changed."""
+
+    def setUp(self):
+        """Set up a story with four pages and a context that has seen it."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="The Sleepy Dragon", description="A bedtime story.")
+        self.service = StoryService(uuid=self.story.uuid)
+        for n in range(1, 5):
+            Page.objects.create(story=self.story, content=f"Page {n} text. " * 10, image_text=f"Scene {n}.")
+        self.context = StoryContext()
+        self.full = self.context.changes(self.service.get_story())
+
+    def test_first_look_is_the_full_story_and_no_change_is_empty(self):
+        """Test that the story is sent in full first and not at all when it hasn't changed."""
+        self.assertTrue(is_full_context(self.full))
+        self.assertEqual(self.context.changes(self.service.get_story()), "")
+
+    def test_edits_are_sent_as_changed_fields_only(self):
+        """Test that an edited page carries only its changed field and unchanged pages are left out."""
+        self.service.set_page_image_text(2, "A dragon yawning.")
+        changes = self.context.changes(self.service.get_story())
+
+        self.assertTrue(changes.startswith(CHANGES_HEADER))
+        self.assertIn("[Page 2, edited]\nIllustration notes: A dragon yawning.", changes)
+        self.assertNotIn("Page 2 text.", changes)
+        self.assertNotIn("Page 3 text.", changes)
+        self.assertLess(len(changes), len(self.full) / 4)
+
+    def test_structure_changes_use_previous_page_numbers(self):
+        """Test that removed, moved and added pages are described against the numbering the model saw."""
+        self.service.delete_page(1)
+        self.service.move_page(3, "first")
+        self.service.create_page(content="The end.")
+        changes = self.context.changes(self.service.get_story())
+
+        self.assertIn("Removed pages, by previous number: 1", changes)
+        self.assertIn("Page order now, by previous number: 4, 2, 3, new", changes)
+        self.assertIn("[Page 4, new]\nText: The end.", changes)
+
+    def test_falls_back_to_the_full_story_when_the_changes_are_larger(self):
+        """Test that rewriting what is left of a reordered story sends it in full rather than as longer changes."""
+        self.service.set_title("The Wide Awake Dragon")
+        self.service.delete_page(2)
+        self.service.move_page(3, "first")
+        for n in range(1, 4):
+            self.service.set_page_content(n, f"New page {n}.")
+            self.service.set_page_image_text(n, f"New scene {n}.")
+        self.assertTrue(is_full_context(self.context.changes(self.service.get_story())))
+
+    def test_round_trips_through_json(self):
+        """Test that what the model saw survives being stored on the conversation."""
+        restored = StoryContext.from_json(self.context.to_json(), in_history=True)
+        self.service.set_page_content(4, "Goodnight.")
+        self.assertEqual(restored.changes(self.service.get_story()), self.context.changes(self.service.get_story()))
+
+
+@override_settings(AI_STREAM_REPLIES=False)
+class ConversationStoryContextTest(TestCase):
+    """Test that chat turns carry the story in their prompts, in full once and as changes after that."""
+
+    def setUp(self):
+        """Set up a story with a conversation and a model that records what it is sent."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="The Sleepy Dragon")
+        for n in range(1, 4):
+            Page.objects.create(story=self.story, content=f"Page {n} text.")
+        self.service = StoryService(uuid=self.story.uuid)
+        self.conversation = Conversation.objects.create(user=self.user, meta={"story_uuid": str(self.story.uuid)})
+        self.requests = []
+
+        def respond(messages, info: AgentInfo):
+            self.requests.append(messages)
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"message": "Done.", "chips": []})])
+
+        self.model = FunctionModel(respond)
+
+    def _turn(self, message: str):
+        payload = {
+            "user": {"user_id": self.user.id},
+            "chat_request": {"conversation_uuid": str(self.conversation.uuid), "message": message},
+        }
+        with (
+            writer_agent.override(model=self.model),
+            patch.object(ConversationService, "send_chat_response"),
+        ):
+            agent_task.apply(kwargs={"payload": payload})
+        request = self.requests[-1][-1]
+        return request.parts[-1].content, request.instructions
+
+    def test_second_turn_sends_only_changes(self):
+        """Test that the first prompt holds the full story and the next only the page edited in between."""
+        first, instructions = self._turn("Hello")
+        self.assertTrue(is_full_context(first[0]))
+        self.assertEqual(first[1], "Hello")
+        self.assertNotIn("Page 1 text.", instructions)
+
+        self.service.set_page_content(2, "A brand new page two.")
+        second, _instructions = self._turn("I changed page two")
+        self.assertTrue(second[0].startswith(CHANGES_HEADER))
+        self.assertIn("A brand new page two.", second[0])
+        self.assertNotIn("Page 1 text.", second[0])
+
+        third, _instructions = self._turn("Thanks")
+        self.assertEqual(third, "Thanks")
+
+    def test_saving_keeps_meta_written_during_the_turn(self):
+        """Test that storing the story context doesn't write back meta read before the turn started."""
+        service = ConversationService(self.conversation.uuid)
+        context = service.story_context()
+        context.full(self.service.get_story())
+        Conversation.objects.filter(pk=self.conversation.pk).update(
+            meta={**self.conversation.meta, "title_locked": True}
+        )
+
+        service.save_story_context(context)
+        self.conversation.refresh_from_db()
+        self.assertTrue(self.conversation.meta["title_locked"])
+        self.assertEqual(self.conversation.meta["story_context"], context.to_json())
+
+    def test_full_story_is_resent_when_no_copy_is_left(self):
+        """Test that a history without the full story, e.g. after compaction, gets it back in the prompt."""
+        self._turn("Hello")
+        self.conversation.refresh_from_db()
+        context = ConversationService(self.conversation.uuid).story_context()
+        self.service.set_page_content(1, "Edited.")
+        prompt = [context.changes(self.service.get_story()), "Go on"]
+        history = [ModelRequest(parts=[UserPromptPart(content=f"{CHECKPOINT_HEADER}\n\nEarlier talk.")])]
+        history.append(ModelRequest(parts=[UserPromptPart(content=prompt)]))
+        deps = SimpleNamespace(story_context=context, story_service=self.service)
+
+        processed = async_to_sync(ensure_story_context)(SimpleNamespace(deps=deps), history)
+        content = processed[-1].parts[0].content
+        self.assertTrue(is_full_context(content[0]))
+        self.assertIn("Text: Edited.", content[0])
+        self.assertEqual(content[1:], ["Go on"])
@@ -0,0 +1,146 @@
+"""
+Tests for run-scoped toolset state: duplicate blocking, read memoization, call timings and concurrency.
+"""
+
+import asyncio
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+from pydantic_ai import Agent, Tool
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+from pydantic_ai.toolsets import FunctionToolset
+
+from apps.ai.engine.base.toolsets import READ_ONLY, EnhancedToolset, current_run_state
+
+
+class ToolsetStateTest(SimpleTestCase):
+    """Test that toolset state belongs to each run rather than to the shared toolset."""
+
+    def setUp(self):
+        """Build a shared toolset with one read and one write tool that count their executions."""
+        self.reads = 0
+        self.writes = 0
+        self.timings = {}
+
+        def get_value(key: str) -> str:
+            self.reads += 1
+            return f"{key}={self.writes}"
+
+        def set_value(key: str) -> str:
+            self.writes += 1
+            return "saved"
+
+        self.toolset = EnhancedToolset(FunctionToolset([Tool(get_value, metadata=READ_ONLY), set_value]))
+
+    def _agent(self, script: list[tuple[str, dict]], delay: float = 0.0) -> Agent:
+        """An agent whose model makes the scripted tool calls one step at a time, then answers."""
+
+        async def respond(messages, info: AgentInfo):
+            await asyncio.sleep(delay)
+            step = sum(isinstance(part, ToolReturnPart) for message in messages for part in message.parts)
+            if step < len(script):
+                name, args = script[step]
+                return ModelResponse(parts=[ToolCallPart(tool_name=name, args=args, tool_call_id=f"call-{step}")])
+            self.timings[messages[0].parts[-1].content] = list(current_run_state().timings)
+            return ModelResponse(parts=[TextPart(content="Done.")])
+
+        return Agent(FunctionModel(respond), toolsets=[self.toolset])
+
+    def _returns(self, result) -> list[str]:
+        return [
+            part.content
+            for message in result.all_messages()
+            for part in message.parts
+            if isinstance(part, ToolReturnPart)
+        ]
+
+    def test_reads_are_memoized_until_a_write(self):
+        """Test that repeated reads reuse the result, writes invalidate it, and repeated writes are blocked."""
+        read = ("get_value", {"key": "a"})
+        write = ("set_value", {"key": "a"})
+        agent = self._agent([read, read, write, write, read, read])
+        result = async_to_sync(agent.run)("run")
+
+        returns = self._returns(result)
+        self.assertEqual(returns[:3], ["a=0", "a=0", "saved"])
+        self.assertEqual(returns[3]["status"], "already_completed")
+        self.assertEqual(returns[4:], ["a=1", "a=1"])
+        self.assertEqual((self.reads, self.writes), (2, 1))
+        self.assertEqual([t.memoized for t in self.timings["run"]], [False, True, False, False, True])
+
+    def test_concurrent_runs_keep_separate_state(self):
+        """Test that the same write in two overlapping runs is not mistaken for a duplicate."""
+        write = ("set_value", {"key": "a"})
+
+        async def both():
+            return await asyncio.gather(
+                self._agent([write], delay=0.01).run("first"), self._agent([write], delay=0.01).run("second")
+            )
+
+        results = async_to_sync(both)()
+        self.assertEqual([self._returns(result) for result in results], [["saved"], ["saved"]])
+        self.assertEqual(self.writes, 2)
+        self.assertEqual(set(self.timings), {"first", "second"})
+        self.assertIsNone(current_run_state())
+
+
+@override_settings(AI_TOOL_READ_CONCURRENCY=3)
+class ConcurrentToolCallsTest(SimpleTestCase):
+    """Test that reads from one response run in parallel, bounded, while writes keep their order."""
+
+    def setUp(self):
+        """Build a toolset whose tools sleep and record how many of them overlap."""
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+        def track(label: str) -> None:
+            with self.lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                self.calls.append(label)
+            time.sleep(0.05)
+            with self.lock:
+                self.active -= 1
+
+        def get_page(page_num: int) -> str:
+            track(f"get {page_num}")
+            return f"page {page_num}"
+
+        def update_page(page_num: int) -> str:
+            track(f"update {page_num}")
+            return "saved"
+
+        self.toolset = EnhancedToolset(FunctionToolset([Tool(get_page, metadata=READ_ONLY), update_page]))
+
+    def _run(self, calls: list[tuple[str, int]]):
+        def respond(messages, info: AgentInfo):
+            if len(messages) > 1:
+                return ModelResponse(parts=[TextPart(content="Done.")])
+            return ModelResponse(
+                parts=[
+                    ToolCallPart(tool_name=name, args={"page_num": page}, tool_call_id=f"call-{n}")
+                    for n, (name, page) in enumerate(calls)
+                ]
+            )
+
+        started = time.perf_counter()
+        async_to_sync(Agent(FunctionModel(respond), toolsets=[self.toolset]).run)("go")
+        return time.perf_counter() - started
+
+    def test_read_batch_runs_in_parallel_with_bounded_concurrency(self):
+        """Test that six page reads overlap three at a time, and a repeated read in the batch is shared."""
+        elapsed = self._run([("get_page", page) for page in [1, 2, 3, 4, 5, 6, 1]])
+        self.assertEqual(self.max_active, 3)
+        self.assertEqual(len(self.calls), 6)
+        self.assertLess(elapsed, 6 * 0.05)
+
+    def test_batch_with_a_write_runs_in_order(self):
+        """Test that a batch containing a write runs one call at a time in the order the model gave."""
+        self._run([("get_page", 1), ("update_page", 1), ("get_page", 2), ("update_page", 2)])
+        self.assertEqual(self.max_active, 1)
+        self.assertEqual(self.calls, ["get 1", "update 1", "get 2", "update 2"])
@@ -0,0 +1,365 @@
+"""
+Tests for workflows: DAGs of jobs whose steps are queued as their dependencies finish.
+"""
+
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from apps.ai.engine.agents.suggester import suggester_agent
+from apps.ai.engine.celery import JobTask
+from apps.ai.engine.tools.art import Drawing, draw
+from apps.ai.engine.workflows import (
+    Step,
+    advance,
+    enqueue_workflow,
+    fail_stale_steps,
+    story_generation,
+    story_illustration,
+)
+from apps.ai.models import Job
+from apps.ai.types import PageJob, StoryJob
+from apps.stories.models import Page, Story
+from apps.stories.services import StoryService
+
+User = get_user_model()
+
+
+def png() -> bytes:
+    buffer = BytesIO()
+    PILImage.new("RGB", (64, 64), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+runs = []
+
+
+@shared_task(name="test.workflow_step", base=JobTask, bind=True)
+def workflow_step(self, payload: dict) -> str:
+    """Record which job ran, and how many steps of its workflow were in flight at the time."""
+    parent_id = Job.objects.get(celery_task_id=self.request.id).parent_id
+    in_flight = Job.objects.filter(parent_id=parent_id, status__in=[Job.Status.QUEUED, Job.Status.RUNNING]).count()
+    runs.append((payload["job"]["page_uuid"], in_flight))
+    return "done"
+
+
+def step(key: str, *after: str) -> Step:
+    return Step(key, "test.workflow_step", PageJob(page_uuid=uuid4()), after=after)
+
+
+class WorkflowTest(TestCase):
+    """Test that steps run after their dependencies, within the fan-out limit, and that failures propagate."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        runs.clear()
+
+    def _steps(self, root: Job) -> dict[str, Job]:
+        return {job.step: job for job in root.steps.all()}
+
+    def _run(self, steps: list[Step]) -> Job:
+        with (
+            patch("apps.ai.engine.workflows.queue_event"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            root = enqueue_workflow(self.user.id, "wf.test", steps, "story-channel")
+        root.refresh_from_db()
+        return root
+
+    def test_steps_run_after_their_dependencies(self):
+        """Test that a diamond runs its head first, its branches next and its join last."""
+        steps = [step("head"), step("left", "head"), step("right", "head"), step("join", "left", "right")]
+        root = self._run(steps)
+
+        order = [str(s.job.page_uuid) for s in steps]
+        ran = [uuid for uuid, _in_flight in runs]
+        self.assertEqual(ran[0], order[0])
+        self.assertEqual(set(ran[1:3]), set(order[1:3]))
+        self.assertEqual(ran[3], order[3])
+        self.assertEqual(root.status, Job.Status.SUCCESS)
+        self.assertTrue(all(job.status == Job.Status.SUCCESS for job in root.steps.all()))
+
+    @override_settings(AI_WORKFLOW_MAX_PARALLEL=2)
+    def test_fan_out_is_bounded(self):
+        """Test that no more than the configured number of ready steps are queued at once."""
+        steps = [step(f"page{n}") for n in range(5)]
+        with patch("apps.ai.engine.workflows.queue_event"), self.captureOnCommitCallbacks() as callbacks:
+            root = enqueue_workflow(self.user.id, "wf.test", steps, "story-channel")
+
+        statuses = [job.status for job in self._steps(root).values()]
+        self.assertEqual(statuses.count(Job.Status.QUEUED), 2)
+        self.assertEqual(statuses.count(Job.Status.PENDING), 3)
+        self.assertEqual(len(callbacks), 2)
+
+        runs.clear()
+        root = self._run(steps)
+        self.assertEqual(len(runs), 5)
+        self.assertLessEqual(max(in_flight for _uuid, in_flight in runs), 2)
+        self.assertEqual(root.status, Job.Status.SUCCESS)
+
+    def test_failed_step_fails_its_dependents_only(self):
+        """Test that the dependents of a failed step are skipped, other branches still run and the root fails."""
+        with patch("apps.ai.engine.workflows.queue_event"), self.captureOnCommitCallbacks():
+            root = enqueue_workflow(
+                self.user.id,
+                "wf.test",
+                [step("a"), step("a2", "a"), step("a3", "a2"), step("b")],
+                "story-channel",
+            )
+        jobs = self._steps(root)
+        Job.objects.filter(pk=jobs["a"].pk).update(status=Job.Status.FAILED)
+        Job.objects.filter(pk=jobs["b"].pk).update(status=Job.Status.SUCCESS)
+
+        with patch("apps.ai.engine.workflows.queue_event"):
+            advance(root.uuid)
+
+        root.refresh_from_db()
+        jobs = self._steps(root)
+        self.assertEqual(jobs["a3"].status, Job.Status.FAILED)
+        self.assertEqual(jobs["a3"].error_message, "Skipped: a2 failed")
+        self.assertEqual(root.status, Job.Status.FAILED)
+        self.assertEqual(root.error_message, "3 of 4 steps failed")
+
+    def test_revoked_step_skips_its_dependents(self):
+        """Test that a revoked step counts as finished: its dependents are skipped and the root fails."""
+        with patch("apps.ai.engine.workflows.queue_event"), self.captureOnCommitCallbacks():
+            root = enqueue_workflow(self.user.id, "wf.test", [step("a"), step("a2", "a")], "story-channel")
+        Job.objects.filter(parent=root, step="a").update(status=Job.Status.REVOKED)
+
+        with patch("apps.ai.engine.workflows.queue_event"):
+            advance(root.uuid)
+
+        root.refresh_from_db()
+        self.assertEqual(self._steps(root)["a2"].error_message, "Skipped: a revoked")
+        self.assertEqual((root.status, root.error_message), (Job.Status.FAILED, "2 of 2 steps failed"))
+
+    @override_settings(AI_WORKFLOW_STEP_TIMEOUT=60)
+    def test_stale_steps_are_failed_and_their_workflow_finishes(self):
+        """Test that a step stuck past the timeout is failed, its workflow finishes and a late result is ignored."""
+        with patch("apps.ai.engine.workflows.queue_event"), self.captureOnCommitCallbacks():
+            root = enqueue_workflow(self.user.id, "wf.test", [step("a"), step("a2", "a"), step("b")], "story-channel")
+        jobs = self._steps(root)
+        long_ago = timezone.now() - timedelta(minutes=5)
+        Job.objects.filter(pk=jobs["a"].pk).update(status=Job.Status.RUNNING, started_at=long_ago)
+        Job.objects.filter(pk=jobs["b"].pk).update(status=Job.Status.RUNNING, started_at=timezone.now())
+
+        with patch("apps.ai.engine.workflows.queue_event"):
+            self.assertEqual(fail_stale_steps(), 1)
+            Job.objects.filter(pk=jobs["b"].pk).update(status=Job.Status.SUCCESS)
+            advance(root.uuid)
+            workflow_step.on_success("done", str(jobs["a"].celery_task_id), (), {})
+
+        root.refresh_from_db()
+        jobs = self._steps(root)
+        self.assertEqual((jobs["a"].status, jobs["a"].error_message), (Job.Status.FAILED, "Timed out after 60s"))
+        self.assertEqual(jobs["a2"].error_message, "Skipped: a failed")
+        self.assertEqual((root.status, root.error_message), (Job.Status.FAILED, "2 of 3 steps failed"))
+
+    def test_progress_is_sent_to_the_story_channel(self):
+        """Test that every advance sends the workflow's step counts to the story's channel."""
+        with patch("apps.ai.engine.workflows.queue_event") as queue_event, self.captureOnCommitCallbacks(execute=True):
+            root = enqueue_workflow(self.user.id, "wf.test", [step("a"), step("b", "a")], "story-channel")
+
+        progress = [call.args for call in queue_event.call_args_list if call.args[1] == "workflow_progress"]
+        channel, _event, data = progress[-1]
+        self.assertEqual(channel, "story-channel")
+        self.assertEqual(data["workflow"], str(root.uuid))
+        self.assertEqual((data["status"], data["done"], data["total"]), (Job.Status.SUCCESS, 2, 2))
+        self.assertEqual(len(progress), 3)
+
+    def test_steps_may_only_depend_on_earlier_steps(self):
+        """Test that a step depending on a later one is rejected before anything is created."""
+        with self.assertRaises(ValueError):
+            enqueue_workflow(self.user.id, "wf.test", [step("b", "a"), step("a")], "story-channel")
+        self.assertFalse(Job.objects.exists())
+
+    def test_story_generation_branches_per_page(self):
+        """Test that each page gets its own content, scene and image chain after the title."""
+        pages = [uuid4(), uuid4()]
+        steps = story_generation(uuid4(), pages)
+
+        self.assertEqual([s.key for s in steps[:2]], ["brainstorm", "title"])
+        self.assertIsInstance(steps[0].job, StoryJob)
+        by_key = {s.key: s for s in steps}
+        self.assertEqual(by_key[f"content:{pages[1]}"].after, ("title",))
+        self.assertEqual(by_key[f"image:{pages[1]}"].after, (f"image_text:{pages[1]}",))
+        self.assertEqual(by_key[f"image:{pages[1]}"].workflow, "ai.page_image")
+
+
+@override_settings(AI_DIRECT_JOBS=True, AI_ILLUSTRATION_MAX_PARALLEL=2)
+class StoryIllustrationTest(TestCase):
+    """Test that illustrating a story draws every missing page from one shared story context."""
+
+    def setUp(self):
+        """Set up a story with one illustrated page, two described pages and one without a scene."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="The Sleepy Dragon")
+        self.service = StoryService(uuid=self.story.uuid)
+        self.pages = [Page.objects.create(story=self.story, content=f"Page {n} text.") for n in range(1, 5)]
+        self.service.set_page_image(self.pages[0].uuid, png())
+        for page in self.pages[1:3]:
+            self.service.set_page_image_text(page.uuid, f"Scene of {page.content}")
+
+    def test_each_drawing_waits_for_the_context_and_its_own_scene(self):
+        """Test that illustrated pages are left out and each drawing depends only on the context and its scene."""
+        steps = {step.key: step for step in story_illustration(self.service.get_story())}
+        last = self.pages[3].uuid
+
+        self.assertEqual(list(steps)[:2], ["context", f"image_text:{last}"])
+        self.assertEqual(steps["context"].after, ())
+        self.assertEqual(steps[f"image:{last}"].after, ("context", f"image_text:{last}"))
+        self.assertEqual(
+            {key for key, step in steps.items() if step.after == ("context",)},
+            {f"image:{page.uuid}" for page in self.pages[1:3]},
+        )
+
+    def test_failed_scene_only_cancels_its_own_page(self):
+        """Test that a page whose scene description fails is skipped while the other pages are still drawn."""
+        with patch("apps.ai.engine.workflows.queue_event"), self.captureOnCommitCallbacks():
+            root = enqueue_workflow(
+                self.user.id,
+                "wf.story_illustration",
+                story_illustration(self.service.get_story()),
+                self.service.channel,
+                max_parallel=10,
+            )
+        last = self.pages[3].uuid
+        jobs = {job.step: job for job in root.steps.all()}
+        Job.objects.filter(pk=jobs["context"].pk).update(status=Job.Status.SUCCESS)
+        Job.objects.filter(pk=jobs[f"image_text:{last}"].pk).update(status=Job.Status.FAILED)
+
+        with patch("apps.ai.engine.workflows.queue_event"), self.captureOnCommitCallbacks():
+            advance(root.uuid)
+
+        jobs = {job.step: job for job in root.steps.all()}
+        self.assertEqual(jobs[f"image:{last}"].status, Job.Status.FAILED)
+        self.assertEqual(jobs[f"image:{last}"].error_message, f"Skipped: image_text:{last} failed")
+        self.assertEqual(
+            [jobs[f"image:{page.uuid}"].status for page in self.pages[1:3]], [Job.Status.QUEUED, Job.Status.QUEUED]
+        )
+
+    def _illustrate(self, supersede: bool = False) -> str:
+        url = "/api/ai/jobs/story/illustrate" + ("?supersede=true" if supersede else "")
+        with patch("apps.ai.engine.workflows.queue_event"), self.captureOnCommitCallbacks():
+            response = self.client.post(url, {"story_uuid": str(self.story.uuid)}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["job_uuid"]
+
+    def test_double_click_illustrates_the_story_once(self):
+        """Test that posting illustrate twice returns the running workflow instead of drawing every page twice."""
+        self.client.force_login(self.user)
+        first, second = self._illustrate(), self._illustrate()
+
+        self.assertEqual(first, second)
+        self.assertEqual(Job.objects.filter(workflow="wf.story_illustration").count(), 1)
+        self.assertEqual(Job.objects.filter(workflow="ai.page_image").count(), 3)
+
+    def test_supersede_replaces_a_workflow_that_has_not_started(self):
+        """Test that supersede revokes a workflow whose steps are only queued, but keeps one already running."""
+        self.client.force_login(self.user)
+        first = self._illustrate()
+        second = self._illustrate(supersede=True)
+
+        self.assertNotEqual(first, second)
+        revoked = Job.objects.get(uuid=first)
+        self.assertEqual(revoked.status, Job.Status.REVOKED)
+        self.assertEqual(set(revoked.steps.values_list("status", flat=True)), {Job.Status.REVOKED})
+
+        Job.objects.filter(parent__uuid=second, step="context").update(status=Job.Status.RUNNING)
+        self.assertEqual(self._illustrate(supersede=True), second)
+
+    @override_settings(AI_DIRECT_JOBS=False)
+    def test_agent_drawing_step_without_a_scene_fails(self):
+        """Test that an agent-mode drawing step fails instead of handing its page to a nested workflow."""
+        page = self.pages[3]
+        steps = [Step("image", "ai.page_image", PageJob(page_uuid=page.uuid))]
+        with (
+            self.assertRaisesMessage(RuntimeError, "Page 4 has no scene description to illustrate"),
+            patch("apps.ai.engine.workflows.queue_event"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            enqueue_workflow(self.user.id, "wf.story_illustration", steps, self.service.channel)
+
+        self.assertNotEqual(Job.objects.get(step="image").status, Job.Status.SUCCESS)
+        self.assertFalse(Job.objects.filter(workflow="wf.page_image").exists())
+
+    def test_pages_are_drawn_from_one_context_with_an_event_each(self):
+        """Test that every drawing gets the same prepared text, each page sends its own event and the root sums up."""
+        contexts = []
+
+        def fake_draw(deps, prompt, page_key):
+            contexts.append(deps.illustration_context)
+            return Drawing([png()], [])
+
+        def respond(messages, info: AgentInfo):
+            return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"image_text": "A yawning dragon."})])
+
+        with (
+            suggester_agent.override(model=FunctionModel(respond)),
+            patch("apps.ai.tasks.draw", side_effect=fake_draw),
+            patch("apps.ai.engine.workflows.queue_event") as queue_event,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            root = enqueue_workflow(
+                self.user.id,
+                "wf.story_illustration",
+                story_illustration(self.service.get_story()),
+                self.service.channel,
+                max_parallel=2,
+            )
+
+        root.refresh_from_db()
+        self.assertEqual(root.status, Job.Status.SUCCESS)
+        self.assertEqual(root.model_requests, 1)
+        self.assertTrue(root.output_text.startswith("5 of 5 steps succeeded"))
+        self.assertEqual(len(contexts), 3)
+        self.assertTrue(all(context == contexts[0] for context in contexts))
+        self.assertTrue(any("Scene of Page 2 text." in part for part in contexts[0]))
+        self.assertTrue(all(Page.objects.get(pk=page.pk).image for page in self.pages))
+
+        events = {call.args[1]: call.args[2] for call in queue_event.call_args_list}
+        page_event = events[f"workflow_step#image:{self.pages[3].uuid}"]
+        self.assertEqual(
+            (page_event["status"], page_event["page_uuid"]), (Job.Status.SUCCESS, str(self.pages[3].uuid))
+        )
+
+    def test_draw_sends_the_shared_context_before_the_prompt(self):
+        """Test that a drawing with a prepared context sends it as is, with the page's prompt last."""
+        client = MagicMock()
+        client.models.generate_content.return_value = SimpleNamespace(
+            candidates=[], usage_metadata=SimpleNamespace(prompt_token_count=1200, candidates_token_count=1290)
+        )
+        deps = SimpleNamespace(
+            story_service=self.service,
+            illustration_context=["prepared story text"],
+            image_client=client,
+            image_model="image-model",
+        )
+        drawing = draw(deps, "Draw page 2", self.pages[1].uuid)
+
+        self.assertEqual(
+            (drawing.usage.requests, drawing.usage.input_tokens, drawing.usage.output_tokens), (1, 1200, 1290)
+        )
+
+        contents = client.models.generate_content.call_args.kwargs["contents"]
+        self.assertEqual(contents[1:3], ["## STORY_CONTEXT:", "prepared story text"])
+        self.assertIn("Illustration of page 1:", contents)
+        self.assertEqual(contents[-1], "## PROMPT:\nDraw page 2")
@@ -115,6 +115,19 @@ class ChatResponse(BaseModel):
 chat_response_adapter = TypeAdapter(ChatResponse)
 
 
+# Structured outputs of direct suggestion jobs
+class StoryTitle(BaseModel):
+    title: str = Field(description="Kid-friendly story title, 2-5 words")
+
+
+class PageContent(BaseModel):
+    content: str = Field(description="The page's story text, 1-3 short sentences")
+
+
+class SceneDescription(BaseModel):
+    image_text: str = Field(description="Purely descriptive scene to illustrate on the page")
+
+
 class ToolReturnValue(BaseModel):
     """Base model for tool return values."""
 
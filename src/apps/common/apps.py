@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CommonConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.common"
+
+    def ready(self):
+        from django.core import checks
+
+        from apps.common.sse import check_revocation_cache
+
+        checks.register(check_revocation_cache, checks.Tags.caches)
@@ -0,0 +1,33 @@
+"""
+Database connection hygiene for code that runs outside Django's request and Celery task cycles.
+
+Django closes stale connections when a request starts and finishes, and Celery's Django fixup does the same around
+each task, but threads from other pools (such as the ones pydantic-ai runs sync tools on) get neither. A connection
+opened there would outlive ``CONN_MAX_AGE``, survive a database restart as a dead handle, and leak with the thread.
+"""
+
+from collections.abc import Callable
+from functools import wraps
+
+from django.db import connections
+
+
+def close_stale_connections() -> None:
+    """Close this thread's connections that are unusable or past CONN_MAX_AGE, leaving open transactions alone."""
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+def release_connections[**P, R](func: Callable[P, R]) -> Callable[P, R]:
+    """Bracket a sync unit of ORM work the way Django brackets a request: drop stale connections before and after."""
+
+    @wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        close_stale_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_stale_connections()
+
+    return wrapper
@@ -0,0 +1,105 @@
+"""
+Redis Streams storage backend for django_eventstream.
+
+Each channel is one capped stream plus an integer counter. django_eventstream needs integer event ids (it
+publishes ``id - 1`` as the previous id and parses ``Last-Event-ID`` as ints), so a Lua script increments the
+counter and adds the entry under the explicit stream id ``<n>-0`` atomically. Entries are trimmed to roughly
+``EVENTSTREAM_STREAM_MAXLEN`` per channel and both keys expire ``EVENTSTREAM_STREAM_TTL`` seconds after the last
+append. A reconnect whose ``Last-Event-ID`` has been trimmed away gets ``EventDoesNotExist`` and is reset, the same
+as with DjangoModelStorage.
+"""
+
+import logging
+
+from django.conf import settings
+from django_eventstream.event import Event
+from django_eventstream.storage import EventDoesNotExist, StorageBase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAM_MAXLEN = 1000
+DEFAULT_STREAM_TTL = 60 * 60 * 24
+
+APPEND_SCRIPT = """
+local id = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], id .. '-0', 'type', ARGV[2], 'data', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return id
+"""
+
+
+def _event_id(stream_id: str) -> int:
+    return int(stream_id.split("-", 1)[0])
+
+
+class RedisStreamStorage(StorageBase):
+    def __init__(self):
+        self.maxlen = getattr(settings, "EVENTSTREAM_STREAM_MAXLEN", DEFAULT_STREAM_MAXLEN)
+        self.ttl = getattr(settings, "EVENTSTREAM_STREAM_TTL", DEFAULT_STREAM_TTL)
+        self._redis = None
+        self._append = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis
+
+            config = dict(getattr(settings, "EVENTSTREAM_STORAGE_CONNECTION", None) or settings.EVENTSTREAM_REDIS)
+            config.setdefault("decode_responses", True)
+            url = config.pop("url", None)
+            self._redis = redis.Redis.from_url(url, **config) if url else redis.Redis(**config)
+        return self._redis
+
+    @property
+    def append_script(self):
+        if self._append is None:
+            self._append = self.redis.register_script(APPEND_SCRIPT)
+        return self._append
+
+    @staticmethod
+    def _keys(channel: str) -> tuple[str, str]:
+        # The hash tag keeps both keys in one cluster slot so the script may touch them together
+        return f"eventstream:{{{channel}}}:counter", f"eventstream:{{{channel}}}:stream"
+
+    def append_event(self, channel, event_type, data):
+        event_id = self.append_script(keys=self._keys(channel), args=[self.maxlen, event_type, data, self.ttl])
+        return Event(channel, event_type, data, id=int(event_id))
+
+    def append_events(self, events: list[tuple[str, str, str]]) -> list[Event]:
+        """Append (channel, event_type, data) triples in one pipelined round trip."""
+        pipe = self.redis.pipeline(transaction=False)
+        for channel, event_type, data in events:
+            self.append_script(keys=self._keys(channel), args=[self.maxlen, event_type, data, self.ttl], client=pipe)
+        event_ids = pipe.execute()
+        return [
+            Event(channel, event_type, data, id=int(event_id))
+            for (channel, event_type, data), event_id in zip(events, event_ids, strict=True)
+        ]
+
+    def get_events(self, channel, last_id, limit=100):
+        current_id = self.get_current_id(channel)
+        if last_id == current_id:
+            return []
+        if last_id > current_id:
+            # The channel expired and its counter restarted
+            raise EventDoesNotExist(f"No such event {last_id}", current_id)
+
+        _counter_key, stream_key = self._keys(channel)
+        if last_id:
+            # Fetch the referenced event too, to tell "caught up" apart from "trimmed away"
+            entries = self.redis.xrange(stream_key, min=f"{last_id}-0", count=limit + 1)
+            if not entries or _event_id(entries[0][0]) != last_id:
+                raise EventDoesNotExist(f"No such event {last_id}", current_id)
+            entries = entries[1:]
+        else:
+            entries = self.redis.xrange(stream_key, min="-", count=limit)
+            if not entries or _event_id(entries[0][0]) != 1:
+                raise EventDoesNotExist(f"No such event {last_id}", current_id)
+
+        return [Event(channel, fields["type"], fields["data"], id=_event_id(entry_id)) for entry_id, fields in entries]
+
+    def get_current_id(self, channel):
+        counter_key, _stream_key = self._keys(channel)
+        current_id = self.redis.get(counter_key)
+        return int(current_id) if current_id else 0
@@ -0,0 +1,124 @@
+"""
+Derived images: size-bucketed thumbnails in modern formats, and compact renditions for model context.
+
+Decoding and encoding (AVIF especially) is CPU-bound and holds the GIL, so it runs in a process pool shared by
+the worker rather than on the Celery thread itself. ``IMAGE_VARIANT_WORKERS = 0`` renders inline instead, which
+is what tests use.
+"""
+
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import TypedDict
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+class ImageVariant(TypedDict):
+    name: str
+    width: int
+    height: int
+    format: str
+
+
+def _render(data: bytes, widths: list[int], formats: list[str], quality: int) -> list[tuple[int, int, str, bytes]]:
+    """Decode once and encode every (width, format) pair. Runs in a pool process, so it only sees plain values."""
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    # Never upscale: widths past the original collapse into one variant at the original width
+    buckets = sorted({min(width, image.width) for width in widths})
+    rendered = []
+    for width in buckets:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            out = io.BytesIO()
+            resized.save(out, format=fmt.upper(), quality=quality)
+            rendered.append((width, height, fmt, out.getvalue()))
+    return rendered
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS)
+        return _pool
+
+
+def _render_bounded(data: bytes, max_edge: int, fmt: str, quality: int) -> bytes:
+    """Fit an image inside max_edge x max_edge and re-encode it. Runs in a pool process."""
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") and fmt != "jpeg" else "RGB")
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, format=fmt.upper(), quality=quality)
+    return out.getvalue()
+
+
+def _run(func, *args):
+    if settings.IMAGE_VARIANT_WORKERS <= 0:
+        return func(*args)
+    return _get_pool().submit(func, *args).result()
+
+
+def render_variants(data: bytes) -> list[tuple[int, int, str, bytes]]:
+    """Render the configured widths and formats of an image as (width, height, format, bytes) tuples."""
+    return _run(
+        _render, data, settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_VARIANT_FORMATS, settings.IMAGE_VARIANT_QUALITY
+    )
+
+
+def render_bounded(data: bytes, max_edge: int, fmt: str = "webp", quality: int = 80) -> bytes:
+    """Return the image scaled down to fit max_edge (never up) and re-encoded as fmt."""
+    return _run(_render_bounded, data, max_edge, fmt, quality)
+
+
+def save_variants(name: str) -> list[ImageVariant]:
+    """Render variants of a stored image and save them next to it under ``variants/``."""
+    with default_storage.open(name, "rb") as f:
+        data = f.read()
+
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    variants: list[ImageVariant] = []
+    for width, height, fmt, content in render_variants(data):
+        variant_name = posixpath.join(directory, "variants", f"{stem}_{width}w.{fmt}")
+        variant_name = default_storage.save(variant_name, ContentFile(content))
+        variants.append({"name": variant_name, "width": width, "height": height, "format": fmt})
+    logger.debug(f"Saved {len(variants)} variants of {name}")
+    return variants
+
+
+def delete_variants(variants: list[ImageVariant]) -> None:
+    for variant in variants:
+        default_storage.delete(variant["name"])
+
+
+def srcsets(variants: list[ImageVariant]) -> list[dict[str, str]]:
+    """Group variants into one ``{"type", "srcset"}`` source per format, in the configured preference order."""
+    by_format: dict[str, list[str]] = {}
+    for variant in sorted(variants, key=lambda v: v["width"]):
+        by_format.setdefault(variant["format"], []).append(
+            f"{default_storage.url(variant['name'])} {variant['width']}w"
+        )
+    return [
+        {"type": CONTENT_TYPES.get(fmt, f"image/{fmt}"), "srcset": ", ".join(by_format[fmt])}
+        for fmt in settings.IMAGE_VARIANT_FORMATS
+        if fmt in by_format
+    ]
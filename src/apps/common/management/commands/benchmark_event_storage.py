@@ -0,0 +1,80 @@
+import statistics
+import time
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+from django_eventstream.models import Event, EventCounter
+
+from apps.common.eventstorage import RedisStreamStorage
+
+BACKENDS = {
+    "model": "django_eventstream.storage.DjangoModelStorage",
+    "redis-stream": "apps.common.eventstorage.RedisStreamStorage",
+}
+
+
+class Command(BaseCommand):
+    help = "Compare SSE event storage backends: append latency at a target rate, then Last-Event-ID replay latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=10_000, help="Events to append per backend")
+        parser.add_argument("--rate", type=int, default=10_000, help="Target events per minute (0 for unthrottled)")
+        parser.add_argument("--channels", type=int, default=20, help="Channels to spread events across")
+        parser.add_argument("--replays", type=int, default=200, help="Replays of the last 50 events to time")
+        parser.add_argument("--backend", choices=BACKENDS, nargs="+", default=list(BACKENDS))
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'backend':>13} {'events/min':>11} {'append p50':>11} {'append p99':>11} "
+            f"{'replay p50':>11} {'replay p99':>11}   (ms)"
+        )
+        for name in options["backend"]:
+            storage = import_string(BACKENDS[name])()
+            channels = [f"benchmark-{uuid4()}" for _ in range(options["channels"])]
+            try:
+                appends, elapsed = self._append(storage, channels, options["events"], options["rate"])
+                replays = self._replay(storage, channels, options["replays"])
+            finally:
+                self._cleanup(storage, channels)
+
+            self.stdout.write(
+                f"{name:>13} {len(appends) / elapsed * 60:>11.0f} {self._pct(appends, 50):>11.3f} "
+                f"{self._pct(appends, 99):>11.3f} {self._pct(replays, 50):>11.3f} {self._pct(replays, 99):>11.3f}"
+            )
+
+    def _append(self, storage, channels, count, rate):
+        interval = 60 / rate if rate else 0
+        latencies = []
+        started = time.perf_counter()
+        for i in range(count):
+            if interval:
+                # Pace appends on a fixed schedule so a slow backend shows up as a lower achieved rate
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            t0 = time.perf_counter()
+            storage.append_event(channels[i % len(channels)], "list_pages", '""')
+            latencies.append((time.perf_counter() - t0) * 1000)
+        return latencies, time.perf_counter() - started
+
+    def _replay(self, storage, channels, count):
+        latencies = []
+        for i in range(count):
+            channel = channels[i % len(channels)]
+            last_id = max(storage.get_current_id(channel) - 50, 1)
+            t0 = time.perf_counter()
+            storage.get_events(channel, last_id, limit=100)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        return latencies
+
+    def _cleanup(self, storage, channels):
+        if isinstance(storage, RedisStreamStorage):
+            storage.redis.delete(*(key for channel in channels for key in storage._keys(channel)))
+        else:
+            Event.objects.filter(channel__in=channels).delete()
+            EventCounter.objects.filter(name__in=channels).delete()
+
+    @staticmethod
+    def _pct(values, percentile):
+        return statistics.quantiles(values, n=100)[percentile - 1] if len(values) > 1 else values[0]
@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django_eventstream.utils import get_channelmanager
+
+from apps.common.sse import sign_channel_token
+from apps.stories.models import Story
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure SSE channel authorization cost per connect, with and without channel tokens, under added DB latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connects", type=int, default=200, help="Connects to simulate per scenario")
+        parser.add_argument(
+            "--db-latency-ms", type=float, nargs="+", default=[0, 5, 20], help="Latency added per query"
+        )
+
+    def handle(self, *args, **options):
+        channelmanager = get_channelmanager()
+        factory = RequestFactory()
+        self.stdout.write(f"{'latency':>8} {'mode':>6} {'ms/connect':>11} {'queries/connect':>16}")
+
+        with transaction.atomic():
+            user = get_user_model().objects.create(username=f"benchmark-{time.time_ns()}")
+            story = Story.objects.create(user=user, title="Benchmark")
+            url = reverse("stories:events", kwargs={"story_uuid": story.uuid})
+            view_kwargs = resolve(url).kwargs
+            token = sign_channel_token(user, [story.channel])
+
+            for latency_ms in options["db_latency_ms"]:
+
+                def delay(execute, sql, params, many, context, latency=latency_ms / 1000):
+                    time.sleep(latency)
+                    return execute(sql, params, many, context)
+
+                for mode, query in (("db", {}), ("token", {"token": token})):
+                    with connection.execute_wrapper(delay), CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        for _ in range(options["connects"]):
+                            request = factory.get(url, query)
+                            request.user = get_user_model()(pk=user.pk, username=user.username)
+                            channels = channelmanager.get_channels_for_request(request, view_kwargs)
+                            assert all(channelmanager.can_read_channel(request.user, c) for c in channels)
+                        elapsed_ms = (time.perf_counter() - started) * 1000
+
+                    connects = options["connects"]
+                    self.stdout.write(
+                        f"{latency_ms:>8g} {mode:>6} {elapsed_ms / connects:>11.3f} "
+                        f"{len(ctx.captured_queries) / connects:>16.2f}"
+                    )
+            transaction.set_rollback(True)
@@ -0,0 +1,90 @@
+"""
+Resolve media references without HTTP round trips to our own server.
+
+Artifact and page-image URLs we hand out (absolute under BASE_URL, or relative under MEDIA_URL) map straight back
+to a name in the default storage, so they are read from, or linked through, the storage backend. Anything else is
+fetched with a streaming download bounded by MEDIA_FETCH_TIMEOUT and MEDIA_FETCH_MAX_BYTES.
+"""
+
+import logging
+import mimetypes
+import posixpath
+import time
+from urllib.parse import unquote, urlparse
+
+import requests
+from django.conf import settings
+from django.core.files.storage import default_storage
+from pydantic_ai.messages import BinaryContent, ImageUrl
+
+logger = logging.getLogger(__name__)
+
+FETCH_CHUNK_SIZE = 64 * 1024
+
+
+class MediaTooLarge(ValueError):
+    pass
+
+
+def storage_name_for_url(url: str) -> str | None:
+    """Return the default-storage name behind one of our own media URLs, or None for anything else."""
+    parsed = urlparse(url)
+    if parsed.netloc and parsed.netloc != urlparse(settings.BASE_URL).netloc:
+        return None
+    if parsed.scheme not in ("", "http", "https"):
+        return None
+
+    media_prefix = "/" + urlparse(settings.MEDIA_URL).path.strip("/") + "/"
+    path = unquote(parsed.path)
+    if not path.startswith(media_prefix):
+        return None
+    name = posixpath.normpath(path[len(media_prefix) :])
+    if name.startswith(("../", "/")) or name in (".", ".."):
+        return None
+    return name
+
+
+def read_media(url: str) -> bytes:
+    """Return the bytes behind a URL, from storage for our own media and via a bounded fetch otherwise."""
+    name = storage_name_for_url(url)
+    if name is not None:
+        with default_storage.open(name, "rb") as f:
+            return f.read()
+    return fetch_url(url)
+
+
+def fetch_url(url: str, max_bytes: int | None = None, timeout: float | None = None) -> bytes:
+    """Stream an external URL, giving up past max_bytes or after timeout seconds in total."""
+    max_bytes = max_bytes or settings.MEDIA_FETCH_MAX_BYTES
+    timeout = timeout or settings.MEDIA_FETCH_TIMEOUT
+    deadline = time.monotonic() + timeout
+
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise MediaTooLarge(f"{url} is {declared} bytes, over the {max_bytes} byte limit")
+
+        chunks = []
+        received = 0
+        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+            received += len(chunk)
+            if received > max_bytes:
+                raise MediaTooLarge(f"{url} exceeded the {max_bytes} byte limit")
+            if time.monotonic() > deadline:
+                raise requests.Timeout(f"{url} took longer than {timeout}s to download")
+            chunks.append(chunk)
+
+    logger.debug(f"Fetched {received} bytes from {url}")
+    return b"".join(chunks)
+
+
+def model_media(name: str) -> BinaryContent | ImageUrl:
+    """Build model input for a stored file: a link when storage serves it from elsewhere, else its bytes."""
+    url = default_storage.url(name)
+    if urlparse(url).scheme in ("http", "https") and storage_name_for_url(url) is None:
+        # Remote storage (e.g. a bucket) serves the file itself; the model provider can fetch it there
+        return ImageUrl(url=url)
+    media_type, _ = mimetypes.guess_type(name)
+    with default_storage.open(name, "rb") as f:
+        return BinaryContent(data=f.read(), media_type=media_type or "application/octet-stream")
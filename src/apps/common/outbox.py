@@ -0,0 +1,242 @@
+"""
+Transactional outbox for SSE events.
+
+Mutations queue events instead of sending them. Events queued inside a transaction are held until it commits
+(and dropped if it rolls back); events queued inside a ``batch_events()`` scope, such as an agent tool call, are
+held until the scope exits. Either way identical (channel, event) pairs collapse into one, and the batch goes out
+in a single pipelined Redis write.
+
+Batches then pass through a per-(channel, event) coalescing window (``SSE_COALESCE_WINDOW`` seconds): the first
+event in a window is sent immediately, later ones are folded into a single trailing event at the end of the
+window, so a burst of edits across several transactions still costs each listening tab one refresh per element.
+An event can bring its own window, e.g. streamed reply text, which is already throttled to its own interval.
+
+Event data may be a callable returning the payload. It is called once, when the event is actually published, so
+pre-rendered fragments are rendered from committed state and only for the events that survive deduplication.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django_eventstream.event import Event
+from django_eventstream.utils import get_channelmanager, get_storage, publish_event
+
+logger = logging.getLogger(__name__)
+
+EventKey = tuple[str, str]
+EventData = str | Callable[[], str]
+
+_current_batch: ContextVar["Outbox | None"] = ContextVar("sse_outbox_batch", default=None)
+
+
+class Outbox:
+    """An ordered set of pending events, keyed by (channel, event type); the latest data wins."""
+
+    def __init__(self):
+        self.events: dict[EventKey, EventData] = {}
+        self.windows: dict[EventKey, float] = {}
+
+    def add(self, channel: str, event_type: str, data: EventData, window: float | None = None) -> None:
+        self.events[(channel, event_type)] = data
+        if window is not None:
+            self.windows[(channel, event_type)] = window
+
+    def update(self, other: "Outbox") -> None:
+        self.events.update(other.events)
+        self.windows.update(other.windows)
+
+    def flush(self) -> None:
+        events, self.events = self.events, {}
+        windows, self.windows = self.windows, {}
+        if events:
+            coalescer.submit(events, windows)
+
+
+class Coalescer:
+    """Leading and trailing throttle per (channel, event) over the configured window."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_sent: dict[EventKey, float] = {}
+        self._trailing: dict[EventKey, EventData] = {}
+        self._timers: dict[EventKey, threading.Timer] = {}
+
+    @property
+    def window(self) -> float:
+        return getattr(settings, "SSE_COALESCE_WINDOW", 0)
+
+    def submit(self, events: dict[EventKey, EventData], windows: dict[EventKey, float] | None = None) -> None:
+        """Publish or hold events; windows overrides SSE_COALESCE_WINDOW for the keys it lists."""
+        default = self.window
+        windows = windows or {}
+        if default <= 0 and not any(window > 0 for window in windows.values()):
+            publish_events(events)
+            return
+
+        now = time.monotonic()
+        ready = {}
+        with self._lock:
+            for key, data in events.items():
+                window = windows.get(key, default)
+                if window <= 0:
+                    ready[key] = data
+                    continue
+                elapsed = now - self._last_sent.get(key, float("-inf"))
+                if elapsed >= window and key not in self._timers:
+                    self._last_sent[key] = now
+                    ready[key] = data
+                else:
+                    self._trailing[key] = data
+                    if key not in self._timers:
+                        timer = threading.Timer(window - elapsed, self._send_trailing, args=(key,))
+                        timer.daemon = True
+                        self._timers[key] = timer
+                        timer.start()
+        if ready:
+            publish_events(ready)
+
+    def _send_trailing(self, key: EventKey) -> None:
+        with self._lock:
+            self._timers.pop(key, None)
+            data = self._trailing.pop(key, None)
+            if data is None:
+                return
+            self._last_sent[key] = time.monotonic()
+        try:
+            publish_events({key: data})
+        except Exception:
+            logger.exception(f"Failed to publish trailing SSE event {key}")
+        finally:
+            # This runs on a throwaway timer thread; rendering pushed fragments opens connections nothing else closes
+            connections.close_all()
+
+    def reset(self) -> None:
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._trailing.clear()
+            self._last_sent.clear()
+
+
+coalescer = Coalescer()
+
+
+def queue_event(channel: str, event_type: str, data="", json_encode: bool = True, window: float | None = None) -> None:
+    """Queue an SSE event for delivery once the current batch or transaction completes.
+
+    Outside of both, the event is sent right away (still subject to the coalescing window, or to window when
+    given). Callable data is used as-is and must return the encoded payload.
+    """
+    if json_encode and not callable(data):
+        data = json.dumps(data, cls=DjangoJSONEncoder)
+
+    outbox = _current_batch.get()
+    if outbox is None:
+        outbox = _transaction_outbox()
+    if outbox is None:
+        coalescer.submit({(channel, event_type): data}, None if window is None else {(channel, event_type): window})
+        return
+    outbox.add(channel, event_type, data, window)
+
+
+def _transaction_outbox() -> Outbox | None:
+    """Return the outbox bound to the open transaction, registering its on_commit flush on first use."""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+    # The outbox lives in the connection's on_commit queue, so a rollback discards it along with the transaction
+    for _sids, func, _robust in connection.run_on_commit:
+        if isinstance(getattr(func, "__self__", None), Outbox):
+            return func.__self__
+    outbox = Outbox()
+    transaction.on_commit(outbox.flush, robust=True)
+    return outbox
+
+
+@contextmanager
+def batch_events():
+    """Hold events queued in this scope and send them, deduplicated, when it exits.
+
+    Nested scopes share the outermost batch. If a transaction is open on exit, the batch joins its outbox.
+    """
+    if _current_batch.get() is not None:
+        yield
+        return
+    outbox = Outbox()
+    token = _current_batch.set(outbox)
+    try:
+        yield
+    finally:
+        _current_batch.reset(token)
+        if outbox.events:
+            pending = _transaction_outbox()
+            if pending is None:
+                outbox.flush()
+            else:
+                pending.update(outbox)
+
+
+def publish_events(
+    events: dict[EventKey, EventData], skip_user_ids: list | None = None, async_publish: bool = True
+) -> None:
+    """Send a batch of events the way django_eventstream.send_event does, with one Redis round trip.
+
+    skip_user_ids and async_publish are passed on to the GRIP publish as send_event passes them.
+    """
+    from django_eventstream.eventstream import redis_client
+    from django_eventstream.views import get_listener_manager
+
+    storage = get_storage()
+    channelmanager = get_channelmanager()
+
+    resolved = [
+        (channel, event_type, data() if callable(data) else data) for (channel, event_type), data in events.items()
+    ]
+    reliable = [bool(storage) and channelmanager.is_channel_reliable(channel) for channel, _type, _data in resolved]
+    to_store = [event for event, is_reliable in zip(resolved, reliable, strict=True) if is_reliable]
+    if hasattr(storage, "append_events"):
+        # Storage that can batch (RedisStreamStorage) stores the whole batch in one round trip
+        stored = iter(storage.append_events(to_store))
+    else:
+        stored = iter([storage.append_event(*event) for event in to_store])
+
+    published = []
+    for (channel, event_type, data), is_reliable in zip(resolved, reliable, strict=True):
+        if is_reliable:
+            e = next(stored)
+            pub_id, pub_prev_id = str(e.id), str(e.id - 1)
+        else:
+            e = Event(channel, event_type, data)
+            pub_id = pub_prev_id = None
+        published.append((e, pub_id, pub_prev_id))
+
+    if redis_client:
+        pipe = redis_client.pipeline(transaction=False)
+        for e, _pub_id, _pub_prev_id in published:
+            pipe.publish("events_channel", json.dumps({"channel": e.channel, "event_type": e.type, "data": e.data}))
+        pipe.execute()
+    else:
+        listener_manager = get_listener_manager()
+        for e, _pub_id, _pub_prev_id in published:
+            listener_manager.add_to_queues(e.channel, e)
+
+    for e, pub_id, pub_prev_id in published:
+        publish_event(
+            e.channel,
+            e.type,
+            e.data,
+            pub_id,
+            pub_prev_id,
+            skip_user_ids=skip_user_ids or [],
+            blocking=not async_publish,
+        )
+    logger.debug(f"Published {len(published)} SSE events")
@@ -1,13 +1,84 @@
+import time
+
+from django.conf import settings
+from django.core import checks, signing
+from django.core.cache import caches
 from django.template.loader import render_to_string
-from django_eventstream import send_event
 from django_eventstream.channelmanager import DefaultChannelManager
 
 from apps.ai.models import Conversation
+from apps.common.outbox import queue_event
 from apps.stories.models import Story
 
+CHANNEL_TOKEN_SALT = "apps.common.sse.channel-token"
+# Revocation markers must be visible to every web process, so they share the snapshot cache alias. That alias has
+# to be a shared cache (Redis) wherever more than one process serves SSE: with the default LocMemCache a revocation
+# is only seen by the process that made it, and the others accept revoked tokens until SSE_CHANNEL_TOKEN_MAX_AGE
+# runs out (see check_revocation_cache)
+REVOCATION_CACHE_ALIAS = "stories"
+
+
+def _revocation_key(channel: str) -> str:
+    return f"sse-channel-revoked:{channel}"
+
+
+def sign_channel_token(user, channels) -> str:
+    """Issue a short-lived token granting this user read access to the given channels."""
+    payload = {"u": user.pk, "c": sorted(channels), "t": time.time()}
+    return signing.dumps(payload, salt=CHANNEL_TOKEN_SALT, compress=True)
+
+
+def revoke_channel(channel: str) -> None:
+    """Invalidate every token issued for a channel up to now, e.g. when its story is deleted or transferred.
+
+    Only processes sharing the REVOCATION_CACHE_ALIAS cache see the revocation.
+    """
+    caches[REVOCATION_CACHE_ALIAS].set(_revocation_key(channel), time.time(), settings.SSE_CHANNEL_TOKEN_MAX_AGE)
+
+
+def check_revocation_cache(app_configs, **kwargs) -> list[checks.CheckMessage]:
+    """Warn when channel token revocations are kept in a per-process cache outside development."""
+    backend = settings.CACHES.get(REVOCATION_CACHE_ALIAS, {}).get("BACKEND", "")
+    if settings.DEBUG or not backend.endswith("LocMemCache"):
+        return []
+    return [
+        checks.Warning(
+            f"SSE channel token revocations are stored in the per-process {backend} cache",
+            hint=f"Point the '{REVOCATION_CACHE_ALIAS}' cache at Redis so every process sees revoked channels.",
+            id="common.W001",
+        )
+    ]
+
+
+def _is_revoked(channel: str, issued_at: float) -> bool:
+    revoked_at = caches[REVOCATION_CACHE_ALIAS].get(_revocation_key(channel))
+    return revoked_at is not None and issued_at <= revoked_at
+
 
 class ChannelManager(DefaultChannelManager):
+    def get_channels_for_request(self, request, view_kwargs):
+        channels = super().get_channels_for_request(request, view_kwargs)
+        token = request.GET.get("token")
+        user = getattr(request, "user", None)
+        if token and user is not None and user.is_authenticated:
+            # The same user object is later passed to can_read_channel, so the grant travels with it
+            user.sse_channel_grants = self._verify_token(token, user, channels)
+        return channels
+
+    def _verify_token(self, token, user, channels) -> dict[str, float]:
+        try:
+            payload = signing.loads(token, salt=CHANNEL_TOKEN_SALT, max_age=settings.SSE_CHANNEL_TOKEN_MAX_AGE)
+        except signing.BadSignature:
+            return {}
+        if payload.get("u") != user.pk:
+            return {}
+        return {channel: payload["t"] for channel in channels if channel in payload.get("c", ())}
+
     def can_read_channel(self, user, channel, request=None):
+        # A verified channel token answers without a query; once revoked, fall back to checking ownership
+        issued_at = getattr(user, "sse_channel_grants", {}).get(channel)
+        if issued_at is not None and not _is_revoked(channel, issued_at):
+            return True
         # allow "user-<id>" channels
         if channel.startswith("user-"):
             return bool(user and user.is_authenticated and channel.startswith(f"user-{user.id}"))
@@ -26,9 +97,9 @@ class ChannelManager(DefaultChannelManager):
         return False
 
 
-def send_template(channel, event, template, context):
+def send_template(channel, event, template, context, window: float | None = None):
     rendered = render_to_string(template, context)
-    send_event(channel, event, rendered, json_encode=False)
+    queue_event(channel, event, rendered, json_encode=False, window=window)
 
 
 def send_oob(channel, template: str, context: dict | None = None):
@@ -38,4 +109,4 @@ def send_oob(channel, template: str, context: dict | None = None):
 
 
 def update_element(channel, event, template, context):
-    send_event(channel, event, "")
+    queue_event(channel, event, "")
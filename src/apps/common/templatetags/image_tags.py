@@ -0,0 +1,11 @@
+from django import template
+
+from apps.common.images import srcsets
+
+register = template.Library()
+
+
+@register.filter
+def image_sources(variants) -> list[dict[str, str]]:
+    """Return ``<source>`` attributes (type, srcset) for stored image variants, best format first."""
+    return srcsets(variants or [])
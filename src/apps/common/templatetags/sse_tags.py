@@ -0,0 +1,31 @@
+from urllib.parse import urlencode
+
+from django import template
+from django.conf import settings
+from django.urls import resolve, reverse
+from django_eventstream.channelmanager import DefaultChannelManager
+
+from apps.common.sse import sign_channel_token
+
+register = template.Library()
+
+
+@register.simple_tag
+def sse_push_fragments() -> bool:
+    """Return whether SSE events carry pre-rendered fragments to swap in (SSE_PUSH_FRAGMENTS)."""
+    return settings.SSE_PUSH_FRAGMENTS
+
+
+@register.simple_tag(takes_context=True)
+def sse_url(context, viewname, **kwargs):
+    """Reverse an eventstream URL and append a signed token for its channels, so connects skip the DB check.
+
+    Without an authenticated request in the context the plain URL is returned and access is checked per connect.
+    """
+    url = reverse(viewname, kwargs=kwargs)
+    request = context.get("request")
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return url
+    channels = DefaultChannelManager().get_channels_for_request(request, resolve(url).kwargs)
+    return f"{url}?{urlencode({'token': sign_channel_token(user, channels)})}"
@@ -0,0 +1,149 @@
+"""Tests for the common app."""
+
+import shutil
+import tempfile
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+import redis
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, override_settings
+from django_eventstream.storage import EventDoesNotExist
+from pydantic_ai.messages import BinaryContent
+
+from apps.common.eventstorage import RedisStreamStorage
+from apps.common.media import MediaTooLarge, fetch_url, model_media, read_media, storage_name_for_url
+from apps.common.outbox import publish_events
+
+
+def _redis_available() -> bool:
+    try:
+        return RedisStreamStorage().redis.ping()
+    except redis.RedisError:
+        return False
+
+
+class RedisStreamStorageTest(SimpleTestCase):
+    """Test the Redis Streams event storage; needs the Redis server from EVENTSTREAM_REDIS."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if not _redis_available():
+            cls.tearDownClass()
+            raise cls.skipException(f"Redis is not reachable at {settings.EVENTSTREAM_REDIS}")
+
+    def setUp(self):
+        """Set up a throwaway channel."""
+        self.storage = RedisStreamStorage()
+        self.channel = f"test-{uuid4()}"
+        self.addCleanup(self.storage.redis.delete, *self.storage._keys(self.channel))
+
+    def test_ids_are_sequential_per_channel(self):
+        """Test that appends get consecutive integer ids, singly and in a pipelined batch."""
+        first = self.storage.append_event(self.channel, "list_pages", '""')
+        batch = self.storage.append_events(
+            [(self.channel, "get_story_title", '""'), (self.channel, "list_pages", "x")]
+        )
+
+        self.assertEqual([first.id, *(e.id for e in batch)], [1, 2, 3])
+        self.assertEqual(self.storage.get_current_id(self.channel), 3)
+        self.assertEqual(self.storage.get_current_id(f"test-{uuid4()}"), 0)
+
+    def test_replay_after_last_event_id(self):
+        """Test that a reconnect receives the events after its Last-Event-ID, in order and within the limit."""
+        for i in range(5):
+            self.storage.append_event(self.channel, f"event-{i}", f'"{i}"')
+
+        events = self.storage.get_events(self.channel, 2, limit=2)
+        self.assertEqual([(e.id, e.type, e.data) for e in events], [(3, "event-2", '"2"'), (4, "event-3", '"3"')])
+        self.assertEqual(len(self.storage.get_events(self.channel, 0)), 5)
+        self.assertEqual(self.storage.get_events(self.channel, 5), [])
+
+    @override_settings(EVENTSTREAM_STREAM_MAXLEN=10)
+    def test_trimmed_or_unknown_ids_reset(self):
+        """Test that ids trimmed from the capped stream, or ahead of it, raise EventDoesNotExist."""
+        storage = RedisStreamStorage()
+        for _ in range(500):
+            storage.append_event(self.channel, "list_pages", '""')
+
+        with self.assertRaises(EventDoesNotExist) as raised:
+            storage.get_events(self.channel, 1)
+        self.assertEqual(raised.exception.current_id, 500)
+        with self.assertRaises(EventDoesNotExist):
+            storage.get_events(self.channel, 501)
+        self.assertLess(storage.redis.xlen(storage._keys(self.channel)[1]), 500)
+
+    @override_settings(EVENTSTREAM_STREAM_TTL=60)
+    def test_keys_expire(self):
+        """Test that both channel keys carry the configured TTL."""
+        storage = RedisStreamStorage()
+        storage.append_event(self.channel, "list_pages", '""')
+        for key in storage._keys(self.channel):
+            self.assertTrue(0 < storage.redis.ttl(key) <= 60)
+
+
+class PublishEventsTest(SimpleTestCase):
+    """Test that batched publishing hands send_event's options on to the GRIP publish."""
+
+    @patch("django_eventstream.eventstream.redis_client", None)
+    @patch("django_eventstream.views.get_listener_manager", MagicMock())
+    @patch("apps.common.outbox.get_storage", MagicMock(return_value=None))
+    @patch("apps.common.outbox.publish_event")
+    def test_skip_user_ids_and_async_publish_are_passed_on(self, publish_event):
+        """Test that skip_user_ids and a blocking publish reach every event in the batch."""
+        publish_events({("story-1", "list_pages"): '""', ("story-1", "get_story_title"): '""'}, [7], False)
+
+        self.assertEqual(publish_event.call_count, 2)
+        for call in publish_event.call_args_list:
+            self.assertEqual(call.kwargs, {"skip_user_ids": [7], "blocking": True})
+
+
+@override_settings(BASE_URL="https://sprout.example", MEDIA_URL="media/")
+class MediaResolverTest(SimpleTestCase):
+    """Test resolution of media URLs without loopback HTTP."""
+
+    def setUp(self):
+        """Point the default storage at a temporary directory."""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.name = default_storage.save("artifacts/picture.png", ContentFile(b"png-bytes"))
+
+    def test_own_urls_map_to_storage_names(self):
+        """Test that absolute and relative media URLs resolve, while other hosts and traversal don't."""
+        self.assertEqual(storage_name_for_url(f"https://sprout.example/media/{self.name}"), self.name)
+        self.assertEqual(storage_name_for_url(f"/media/{self.name}"), self.name)
+        self.assertEqual(storage_name_for_url("/media/page_images/a%20b.png"), "page_images/a b.png")
+        self.assertIsNone(storage_name_for_url(f"https://elsewhere.example/media/{self.name}"))
+        self.assertIsNone(storage_name_for_url("/static/logo.png"))
+        self.assertIsNone(storage_name_for_url("/media/../secrets.txt"))
+
+    def test_own_media_is_read_without_http(self):
+        """Test that our own media is read from storage and tools get bytes instead of a loopback URL."""
+        with patch("apps.common.media.requests.get", side_effect=AssertionError("HTTP used")):
+            self.assertEqual(read_media(f"https://sprout.example/media/{self.name}"), b"png-bytes")
+            content = model_media(self.name)
+
+        self.assertIsInstance(content, BinaryContent)
+        self.assertEqual((content.data, content.media_type), (b"png-bytes", "image/png"))
+
+    def test_external_fetch_is_bounded(self):
+        """Test that external downloads stream with a timeout and stop past the size cap."""
+        response = MagicMock(headers={})
+        response.__enter__.return_value = response
+        response.iter_content.return_value = [b"x" * 600, b"x" * 600]
+        with patch("apps.common.media.requests.get", return_value=response) as get:
+            self.assertEqual(len(fetch_url("https://cdn.example/a.png", max_bytes=2000, timeout=5)), 1200)
+            get.assert_called_with("https://cdn.example/a.png", stream=True, timeout=5)
+
+            with self.assertRaises(MediaTooLarge):
+                fetch_url("https://cdn.example/a.png", max_bytes=1000)
+
+            response.headers = {"Content-Length": "5000"}
+            with self.assertRaises(MediaTooLarge):
+                fetch_url("https://cdn.example/a.png", max_bytes=1000)
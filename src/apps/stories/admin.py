@@ -1,25 +1,30 @@
 from django.contrib import admin
 from django.urls import reverse
 from django.utils.html import format_html
-from ordered_model.admin import OrderedInlineModelAdminMixin, OrderedModelAdmin, OrderedStackedInline
 
 from .models import Page, Story
+from .services import StoryService
 
 
-class PageInline(OrderedStackedInline):
+def story_changed(story_uuid) -> None:
+    """Admin edits save models directly: move the story to a new version and refresh its listening tabs."""
+    service = StoryService(story_uuid)
+    service.bump_version()
+    service.refresh_story(None)
+
+
+class PageInline(admin.StackedInline):
     model = Page
     fields = (
         "content",
         "image_text",
         "image",
-        "move_up_down_links",
     )
-    readonly_fields = ("move_up_down_links",)
     ordering = ("order",)
     extra = 1
 
 
-class StoryAdmin(OrderedInlineModelAdminMixin, admin.ModelAdmin):
+class StoryAdmin(admin.ModelAdmin):
     list_display = ("__str__", "uuid", "user", "conversation_link", "created_at")
     inlines = (PageInline,)
 
@@ -31,12 +36,36 @@ class StoryAdmin(OrderedInlineModelAdminMixin, admin.ModelAdmin):
         title = obj.conversation.title or obj.conversation.uuid
         return format_html('<a href="{}">{}</a>', url, title)
 
+    def save_related(self, request, form, formsets, change):
+        # Runs after the story and its inline pages are saved, so one bump covers both
+        super().save_related(request, form, formsets, change)
+        story_changed(form.instance.uuid)
+
 
 admin.site.register(Story, StoryAdmin)
 
 
-class PageAdmin(OrderedModelAdmin):
-    list_display = ("__str__", "story__user", "move_up_down_links")
+class PageAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "story__user")
+
+    def get_queryset(self, request):
+        # Page numbers come from the window annotation rather than a count per row
+        return super().get_queryset(request).numbered()
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        story_changed(obj.story.uuid)
+
+    def delete_model(self, request, obj):
+        story_uuid = obj.story.uuid
+        super().delete_model(request, obj)
+        story_changed(story_uuid)
+
+    def delete_queryset(self, request, queryset):
+        story_uuids = set(queryset.values_list("story__uuid", flat=True))
+        super().delete_queryset(request, queryset)
+        for story_uuid in story_uuids:
+            story_changed(story_uuid)
 
 
 admin.site.register(Page, PageAdmin)
@@ -1,15 +1,19 @@
 from typing import Literal
 from uuid import UUID
 
+from django.db import transaction
+from django.db.models import F
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils import timezone
 from django_htmx.http import push_url
 from ninja import File, ModelSchema, Router, Schema
 from ninja.files import UploadedFile
 
 from apps.common.htmx import append_template, update_title
 from apps.stories.models import Page, Story
+from apps.stories.services import StoryService
 
 router = Router()
 
@@ -94,9 +98,11 @@ def get_story_description(request, story_uuid: UUID):
 @router.patch("/{story_uuid}", response=StoryOut)
 def update_story(request, story_uuid: UUID, payload: StoryIn):
     story = get_object_or_404(Story, uuid=story_uuid)
-    for attr, value in payload.dict(exclude_unset=True).items():
+    changes = payload.dict(exclude_unset=True)
+    for attr, value in changes.items():
         setattr(story, attr, value)
-    story.save()
+    # One UPDATE, so the version is bumped from its current value rather than the one read above
+    Story.objects.filter(pk=story.pk).update(**changes, version=F("version") + 1, updated_at=timezone.now())
 
     if request.htmx:
         # TODO: Add logic to detect autozave vs a generic update
@@ -196,7 +202,9 @@ def get_page_image(request, story_uuid: UUID, page_uuid: UUID):
 @router.post("/{story_uuid}/pages", response=PageOut, tags=["Pages"])
 def create_page(request, story_uuid: UUID, payload: PageIn):
     story = get_object_or_404(Story, uuid=story_uuid)
-    page = Page.objects.create(story=story, **payload.dict())
+    with transaction.atomic():
+        page = Page.objects.create(story=story, **payload.dict())
+        StoryService(story.uuid).bump_version()
 
     if request.htmx:
         # Get new page and append OOB new page button
@@ -205,11 +213,11 @@ def create_page(request, story_uuid: UUID, payload: PageIn):
         response["HX-Trigger"] = "create-page"
 
         # Add OOB new button
-        if page.order == 0:
+        if story.page_count == 1:
             response = append_template(response, "cotton/stories/page/new_page_button.html", context, oob=True)
 
         # Update OOB move buttons
-        for oob_page in story.pages.all():
+        for oob_page in story.pages.numbered():
             context["page"] = oob_page
             response = append_template(response, "cotton/stories/page/move_page_buttons.html", context, oob=True)
         return response
@@ -224,7 +232,9 @@ def update_page(request, story_uuid: UUID, page_uuid: UUID, payload: PageIn):
     # Update page fields
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(page, field, value)
-    page.save()
+    with transaction.atomic():
+        page.save()
+        StoryService(story.uuid).bump_version()
 
     if request.htmx:
         # TODO: Add logic to detect autozave vs a generic update
@@ -238,7 +248,9 @@ def update_page(request, story_uuid: UUID, page_uuid: UUID, payload: PageIn):
 def delete_page(request, story_uuid: UUID, page_uuid: UUID):
     story = get_object_or_404(Story, uuid=story_uuid)
     page = get_object_or_404(Page, uuid=page_uuid, story=story)
-    page.delete()
+    with transaction.atomic():
+        page.delete()
+        StoryService(story.uuid).bump_version()
 
     context = {"story": story}
     if request.htmx:
@@ -246,7 +258,7 @@ def delete_page(request, story_uuid: UUID, page_uuid: UUID):
         response["HX-Trigger"] = "delete-page"
         # Update OOB
         response = append_template(response, "cotton/stories/page/new_page_button.html", context, oob=True)
-        for oob_page in story.pages.all():
+        for oob_page in story.pages.numbered():
             context["page"] = oob_page
             response = append_template(response, "cotton/stories/page/move_page_buttons.html", context, oob=True)
         return response
@@ -259,10 +271,12 @@ def move_page(request, story_uuid: UUID, page_uuid: UUID, direction: Literal["up
     story = get_object_or_404(Story, uuid=story_uuid)
     page = get_object_or_404(Page, uuid=page_uuid, story=story)
 
-    if direction == "up":
-        page.up()
-    else:
-        page.down()
+    with transaction.atomic():
+        if direction == "up":
+            page.up()
+        else:
+            page.down()
+        StoryService(story.uuid).bump_version()
 
     if request.htmx:
         return render(request, "cotton/stories/page/list.html", {"story": story})
@@ -279,12 +293,16 @@ def upload_page_image(request, story_uuid: UUID, page_uuid: UUID, file: File[Upl
     if file.content_type not in allowed_types or file.size > 10 * 1024 * 1024:
         return HttpResponse("Invalid file", status=422)
     page.image = file
-    page.save()
+    with transaction.atomic():
+        page.save()
+        StoryService(story.uuid).bump_version()
 
     if request.htmx:
-        # Return the updated image component with all required context
+        # Return the updated image component with all required context; variants follow over SSE once rendered
         context = {
             "image": page.image,
+            "width": page.image_width,
+            "height": page.image_height,
             "upload_url": request.path,
             "delete_url": request.path,
         }
@@ -297,7 +315,9 @@ def delete_page_image(request, story_uuid: UUID, page_uuid: UUID):
     story = get_object_or_404(Story, uuid=story_uuid)
     page = get_object_or_404(Page, uuid=page_uuid, story=story)
     page.image = None
-    page.save()
+    with transaction.atomic():
+        page.save()
+        StoryService(story.uuid).bump_version()
 
     if request.htmx:
         # Return the updated image component with all required context
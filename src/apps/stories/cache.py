@@ -0,0 +1,145 @@
+"""
+Versioned cache of serialized story snapshots, and a content-addressed cache of page images prepared for models.
+
+Snapshots are keyed by story UUID plus the story's version, which every mutation bumps. A reader always
+looks up the current version first, so it can never be served a snapshot older than the data it would
+have read from the database, and stale entries simply age out. The cache alias is Redis-backed when
+configured, so the web tier and Celery workers share entries; otherwise it falls back to local memory.
+
+Context images are keyed by the image's content hash and the rendition settings, so a page image is read and
+downscaled once and every later story-context request reuses the stored bytes.
+"""
+
+import logging
+from threading import Lock
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+
+from apps.common.images import render_bounded
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CACHE_ALIAS = "stories"
+SNAPSHOT_TIMEOUT = 60 * 60
+CONTEXT_IMAGE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+class SnapshotCache:
+    def __init__(self, alias: str = SNAPSHOT_CACHE_ALIAS, timeout: int = SNAPSHOT_TIMEOUT):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def key(story_uuid: UUID, version: int) -> str:
+        return f"story-snapshot:{story_uuid}:{version}"
+
+    def get(self, story_uuid: UUID, version: int) -> str | None:
+        """Return the serialized snapshot for this story version, or None on a miss."""
+        data = self.cache.get(self.key(story_uuid, version))
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logger.debug(f"SnapshotCache.get({story_uuid}, v{version}) {'hit' if data is not None else 'miss'}")
+        return data
+
+    def set(self, story_uuid: UUID, version: int, data: str) -> None:
+        self.cache.set(self.key(story_uuid, version), data, self.timeout)
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+snapshot_cache = SnapshotCache()
+
+
+class ContextImageCache:
+    def __init__(self, alias: str = SNAPSHOT_CACHE_ALIAS, timeout: int = CONTEXT_IMAGE_TIMEOUT):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.bytes_sent = 0
+        self.bytes_original = 0
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def key(content_hash: str) -> str:
+        fmt = settings.CONTEXT_IMAGE_FORMAT
+        return f"context-image:{content_hash}:{settings.CONTEXT_IMAGE_MAX_EDGE}:{fmt}:{settings.CONTEXT_IMAGE_QUALITY}"
+
+    def get(self, name: str, content_hash: str, original_size: int | None = None) -> bytes:
+        """Return the model rendition of a stored image, rendering it from the original only on a miss.
+
+        Images stored before content hashes existed are keyed by their storage name, which is never reused.
+        """
+        key = self.key(content_hash or name)
+        data = self.cache.get(key)
+        hit = data is not None
+        if not hit:
+            with default_storage.open(name, "rb") as f:
+                original = f.read()
+            original_size = len(original)
+            data = render_bounded(
+                original,
+                settings.CONTEXT_IMAGE_MAX_EDGE,
+                settings.CONTEXT_IMAGE_FORMAT,
+                settings.CONTEXT_IMAGE_QUALITY,
+            )
+            self.cache.set(key, data, self.timeout)
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.bytes_sent += len(data)
+            self.bytes_original += original_size or len(data)
+        return data
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "bytes_sent": self.bytes_sent,
+                "bytes_saved": self.bytes_original - self.bytes_sent,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.bytes_sent = 0
+            self.bytes_original = 0
+
+
+context_image_cache = ContextImageCache()
@@ -0,0 +1,52 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from apps.stories.models import Page, Story
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+
+class Command(BaseCommand):
+    help = "Measure rows written and time per page move for stories of increasing length (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000], help="Story lengths to test")
+        parser.add_argument("--moves", type=int, default=200, help="Random moves per story length")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        self.stdout.write(f"{'pages':>6} {'moves':>6} {'writes/move':>12} {'max writes':>11} {'ms/move':>8}")
+
+        with transaction.atomic():
+            user = get_user_model().objects.create(username=f"benchmark-{time.time_ns()}")
+            for page_count in options["pages"]:
+                story = Story.objects.create(user=user, title="Benchmark")
+                Page.objects.bulk_create(Page(story=story, order=i * 2**20) for i in range(page_count))
+                pages = list(story.pages.all())
+
+                writes = []
+                started = time.perf_counter()
+                for _ in range(options["moves"]):
+                    page = rng.choice(pages)
+                    move = rng.choice(["up", "down", "top", "bottom", "to"])
+                    with CaptureQueriesContext(connection) as ctx:
+                        if move == "to":
+                            page.to(rng.randrange(page_count))
+                        else:
+                            getattr(page, move)()
+                    writes.append(
+                        sum(q["sql"].lstrip().upper().startswith(WRITE_PREFIXES) for q in ctx.captured_queries)
+                    )
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                self.stdout.write(
+                    f"{page_count:>6} {len(writes):>6} {sum(writes) / len(writes):>12.2f} {max(writes):>11} "
+                    f"{elapsed_ms / len(writes):>8.2f}"
+                )
+            transaction.set_rollback(True)
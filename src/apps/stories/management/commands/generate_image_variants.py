@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.stories.models import Page
+from apps.stories.tasks import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = "Queue variant rendering for page images that have none (e.g. uploaded before variants existed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-render pages that already have variants")
+        parser.add_argument("--inline", action="store_true", help="Render in this process instead of queueing")
+
+    def handle(self, *args, **options):
+        pages = Page.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["all"]:
+            pages = pages.filter(image_variants=[])
+
+        count = 0
+        for page_id, variants in pages.values_list("pk", "image_variants").iterator():
+            if options["inline"]:
+                generate_image_variants(page_id, variants)
+            else:
+                generate_image_variants.delay(page_id, variants)
+            count += 1
+        self.stdout.write(f"{'Rendered' if options['inline'] else 'Queued'} image variants for {count} pages")
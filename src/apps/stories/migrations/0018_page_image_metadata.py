@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:46
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+
+def backfill_image_metadata(apps, schema_editor):
+    """Store dimensions and size for existing page images so readers never open the files."""
+    Page = apps.get_model("stories", "Page")
+    for page in Page.objects.exclude(image="").exclude(image__isnull=True).iterator():
+        try:
+            page.image_width, page.image_height = get_image_dimensions(page.image)
+            page.image_size = page.image.size
+        except OSError:
+            # Missing or unreadable file; leave metadata empty
+            continue
+        page.save(update_fields=["image_width", "image_height", "image_size"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0017_populate_story_conversations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="image_height",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="image_size",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, help_text="Image file size in bytes, stored at write time", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="image_width",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_image_metadata, migrations.RunPython.noop),
+    ]
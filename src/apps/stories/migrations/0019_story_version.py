@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0018_page_image_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="story",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=1, editable=False, help_text="Bumped on every content change; keys cached story snapshots"
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:52
+
+from django.db import migrations, models
+
+PAGE_ORDER_GAP = 2**20
+
+
+def _respace(apps, gap):
+    Page = apps.get_model("stories", "Page")
+    story_ids = Page.objects.values_list("story_id", flat=True).distinct()
+    for story_id in story_ids.iterator():
+        pages = list(Page.objects.filter(story_id=story_id).order_by("order", "pk").only("pk", "order"))
+        for index, page in enumerate(pages):
+            page.order = index * gap
+        Page.objects.bulk_update(pages, ["order"])
+
+
+def spread_page_order(apps, schema_editor):
+    """Convert dense 0..n-1 page orders into gaps so moves and inserts write a single row."""
+    _respace(apps, PAGE_ORDER_GAP)
+
+
+def compact_page_order(apps, schema_editor):
+    """Restore dense 0..n-1 page orders."""
+    _respace(apps, 1)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0019_story_version"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="page",
+            name="order",
+            field=models.BigIntegerField(
+                db_index=True,
+                editable=False,
+                help_text="Sparse sort key; only the relative order is meaningful",
+                verbose_name="order",
+            ),
+        ),
+        migrations.RunPython(spread_page_order, compact_page_order),
+    ]
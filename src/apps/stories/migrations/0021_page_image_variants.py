@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0020_page_gap_ordering"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True, default=list, editable=False, help_text="Resized and re-encoded copies of the image"
+            ),
+        ),
+    ]
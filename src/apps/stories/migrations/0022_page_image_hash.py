@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:05
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_image_hash(apps, schema_editor):
+    """Hash existing page images so their context renditions can be cached by content."""
+    Page = apps.get_model("stories", "Page")
+    for page in Page.objects.exclude(image="").exclude(image__isnull=True).iterator():
+        digest = hashlib.sha256()
+        try:
+            with page.image.open("rb") as f:
+                for chunk in f.chunks():
+                    digest.update(chunk)
+        except OSError:
+            # Missing or unreadable file; leave the hash empty
+            continue
+        page.image_hash = digest.hexdigest()
+        page.save(update_fields=["image_hash"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0021_page_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="image_hash",
+            field=models.CharField(
+                blank=True, default="", editable=False, help_text="SHA-256 of the image file contents", max_length=64
+            ),
+        ),
+        migrations.RunPython(backfill_image_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+def backfill_image_updated_at(apps, schema_editor):
+    """Existing images have no recorded draw time; the page's last update is the closest one on hand."""
+    Page = apps.get_model("stories", "Page")
+    Page.objects.exclude(image="").exclude(image__isnull=True).update(image_updated_at=models.F("updated_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0022_page_image_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="image_updated_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="When the current image was set; text edits leave it alone",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_image_updated_at, migrations.RunPython.noop),
+    ]
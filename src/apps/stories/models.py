@@ -1,13 +1,37 @@
+import hashlib
 import uuid
 
 from django.contrib.auth import get_user_model
-from django.db import models
-from ordered_model.models import OrderedModel
+from django.db import models, transaction
+from django.db.models import Count, F, Max, Min, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
 from apps.ai.models import Conversation
 
 User = get_user_model()
 
+# Pages are spaced this far apart so a move or insert can take a slot between its neighbours and write one row
+PAGE_ORDER_GAP = 2**20
+# Neighbours closer than this trigger a background rebalance before the gap runs out
+PAGE_ORDER_MIN_GAP = 2**10
+
+
+def file_hash(file) -> str:
+    """Return the SHA-256 hex digest of a file's contents, leaving it closed or rewound as it was found."""
+    close = file.closed
+    file.open("rb")
+    try:
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+    finally:
+        if close:
+            file.close()
+        else:
+            file.seek(0)
+    return digest.hexdigest()
+
 
 class Story(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -17,10 +41,20 @@ class Story(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     conversation = models.OneToOneField(Conversation, on_delete=models.SET_NULL, null=True, blank=True)
+    version = models.PositiveIntegerField(
+        default=1, editable=False, help_text="Bumped on every content change; keys cached story snapshots"
+    )
 
     def __str__(self):
         return self.title or "Untitled Story"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save handler notice ownership transfers and revoke channel tokens
+        instance._loaded_user_id = instance.__dict__.get("user_id")
+        return instance
+
     def save(self, *args, **kwargs):
         if self.pk is None and self.conversation_id is None:
             self.conversation = Conversation.objects.create(
@@ -43,7 +77,9 @@ class Story(models.Model):
 
     def get_page_by_num(self, num):
         """Get a page by it's page number in the book (1-indexed)"""
-        return self.pages.get(order=num - 1)
+        if num < 1:
+            raise Page.DoesNotExist(f"Page number must be positive, got {num}")
+        return self.pages.order_by("order")[num - 1 : num].get()
 
     class Meta:
         verbose_name = "Story"
@@ -51,43 +87,207 @@ class Story(models.Model):
         ordering = ["user", "-created_at"]
 
 
-class Page(OrderedModel):
+class PageQuerySet(models.QuerySet):
+    def numbered(self):
+        """Annotate each page with its 1-based position and its story's page count.
+
+        page_number, is_first and is_last read these annotations instead of issuing a query per page.
+        """
+        return self.annotate(
+            page_position=Window(RowNumber(), partition_by=F("story_id"), order_by=F("order").asc()),
+            story_page_count=Window(Count("pk"), partition_by=F("story_id")),
+        ).order_by("story_id", "order")
+
+
+class Page(models.Model):
     story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name="pages")
+    order = models.BigIntegerField(
+        "order", db_index=True, editable=False, help_text="Sparse sort key; only the relative order is meaningful"
+    )
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     content = models.TextField(blank=True, null=True, default="", help_text="Content for this page")
     image_text = models.TextField(blank=True, null=True, default="", help_text="Image text for this page")
     image = models.ImageField(upload_to="page_images", blank=True, null=True)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_size = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, help_text="Image file size in bytes, stored at write time"
+    )
+    image_hash = models.CharField(
+        max_length=64, blank=True, default="", editable=False, help_text="SHA-256 of the image file contents"
+    )
+    image_variants = models.JSONField(
+        default=list, blank=True, editable=False, help_text="Resized and re-encoded copies of the image"
+    )
+    image_updated_at = models.DateTimeField(
+        null=True, blank=True, editable=False, help_text="When the current image was set; text edits leave it alone"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    # OrderedModel configuration
-    order_with_respect_to = "story"
+    objects = PageQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image_name = instance.__dict__.get("image") or None
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.order is None:
+            # Append after the last page; the first page of a story gets order 0
+            last_order = self._siblings().aggregate(Max("order"))["order__max"]
+            self.order = 0 if last_order is None else last_order + PAGE_ORDER_GAP
+        update_fields = kwargs.get("update_fields")
+        stale_variants = None
+        if self._image_changed() and (update_fields is None or "image" in update_fields):
+            self._store_image_metadata()
+            stale_variants, self.image_variants = self.image_variants, []
+            if update_fields is not None:
+                kwargs["update_fields"] = {
+                    *update_fields,
+                    "image_width",
+                    "image_height",
+                    "image_size",
+                    "image_hash",
+                    "image_variants",
+                    "image_updated_at",
+                }
+        super().save(*args, **kwargs)
+        if stale_variants is not None:
+            self._schedule_image_variants(stale_variants)
+        if "image" not in self.get_deferred_fields():
+            self._loaded_image_name = self.image.name or None
+
+    def _image_changed(self) -> bool:
+        if "image" in self.get_deferred_fields():
+            return False
+        return (self.image.name or None) != getattr(self, "_loaded_image_name", None)
+
+    def _store_image_metadata(self):
+        """Read dimensions and size once at write time so readers never touch storage."""
+        self.image_updated_at = timezone.now() if self.image else None
+        if not self.image:
+            self.image_width = self.image_height = self.image_size = None
+            self.image_hash = ""
+            return
+        self.image_width = self.image.width
+        self.image_height = self.image.height
+        self.image_size = self.image.size
+        self.image_hash = file_hash(self.image)
+
+    def _schedule_image_variants(self, stale_variants):
+        """Render variants of the new image (and drop the old image's) off the request path, after commit."""
+        from apps.stories.tasks import generate_image_variants
+
+        page_id = self.pk
+        transaction.on_commit(lambda: generate_image_variants.delay(page_id, stale_variants))
+
+    def _siblings(self):
+        return Page.objects.filter(story_id=self.story_id).exclude(pk=self.pk)
 
     @property
     def is_first(self):
         """Return True if this is the first page in the story."""
-        return self.order == 0
+        if hasattr(self, "page_position"):
+            return self.page_position == 1
+        return not self._siblings().filter(order__lt=self.order).exists()
 
     @property
     def is_last(self):
         """Return True if this is the last page in the story."""
-        return self.order == self.story.pages.count() - 1
+        if hasattr(self, "page_position"):
+            return self.page_position == self.story_page_count
+        return not self._siblings().filter(order__gt=self.order).exists()
 
     @property
     def page_number(self):
-        return self.order + 1
+        if hasattr(self, "page_position"):
+            return self.page_position
+        return self._siblings().filter(order__lt=self.order).count() + 1
 
     def get_previous_page(self):
         """Return the previous page in the story, or None if this is the first page."""
-        if self.is_first:
-            return None
-        return self.story.pages.get(order=self.order - 1)
+        return self._siblings().filter(order__lt=self.order).order_by("-order").first()
 
     def get_next_page(self):
         """Return the next page in the story, or None if this is the last page."""
-        if self.is_last:
-            return None
-        return self.story.pages.get(order=self.order + 1)
+        return self._siblings().filter(order__gt=self.order).order_by("order").first()
+
+    def up(self):
+        """Move one position earlier, between the two pages before this one."""
+        earlier = list(
+            self._siblings().filter(order__lt=self.order).order_by("-order").values_list("order", flat=True)[:2]
+        )
+        if earlier:
+            self._move_between(earlier[1] if len(earlier) > 1 else None, earlier[0], retry=self.up)
+
+    def down(self):
+        """Move one position later, between the two pages after this one."""
+        later = list(
+            self._siblings().filter(order__gt=self.order).order_by("order").values_list("order", flat=True)[:2]
+        )
+        if later:
+            self._move_between(later[0], later[1] if len(later) > 1 else None, retry=self.down)
+
+    def top(self):
+        """Move to the start of the story."""
+        first = self._siblings().aggregate(Min("order"))["order__min"]
+        if first is not None and first <= self.order:
+            self._move_between(None, first, retry=self.top)
+
+    def bottom(self):
+        """Move to the end of the story."""
+        last = self._siblings().aggregate(Max("order"))["order__max"]
+        if last is not None and last >= self.order:
+            self._move_between(last, None, retry=self.bottom)
+
+    def to(self, index):
+        """Move to a 0-based position among the story's pages."""
+        if index <= 0:
+            return self.top()
+        neighbours = list(self._siblings().order_by("order").values_list("order", flat=True)[index - 1 : index + 1])
+        if len(neighbours) < 2:
+            return self.bottom()
+        self._move_between(neighbours[0], neighbours[1], retry=lambda: self.to(index))
+
+    def _move_between(self, before, after, retry):
+        """Write this page's order into the gap between two neighbour orders (None means open-ended)."""
+        if before is None:
+            order = after - PAGE_ORDER_GAP
+        elif after is None:
+            order = before + PAGE_ORDER_GAP
+        elif after - before < 2:
+            # No integer left between the neighbours: respace the story now and recompute
+            Page.rebalance(self.story_id)
+            self.refresh_from_db(fields=["order"])
+            return retry()
+        else:
+            order = (before + after) // 2
+
+        Page.objects.filter(pk=self.pk).update(order=order)
+        self.order = order
+
+        if before is not None and after is not None and after - before < PAGE_ORDER_MIN_GAP:
+            from apps.stories.tasks import rebalance_pages
+
+            story_id = self.story_id
+            transaction.on_commit(lambda: rebalance_pages.delay(story_id))
+
+    @classmethod
+    def rebalance(cls, story_id):
+        """Respace a story's pages PAGE_ORDER_GAP apart, keeping their order. Writes every page that moves."""
+        with transaction.atomic():
+            pages = list(
+                cls.objects.select_for_update().filter(story_id=story_id).order_by("order", "pk").only("pk", "order")
+            )
+            changed = []
+            for index, page in enumerate(pages):
+                if page.order != index * PAGE_ORDER_GAP:
+                    page.order = index * PAGE_ORDER_GAP
+                    changed.append(page)
+            cls.objects.bulk_update(changed, ["order"])
+        return len(changed)
 
     @property
     def image_binary(self):
@@ -101,7 +301,7 @@ class Page(OrderedModel):
         story_title = self.story.title or "Untitled Story"
         return f"Page {self.page_number} of {story_title}"
 
-    class Meta(OrderedModel.Meta):
+    class Meta:
         verbose_name = "Page"
         verbose_name_plural = "Pages"
         ordering = ["story__user", "story", "order"]
@@ -0,0 +1,108 @@
+"""
+Reference image selection for illustration requests.
+
+Sending every page image as style context stops scaling past a dozen pages, so each request gets a bounded set:
+the target page's neighbours first, then the most recently illustrated pages, then pages whose text is most
+similar to the target's. Similarity is TF-IDF cosine over each page's ``image_text`` and ``content``, computed
+in-process on sparse term vectors; a story is small enough that the index is rebuilt per request.
+"""
+
+import math
+import re
+from collections import Counter
+from datetime import UTC, datetime
+from typing import NamedTuple
+from uuid import UUID
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+# fmt: off
+STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "he", "her", "his", "in",
+    "is", "it", "its", "of", "on", "or", "she", "that", "the", "their", "them", "then", "there", "they", "this",
+    "to", "was", "were", "with", "you",
+})
+# fmt: on
+
+Vector = dict[str, float]
+EPOCH = datetime.min.replace(tzinfo=UTC)
+
+
+class Candidate(NamedTuple):
+    uuid: UUID
+    page_number: int
+    text: str
+    has_image: bool
+    illustrated_at: datetime | None
+
+
+class Reference(NamedTuple):
+    uuid: UUID
+    page_number: int
+    reason: str
+    score: float
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS and len(token) > 1]
+
+
+class TextIndex:
+    """TF-IDF vectors for a set of documents, L2-normalized so a dot product is their cosine similarity."""
+
+    def __init__(self, documents: dict[UUID, str]):
+        counts = {key: Counter(tokenize(text)) for key, text in documents.items()}
+        document_frequency = Counter(term for terms in counts.values() for term in terms)
+        total = len(counts)
+        # Smoothed IDF, as in scikit-learn, so terms in every document still carry a little weight
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+        self.vectors = {key: self.vectorize_counts(terms) for key, terms in counts.items()}
+
+    def vectorize_counts(self, counts: Counter) -> Vector:
+        vector = {term: count * self.idf[term] for term, count in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def vectorize(self, text: str) -> Vector:
+        return self.vectorize_counts(Counter(tokenize(text)))
+
+    def similarities(self, query: Vector) -> dict[UUID, float]:
+        return {
+            key: sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+            for key, vector in self.vectors.items()
+        }
+
+
+def rank_references(
+    candidates: list[Candidate], target: UUID | None = None, query: str = "", recent: int = 2
+) -> list[Reference]:
+    """Order illustrated pages by how useful they are as references for the target page (or the query alone).
+
+    Neighbours of the target come first, then the ``recent`` most recently drawn illustrations, then the rest by
+    text similarity. Pages with no similarity are left out, and so is the target itself.
+    """
+    by_uuid = {candidate.uuid: candidate for candidate in candidates}
+    target_candidate = by_uuid.get(target)
+    illustrated = [c for c in candidates if c.has_image and c.uuid != target]
+
+    index = TextIndex({c.uuid: c.text for c in candidates})
+    query_text = " ".join(filter(None, [target_candidate.text if target_candidate else "", query]))
+    scores = index.similarities(index.vectorize(query_text))
+
+    ranked: list[Reference] = []
+    seen: set[UUID] = set()
+
+    def add(candidate: Candidate, reason: str) -> None:
+        if candidate.uuid not in seen:
+            seen.add(candidate.uuid)
+            ranked.append(Reference(candidate.uuid, candidate.page_number, reason, scores.get(candidate.uuid, 0.0)))
+
+    if target_candidate:
+        for candidate in illustrated:
+            if abs(candidate.page_number - target_candidate.page_number) == 1:
+                add(candidate, "adjacent")
+    for candidate in sorted(illustrated, key=lambda c: c.illustrated_at or EPOCH, reverse=True)[:recent]:
+        add(candidate, "recent")
+    for candidate in sorted(illustrated, key=lambda c: scores[c.uuid], reverse=True):
+        if scores[candidate.uuid] > 0:
+            add(candidate, "similar")
+    return ranked
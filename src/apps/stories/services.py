@@ -1,17 +1,23 @@
 import logging
-import mimetypes
 from datetime import datetime
+from functools import partial
 from typing import Any, Literal, NamedTuple
 from uuid import UUID
 
-import requests
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.db.models import ImageField as DjangoImageField
-from django_eventstream import send_event
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
 from google.genai.types import Part
 from pydantic import BaseModel
 
+from apps.common.media import read_media
+from apps.common.outbox import queue_event
+from apps.stories.cache import context_image_cache, snapshot_cache
 from apps.stories.models import Page, Story
+from apps.stories.references import Candidate, rank_references
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +27,17 @@ PageKey = int | UUID
 # Type alias for image data - can be URL string or binary data
 ImageData = str | bytes
 
+# Fragment pushed with each refresh event when SSE_PUSH_FRAGMENTS is on; mirrors the API's htmx responses
+FRAGMENT_TEMPLATES = {
+    "get_story_title": "cotton/stories/title.html",
+    "get_story_description": "cotton/stories/description.html",
+    "list_pages": "cotton/stories/page/list.html",
+    "get_page": "cotton/stories/page/index.html",
+    "get_page_content": "cotton/stories/page/content.html",
+    "get_page_image_text": "cotton/stories/page/image_text.html",
+    "get_page_image": "cotton/stories/page/image_component.html",
+}
+
 
 class NamedContentFile(NamedTuple):
     filename: str
@@ -32,7 +49,7 @@ class ImageField(BaseModel):
     height: int | None = None
     width: int | None = None
     name: str
-    size: int
+    size: int | None = None
 
 
 class PageSchema(BaseModel):
@@ -43,10 +60,20 @@ class PageSchema(BaseModel):
     image: ImageField | None
     is_first: bool
     is_last: bool
+    updated_at: datetime | None = None
+
+
+class ReferenceImage(NamedTuple):
+    uuid: UUID
+    page_number: int
+    reason: str
+    score: float
+    data: bytes
 
 
 class StorySchema(BaseModel):
     uuid: UUID
+    version: int
     title: str | None
     description: str | None
     page_count: int
@@ -62,14 +89,33 @@ class StoryService:
     def __str__(self):
         return f"StoryService({self.uuid})"
 
-    def _create_image_field(self, django_image_field: DjangoImageField) -> ImageField:
-        """Convert Django ImageField to our Pydantic ImageField."""
+    @property
+    def channel(self) -> str:
+        return f"story-{self.uuid}"
+
+    def _create_image_field(self, page_obj: Page) -> ImageField:
+        """Convert a page's Django ImageField to our Pydantic ImageField.
+
+        Dimensions and size come from the columns stored at write time, so this never opens the file.
+        """
         return ImageField(
-            url=django_image_field.url,
-            height=django_image_field.height,
-            width=django_image_field.width,
-            name=django_image_field.name,
-            size=django_image_field.size,
+            url=page_obj.image.url,
+            height=page_obj.image_height,
+            width=page_obj.image_width,
+            name=page_obj.image.name,
+            size=page_obj.image_size,
+        )
+
+    def _create_page_schema(self, page_obj: Page, page_number: int, page_count: int) -> PageSchema:
+        return PageSchema(
+            uuid=page_obj.uuid,
+            page_number=page_number,
+            content=page_obj.content,
+            image_text=page_obj.image_text,
+            image=self._create_image_field(page_obj) if page_obj.image else None,
+            is_first=page_number == 1,
+            is_last=page_number == page_count,
+            updated_at=page_obj.updated_at,
         )
 
     def _get_story_queryset(self):
@@ -83,15 +129,8 @@ class StoryService:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"generated_image_{timestamp}.png"
 
-        if isinstance(image_data, str):
-            # Handle URL - download the image
-            # TODO: DONT USE REQUESTS
-            response = requests.get(image_data)
-            response.raise_for_status()
-            content_file = ContentFile(response.content)
-        else:
-            # Handle binary data directly
-            content_file = ContentFile(image_data)
+        # A URL is resolved without HTTP for our own media and fetched with limits otherwise; bytes are used as-is
+        content_file = ContentFile(read_media(image_data) if isinstance(image_data, str) else image_data)
 
         return NamedContentFile(filename, content_file)
 
@@ -104,8 +143,13 @@ class StoryService:
         Returns a QuerySet that can be used with .get(), .first(), .update(), etc.
         """
         if isinstance(page_key, int):
-            # page_key is page number (1-indexed)
-            return Page.objects.filter(story__uuid=self.uuid, order=page_key - 1)
+            # page_key is page number (1-indexed); order values are sparse, so select the nth page by position
+            if page_key < 1:
+                return Page.objects.none()
+            nth_page = (
+                Page.objects.filter(story__uuid=self.uuid).order_by("order").values("pk")[page_key - 1 : page_key]
+            )
+            return Page.objects.filter(pk__in=nth_page)
         else:
             # page_key is UUID
             return Page.objects.filter(uuid=page_key, story__uuid=self.uuid)
@@ -116,19 +160,7 @@ class StoryService:
 
     def get_page(self, page_key: PageKey) -> PageSchema:
         page_obj = self.get_page_obj(page_key)
-
-        # Create ImageField from Django ImageField
-        image_field = self._create_image_field(page_obj.image) if page_obj.image else None
-
-        return PageSchema(
-            uuid=page_obj.uuid,
-            page_number=page_obj.page_number,
-            content=page_obj.content,
-            image_text=page_obj.image_text,
-            image=image_field,
-            is_first=page_obj.is_first,
-            is_last=page_obj.is_last,
-        )
+        return self._create_page_schema(page_obj, page_obj.page_number, page_obj.story.page_count)
 
     def get_page_image_binary(self, page_key: PageKey) -> bytes | None:
         """Get binary data of page image directly from Django storage."""
@@ -147,32 +179,60 @@ class StoryService:
         return cls(page.story.uuid)
 
     def get_story(self, fresh: bool = False) -> StorySchema:
-        story_obj = self.story_obj()
-        pages = []
+        """Return the story snapshot for the current version, served from the snapshot cache when possible.
 
-        # Loop based on page_count and use existing get_page method
-        for page_num in range(1, story_obj.page_count + 1):
-            page_schema = self.get_page(page_num)
-            pages.append(page_schema)
+        Args:
+            fresh: Skip the cache lookup and rebuild from the database (the result is still cached).
+        """
+        if not fresh:
+            version = self._get_story_queryset().values_list("version", flat=True).get()
+            cached = snapshot_cache.get(self.uuid, version)
+            if cached is not None:
+                return StorySchema.model_validate_json(cached)
+
+        snapshot = self.build_snapshot()
+        snapshot_cache.set(self.uuid, snapshot.version, snapshot.model_dump_json())
+        return snapshot
+
+    def bump_version(self) -> None:
+        """Move the story to a new version so snapshots cached for the old one are never read again.
+
+        Called by every mutator in the same transaction as its write, here, in the story API and in the admin.
+        """
+        self._get_story_queryset().update(version=F("version") + 1)
+
+    def build_snapshot(self) -> StorySchema:
+        """Build the full StorySchema in two queries, regardless of page count.
+
+        One query loads the story with its conversation, a second loads every page in order.
+        Page numbers and first/last flags are derived from list position instead of per-page lookups.
+        """
+        story_obj = self._get_story_queryset().select_related("conversation").get()
+        page_objs = list(Page.objects.filter(story=story_obj).order_by("order"))
+        page_count = len(page_objs)
 
         return StorySchema(
             uuid=story_obj.uuid,
+            version=story_obj.version,
             title=story_obj.title,
             description=story_obj.description,
-            page_count=story_obj.page_count,
-            pages=pages,
+            page_count=page_count,
+            pages=[
+                self._create_page_schema(page_obj, page_number, page_count)
+                for page_number, page_obj in enumerate(page_objs, start=1)
+            ],
             channel=story_obj.channel,
-            conversation_uuid=story_obj.conversation.uuid,
+            conversation_uuid=story_obj.conversation.uuid if story_obj.conversation else None,
         )
 
     def set_title(self, input: str) -> None:
         """Update story title and send SSE notification."""
-        self._get_story_queryset().update(title=input)
+        self._get_story_queryset().update(title=input, version=F("version") + 1)
         self.refresh_story("title")
 
     def set_description(self, input: str) -> None:
         """Update story description and send SSE notification."""
-        self._get_story_queryset().update(description=input)
+        self._get_story_queryset().update(description=input, version=F("version") + 1)
         self.refresh_story("description")
 
     def update_story(self, title: str | None = None, description: str | None = None) -> None:
@@ -193,24 +253,32 @@ class StoryService:
             named_content_file = self._prep_image(image_data)
             page_instance.image.save(named_content_file.filename, named_content_file.content_file, save=False)
 
-        page_instance.save()
+        with transaction.atomic():
+            page_instance.save()
+            self.bump_version()
         self.refresh_story("page_list")
 
     def set_page_content(self, page_key: PageKey, input: str) -> None:
         """Update page content. page_key can be page number (int) or UUID."""
-        self._get_page_queryset(page_key).update(content=input)
+        with transaction.atomic():
+            self._get_page_queryset(page_key).update(content=input, updated_at=timezone.now())
+            self.bump_version()
         self.refresh_page(page_key, "content")
 
     def set_page_image_text(self, page_key: PageKey, input: str) -> None:
         """Update page image text. page_key can be page number (int) or UUID."""
-        self._get_page_queryset(page_key).update(image_text=input)
+        with transaction.atomic():
+            self._get_page_queryset(page_key).update(image_text=input, updated_at=timezone.now())
+            self.bump_version()
         self.refresh_page(page_key, "image_text")
 
     def set_page_image(self, page_key: PageKey, image_data: ImageData) -> None:
         page_instance = self._get_page_queryset(page_key).get()
 
         named_content_file = self._prep_image(image_data)
-        page_instance.image.save(named_content_file.filename, named_content_file.content_file, save=True)
+        with transaction.atomic():
+            page_instance.image.save(named_content_file.filename, named_content_file.content_file, save=True)
+            self.bump_version()
         self.refresh_page(page_key, "image")
 
     def update_page(
@@ -228,8 +296,9 @@ class StoryService:
             self.set_page_image(page_key, image_data)
 
     def delete_page(self, page_key: PageKey) -> None:
-        page_instance = self._get_page_queryset(page_key).get()
-        page_instance.delete()
+        with transaction.atomic():
+            self._get_page_queryset(page_key).get().delete()
+            self.bump_version()
         self.refresh_story("page_list")
 
     def move_page(self, page_key: PageKey, target: Literal["first", "last", "up", "down"] | int) -> None:
@@ -244,77 +313,153 @@ class StoryService:
                 - "down": Move one position later
                 - int: Move to specific page number (1-based, not 0-based)
         """
-        page_instance = self._get_page_queryset(page_key).get()
-        if target == "first":
-            page_instance.top()
-        elif target == "last":
-            page_instance.bottom()
-        elif target == "up":
-            page_instance.up()
-        elif target == "down":
-            page_instance.down()
-        elif isinstance(target, int):
-            page_instance.move_to(target - 1)
-            if target < 1 or target > self.story_obj().page_count:
-                raise ValueError(f"page number out of range: {target}")
-        else:
-            raise ValueError(f"Invalid target: {target}")
-        page_instance.save()
+        with transaction.atomic():
+            page_instance = self._get_page_queryset(page_key).get()
+            # Each move writes only the moved page's order
+            if target == "first":
+                page_instance.top()
+            elif target == "last":
+                page_instance.bottom()
+            elif target == "up":
+                page_instance.up()
+            elif target == "down":
+                page_instance.down()
+            elif isinstance(target, int):
+                if target < 1 or target > self.story_obj().page_count:
+                    raise ValueError(f"page number out of range: {target}")
+                page_instance.to(target - 1)
+            else:
+                raise ValueError(f"Invalid target: {target}")
+            self.bump_version()
         self.refresh_story("page_list")
 
     def refresh_story(self, target: Literal["title", "description", "page_list", None]):
-        story = self.get_story()
         if target == "title":
-            send_event(story.channel, "get_story_title", "")
+            self._queue_refresh("get_story_title")
         elif target == "description":
-            send_event(story.channel, "get_story_description", "")
+            self._queue_refresh("get_story_description")
         elif target == "page_list":
-            send_event(story.channel, "list_pages", "")
+            self._queue_refresh("list_pages")
         elif target is None:
             # Currently, there is no hook to refresh an entire story
-            send_event(story.channel, "get_story_title", "")
-            send_event(story.channel, "get_story_description", "")
-            send_event(story.channel, "list_pages", "")
+            self._queue_refresh("get_story_title")
+            self._queue_refresh("get_story_description")
+            self._queue_refresh("list_pages")
 
     def refresh_page(self, page_key: PageKey, target: Literal["content", "image_text", "image", None]):
-        story = self.get_story()
-        page = self.get_page(page_key)
+        page_uuid = page_key
+        if isinstance(page_key, int):
+            page_uuid = self._get_page_queryset(page_key).values_list("uuid", flat=True).get()
         if target == "content":
-            send_event(story.channel, f"get_page_content#{page.uuid}", "")
+            self._queue_refresh("get_page_content", page_uuid)
         elif target == "image_text":
-            send_event(story.channel, f"get_page_image_text#{page.uuid}", "")
+            self._queue_refresh("get_page_image_text", page_uuid)
         elif target == "image":
-            send_event(story.channel, f"get_page_image#{page.uuid}", "")
+            self._queue_refresh("get_page_image", page_uuid)
         elif target is None:
-            send_event(story.channel, f"get_page#{page.uuid}", "")
+            self._queue_refresh("get_page", page_uuid)
+
+    def _queue_refresh(self, event: str, page_uuid: UUID | None = None):
+        """Queue a refresh event for one story element.
 
-    def gemini_parts(self) -> list[Any]:
+        With SSE_PUSH_FRAGMENTS the event carries the element's rendered fragment, so listening tabs swap it in
+        directly instead of each fetching it back from the API.
+        """
+        event_type = f"{event}#{page_uuid}" if page_uuid else event
+        if not settings.SSE_PUSH_FRAGMENTS:
+            queue_event(self.channel, event_type, "")
+            return
+        queue_event(self.channel, event_type, partial(self.render_fragment, event, page_uuid), json_encode=False)
+
+    def render_fragment(self, event: str, page_uuid: UUID | None = None) -> str:
+        """Render the fragment the matching API endpoint would return for a refresh event."""
+        story = self.story_obj()
+        context: dict[str, Any] = {"story": story}
+        if page_uuid:
+            try:
+                context["page"] = Page.objects.get(uuid=page_uuid, story=story)
+            except Page.DoesNotExist:
+                return ""
+        return render_to_string(FRAGMENT_TEMPLATES[event], context)
+
+    def reference_images(self, target_page: PageKey | None = None, query: str = "") -> list[ReferenceImage]:
+        """Pick the page images to send as style references for an illustration of target_page.
+
+        Candidates are ranked by rank_references and taken in order until ARTIST_REFERENCE_MAX_IMAGES or
+        ARTIST_REFERENCE_MAX_BYTES (measured on the cached context renditions) would be exceeded.
+        """
+        pages = list(
+            Page.objects.filter(story__uuid=self.uuid)
+            .order_by("order")
+            .values_list("uuid", "content", "image_text", "image", "image_hash", "image_size", "image_updated_at")
+        )
+        candidates = [
+            Candidate(page_uuid, number, f"{image_text or ''} {content or ''}", bool(image), drawn_at)
+            for number, (page_uuid, content, image_text, image, _hash, _size, drawn_at) in enumerate(pages, start=1)
+        ]
+        images = {page_uuid: (image, content_hash, size) for page_uuid, _c, _t, image, content_hash, size, _u in pages}
+        if isinstance(target_page, int):
+            target_page = pages[target_page - 1][0] if 0 < target_page <= len(pages) else None
+
+        selected: list[ReferenceImage] = []
+        total_bytes = bytes_original = 0
+        for reference in rank_references(candidates, target_page, query):
+            if len(selected) >= settings.ARTIST_REFERENCE_MAX_IMAGES:
+                break
+            name, content_hash, size = images[reference.uuid]
+            data = context_image_cache.get(name, content_hash, size)
+            if total_bytes + len(data) > settings.ARTIST_REFERENCE_MAX_BYTES:
+                continue
+            selected.append(ReferenceImage(*reference, data=data))
+            total_bytes += len(data)
+            bytes_original += size or len(data)
+
+        logger.info(
+            f"{self}.reference_images(target={target_page}): pages "
+            f"{[(r.page_number, r.reason) for r in selected]} of {sum(c.has_image for c in candidates)} illustrated, "
+            f"{total_bytes} bytes sent, {bytes_original - total_bytes} bytes saved"
+        )
+        return selected
+
+    def text_parts(self) -> list[str]:
+        """The text of gemini_parts: the story's metadata, then each page's, without any images."""
+        story = self.get_story(fresh=False)
+        return [
+            story.model_dump_json(exclude={"pages"}),
+            *(page.model_dump_json(exclude={"image"}) for page in story.pages),
+        ]
+
+    def reference_parts(self, references: list[ReferenceImage]) -> list[Any]:
+        """Each reference image, labelled with its page number, to follow text_parts."""
+        mime_type = f"image/{settings.CONTEXT_IMAGE_FORMAT}"
+        contents: list[Any] = []
+        for reference in references:
+            contents.append(f"Illustration of page {reference.page_number}:")
+            contents.append(Part.from_bytes(data=reference.data, mime_type=mime_type))
+        return contents
+
+    def gemini_parts(self, references: list[ReferenceImage] | None = None) -> list[Any]:
         """
         Prepares the story for the Gemini API by separating JSON metadata
         from binary image data.
+
+        Every page's text is included; images only for the given references (by default, reference_images() with
+        no target page). Images are the downscaled renditions from the context image cache.
         """
         story = self.get_story(fresh=False)
+        if references is None:
+            references = self.reference_images()
+        images = {reference.uuid: reference.data for reference in references}
         contents: list[Any] = []
+        mime_type = f"image/{settings.CONTEXT_IMAGE_FORMAT}"
 
         # 1) Story-level metadata
         contents.append(story.model_dump_json(exclude={"pages"}))
 
-        # 2) Per-page payloads and images
+        # 2) Per-page payloads and the selected reference images
         for page in story.pages:
             contents.append(page.model_dump_json(exclude={"image"}))
-
-            page_obj = self.get_page_obj(page.uuid)
-            page_image = page_obj.image
-            if page_image:
-                page_image.open("rb")
-                try:
-                    data = page_image.read()
-                finally:
-                    page_image.close()
-                mime, _ = mimetypes.guess_type(getattr(page_image, "name", "image"))
-                if not mime:
-                    continue
-                part = Part.from_bytes(data=data, mime_type=mime)
-                contents.append(part)
+            if page.uuid in images:
+                contents.append(Part.from_bytes(data=images[page.uuid], mime_type=mime_type))
 
         return contents
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_eventstream import channel_permission_changed
+
+from apps.ai.models import Conversation
+from apps.common.sse import revoke_channel
+from apps.stories.models import Story, User
+
+
+def _revoke_story_channel(story, previous_user_id):
+    # The story's conversation streams to the same detail page, so its channel is revoked along with the story's
+    channels = [story.channel]
+    conversation_uuid = Conversation.objects.filter(pk=story.conversation_id).values_list("uuid", flat=True).first()
+    if conversation_uuid is not None:
+        channels.append(f"conversation-{conversation_uuid}")
+
+    def revoke():
+        for channel in channels:
+            revoke_channel(channel)
+            # Re-check the previous owner's open streams so they are kicked now rather than at their next reconnect
+            channel_permission_changed(User(pk=previous_user_id), channel)
+
+    transaction.on_commit(revoke)
+
+
+@receiver(post_delete, sender=Story)
+def revoke_deleted_story_channel(sender, instance, **kwargs):
+    _revoke_story_channel(instance, instance.user_id)
+
+
+@receiver(post_save, sender=Story)
+def revoke_transferred_story_channel(sender, instance, created, **kwargs):
+    previous_user_id = getattr(instance, "_loaded_user_id", None)
+    if not created and previous_user_id is not None and previous_user_id != instance.user_id:
+        _revoke_story_channel(instance, previous_user_id)
+    instance._loaded_user_id = instance.user_id
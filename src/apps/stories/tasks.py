@@ -0,0 +1,45 @@
+"""
+Celery tasks for stories.
+"""
+
+import logging
+
+from celery import shared_task
+
+from apps.stories.models import Page
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="stories.rebalance_pages")
+def rebalance_pages(story_id: int) -> int:
+    """Respace a story's page orders once moves have crowded two neighbours together."""
+    changed = Page.rebalance(story_id)
+    logger.info(f"Rebalanced page order for story {story_id}: {changed} pages rewritten")
+    return changed
+
+
+@shared_task(name="stories.generate_image_variants")
+def generate_image_variants(page_id: int, stale_variants: list | None = None) -> int:
+    """Render a page image's thumbnails and modern-format copies, replacing those of its previous image."""
+    from apps.common.images import delete_variants, save_variants
+    from apps.stories.services import StoryService
+
+    if stale_variants:
+        delete_variants(stale_variants)
+
+    page = Page.objects.select_related("story").filter(pk=page_id).first()
+    if page is None or not page.image:
+        return 0
+    variants = save_variants(page.image.name)
+
+    # Only attach the variants if the page still shows the image they were rendered from
+    if not Page.objects.filter(pk=page_id, image=page.image.name).update(image_variants=variants):
+        delete_variants(variants)
+        return 0
+
+    service = StoryService(page.story.uuid)
+    service.bump_version()
+    service.refresh_page(page.uuid, "image")
+    logger.info(f"Generated {len(variants)} image variants for page {page.uuid}")
+    return len(variants)
@@ -1,9 +1,38 @@
 """Tests for the stories app."""
 
+import io
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+from unittest.mock import patch
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
 
-from apps.stories.models import Page, Story
+from apps.common.outbox import batch_events, coalescer, queue_event
+from apps.common.sse import ChannelManager, _is_revoked, check_revocation_cache, sign_channel_token
+from apps.stories.admin import PageAdmin
+from apps.stories.api import StoryIn, update_story
+from apps.stories.cache import context_image_cache, snapshot_cache
+from apps.stories.models import PAGE_ORDER_GAP, Page, Story
+from apps.stories.references import Candidate, rank_references
+from apps.stories.services import StoryService
 
 User = get_user_model()
 
@@ -65,3 +94,610 @@ class StoriesAppLoadTest(TestCase):
         # Test model meta attributes
         self.assertEqual(Story._meta.verbose_name, "Story")
         self.assertEqual(Page._meta.verbose_name, "Page")
+
+
+class StorySnapshotTest(TestCase):
+    """Test that StoryService builds story snapshots in a constant number of queries."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def _create_story(self, page_count):
+        story = Story.objects.create(user=self.user, title=f"Story with {page_count} pages")
+        for i in range(page_count):
+            Page.objects.create(story=story, content=f"Page {i + 1}")
+        return story
+
+    def _png(self, width, height):
+        buffer = io.BytesIO()
+        PILImage.new("RGB", (width, height), "white").save(buffer, format="PNG")
+        return ContentFile(buffer.getvalue(), name="test.png")
+
+    def test_query_count_does_not_grow_with_pages(self):
+        """Test that building a snapshot issues the same number of queries for short and long stories."""
+        for page_count in (1, 5, 30):
+            story = self._create_story(page_count)
+            service = StoryService(story.uuid)
+            with self.assertNumQueries(2):
+                snapshot = service.get_story(fresh=True)
+            self.assertEqual(snapshot.page_count, page_count)
+            self.assertEqual([p.page_number for p in snapshot.pages], list(range(1, page_count + 1)))
+            self.assertTrue(snapshot.pages[0].is_first)
+            self.assertTrue(snapshot.pages[-1].is_last)
+
+    def test_image_metadata_is_stored_at_write_time(self):
+        """Test that image dimensions and size are stored on save and read without touching storage."""
+        story = self._create_story(2)
+        page = story.pages.first()
+        page.image.save("test.png", self._png(64, 32), save=True)
+
+        page.refresh_from_db()
+        self.assertEqual((page.image_width, page.image_height), (64, 32))
+        self.assertEqual(page.image_size, page.image.size)
+
+        storage_read = AssertionError("storage was read")
+        with (
+            patch.object(FileSystemStorage, "size", side_effect=storage_read),
+            patch.object(FileSystemStorage, "open", side_effect=storage_read),
+        ):
+            snapshot = StoryService(story.uuid).get_story()
+
+        image = snapshot.pages[0].image
+        self.assertEqual((image.width, image.height, image.size), (64, 32, page.image_size))
+        self.assertIsNone(snapshot.pages[1].image)
+
+    def test_clearing_image_clears_metadata(self):
+        """Test that removing an image resets its stored metadata."""
+        story = self._create_story(1)
+        page = story.pages.get()
+        page.image.save("test.png", self._png(8, 8), save=True)
+
+        page.image = None
+        page.save()
+        page.refresh_from_db()
+
+        self.assertIsNone(page.image_width)
+        self.assertIsNone(page.image_height)
+        self.assertIsNone(page.image_size)
+
+
+class StorySnapshotCacheTest(TestCase):
+    """Test the versioned story snapshot cache."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="Cached Story")
+        Page.objects.create(story=self.story, content="Once upon a time")
+        self.service = StoryService(self.story.uuid)
+        snapshot_cache.cache.clear()
+        snapshot_cache.reset_stats()
+
+    def test_repeated_reads_hit_the_cache(self):
+        """Test that only the first read builds the snapshot; later reads cost a version lookup."""
+        first = self.service.get_story()
+        with self.assertNumQueries(1):
+            second = self.service.get_story()
+
+        self.assertEqual(first, second)
+        self.assertEqual(snapshot_cache.stats()["misses"], 1)
+        self.assertEqual(snapshot_cache.stats()["hits"], 1)
+
+    def test_mutators_bump_version(self):
+        """Test that service mutations move to a new version so readers never see stale data."""
+        before = self.service.get_story()
+
+        self.service.set_title("Renamed")
+        self.service.set_page_content(1, "A new beginning")
+        after = self.service.get_story()
+
+        self.assertEqual(after.version, before.version + 2)
+        self.assertEqual(after.title, "Renamed")
+        self.assertEqual(after.pages[0].content, "A new beginning")
+        self.assertEqual(snapshot_cache.stats()["misses"], 2)
+
+    def test_api_update_keeps_a_concurrent_version_bump(self):
+        """Test that an API edit racing a worker's edit still moves past the version the worker cached."""
+        self.service.get_story()
+
+        def load_then_race(model, **kwargs):
+            story = Story.objects.get(**kwargs)
+            # A worker edits the story and caches its snapshot after the API has read the row
+            self.service.set_page_content(1, "Edited by a worker")
+            self.service.get_story()
+            return story
+
+        with patch("apps.stories.api.get_object_or_404", side_effect=load_then_race):
+            request = RequestFactory().patch("/")
+            request.htmx = False
+            update_story(request, self.story.uuid, StoryIn(title="Renamed"))
+
+        after = self.service.get_story()
+        self.assertEqual(after.version, 3)
+        self.assertEqual(after.title, "Renamed")
+        self.assertEqual(after.pages[0].content, "Edited by a worker")
+
+    def test_admin_edits_bump_version(self):
+        """Test that saving or deleting a page in the admin moves the story past its cached snapshot."""
+        self.service.get_story()
+        page_admin = PageAdmin(Page, admin.site)
+        request = RequestFactory().post("/")
+        page = Page.objects.get(story=self.story)
+        page.content = "Edited in the admin"
+
+        with patch("apps.stories.admin.StoryService.refresh_story"):
+            page_admin.save_model(request, page, form=None, change=True)
+            self.assertEqual(self.service.get_story().pages[0].content, "Edited in the admin")
+            page_admin.delete_queryset(request, Page.objects.filter(pk=page.pk))
+
+        self.assertEqual(self.service.get_story().page_count, 0)
+
+    def test_page_write_and_bump_commit_together(self):
+        """Test that a page edit whose version bump fails is rolled back with it."""
+        with (
+            patch.object(StoryService, "bump_version", side_effect=RuntimeError("bump failed")),
+            self.assertRaises(RuntimeError),
+        ):
+            self.service.set_page_content(1, "Never cached")
+
+        self.assertEqual(Page.objects.get(story=self.story).content, "Once upon a time")
+
+    def test_fresh_read_skips_cache(self):
+        """Test that fresh reads rebuild from the database."""
+        self.service.get_story()
+        with self.assertNumQueries(2):
+            self.service.get_story(fresh=True)
+
+
+class PageOrderingTest(TestCase):
+    """Test gap-based page ordering."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+
+    def _create_story(self, page_count):
+        story = Story.objects.create(user=self.user, title="Ordered Story")
+        for i in range(page_count):
+            Page.objects.create(story=story, content=f"Page {i + 1}")
+        return story
+
+    def _contents(self, story):
+        return list(story.pages.values_list("content", flat=True))
+
+    def _count_writes(self, move):
+        with CaptureQueriesContext(connection) as ctx:
+            move()
+        return sum(q["sql"].lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")) for q in ctx.captured_queries)
+
+    def test_moves_reorder_pages(self):
+        """Test that up, down, top, bottom and to keep the expected sequence and page numbers."""
+        story = self._create_story(4)
+        page = story.get_page_by_num(3)
+
+        page.up()
+        self.assertEqual(self._contents(story), ["Page 1", "Page 3", "Page 2", "Page 4"])
+        page.top()
+        self.assertEqual(self._contents(story), ["Page 3", "Page 1", "Page 2", "Page 4"])
+        page.down()
+        self.assertEqual(self._contents(story), ["Page 1", "Page 3", "Page 2", "Page 4"])
+        page.bottom()
+        self.assertEqual(self._contents(story), ["Page 1", "Page 2", "Page 4", "Page 3"])
+        page.to(1)
+        self.assertEqual(self._contents(story), ["Page 1", "Page 3", "Page 2", "Page 4"])
+
+        self.assertEqual(page.page_number, 2)
+        self.assertEqual(story.get_page_by_num(2), page)
+        self.assertEqual(StoryService(story.uuid).get_page_obj(2), page)
+        self.assertEqual([p.page_number for p in story.pages.numbered()], [1, 2, 3, 4])
+        self.assertTrue(story.get_page_by_num(1).is_first)
+        self.assertTrue(story.get_page_by_num(4).is_last)
+
+    def test_move_writes_do_not_grow_with_pages(self):
+        """Test that every move and append writes a single row for short and long stories."""
+        for page_count in (5, 50):
+            story = self._create_story(page_count)
+            page = story.get_page_by_num(page_count // 2)
+            index = page_count // 3
+            for move in (page.up, page.down, page.top, page.bottom, partial(page.to, index)):
+                self.assertEqual(self._count_writes(move), 1)
+            self.assertEqual(self._count_writes(partial(Page.objects.create, story=story)), 1)
+            self.assertEqual(self._count_writes(page.delete), 1)
+
+    def test_exhausted_gap_rebalances(self):
+        """Test that repeated inserts into one gap respace the story without changing its order."""
+        story = self._create_story(3)
+        first, second, third = story.pages.all()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for _ in range(25):
+                third.to(1)
+                second.to(1)
+
+        self.assertTrue(callbacks)  # crowded neighbours schedule a background rebalance
+        self.assertEqual(self._contents(story), ["Page 1", "Page 2", "Page 3"])
+        self.assertEqual(list(story.pages.values_list("order", flat=True)), [0, PAGE_ORDER_GAP, 2 * PAGE_ORDER_GAP])
+
+
+class StoryRefreshEventsTest(TestCase):
+    """Test that refresh events go through the transactional outbox."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="Evented Story")
+        self.page = Page.objects.create(story=self.story, content="Once upon a time")
+        self.service = StoryService(self.story.uuid)
+        publish_patcher = patch("apps.common.outbox.publish_events")
+        self.publish = publish_patcher.start()
+        self.addCleanup(publish_patcher.stop)
+        self.addCleanup(coalescer.reset)
+
+    def test_events_wait_for_commit_and_deduplicate(self):
+        """Test that a burst of mutations publishes one batch with one event per element after commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.refresh_story(None)
+            for i in range(5):
+                self.service.set_page_content(1, f"Draft {i}")
+            self.service.set_title("Renamed")
+            self.publish.assert_not_called()
+
+        self.publish.assert_called_once()
+        events = self.publish.call_args.args[0]
+        self.assertEqual(
+            list(events),
+            [
+                (self.service.channel, "get_story_title"),
+                (self.service.channel, "get_story_description"),
+                (self.service.channel, "list_pages"),
+                (self.service.channel, f"get_page_content#{self.page.uuid}"),
+            ],
+        )
+
+    def test_batch_scope_joins_open_transaction(self):
+        """Test that a batch scope inside a transaction defers to the commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            with batch_events():
+                self.service.refresh_page(self.page.uuid, "image")
+                self.service.refresh_page(self.page.uuid, "image")
+            self.publish.assert_not_called()
+
+        self.publish.assert_called_once_with({(self.service.channel, f"get_page_image#{self.page.uuid}"): '""'})
+
+    @override_settings(SSE_COALESCE_WINDOW=0.05)
+    def test_coalescing_window_sends_leading_and_trailing_event(self):
+        """Test that repeats within the window collapse into one trailing event."""
+        key = (self.service.channel, "list_pages")
+        for _ in range(3):
+            coalescer.submit({key: '""'})
+        self.assertEqual(self.publish.call_count, 1)
+
+        time.sleep(0.15)
+        self.assertEqual(self.publish.call_count, 2)
+        self.publish.assert_called_with({key: '""'})
+
+    @override_settings(SSE_COALESCE_WINDOW=0.05)
+    def test_trailing_event_thread_closes_its_connections(self):
+        """Test that the timer thread publishing a trailing event closes the connections it opened."""
+        key = (self.service.channel, "list_pages")
+        calls = []
+        self.publish.side_effect = lambda events: calls.append(("publish", threading.get_ident()))
+        with patch("apps.common.outbox.connections") as connections:
+            connections.close_all.side_effect = lambda: calls.append(("close", threading.get_ident()))
+            coalescer.submit({key: '""'})
+            coalescer.submit({key: '""'})
+            time.sleep(0.15)
+
+        trailing = calls[1][1]
+        self.assertNotEqual(trailing, threading.get_ident())
+        self.assertEqual(calls[1:], [("publish", trailing), ("close", trailing)])
+
+    @override_settings(SSE_PUSH_FRAGMENTS=True)
+    def test_push_mode_sends_fragment_rendered_at_publish(self):
+        """Test that push mode defers rendering to publish time, once per element, from the latest state."""
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                self.service.set_page_content(self.page.uuid, f"Draft {i}")
+
+        events = self.publish.call_args.args[0]
+        render = events[(self.service.channel, f"get_page_content#{self.page.uuid}")]
+        self.assertTrue(callable(render))
+        fragment = render()
+        self.assertIn("Draft 2", fragment)
+        self.assertIn('name="content"', fragment)
+
+    @override_settings(SSE_PUSH_FRAGMENTS=True)
+    def test_push_mode_components_swap_event_data(self):
+        """Test that SSE components swap payloads in directly instead of fetching on each event."""
+        html = render_to_string("cotton/stories/page/index.html", {"story": self.story, "page": self.page})
+        self.assertIn(f'sse-swap="get_page_content#{self.page.uuid}"', html)
+        self.assertNotIn("sse:get_page_content", html)
+
+    def test_events_outside_transactions_send_immediately(self):
+        """Test that queue_event publishes right away when nothing is holding events."""
+        with patch("apps.common.outbox.transaction.get_connection") as get_connection:
+            get_connection.return_value.in_atomic_block = False
+            queue_event(self.service.channel, "list_pages")
+
+        self.publish.assert_called_once_with({(self.service.channel, "list_pages"): '""'})
+
+
+class ChannelTokenTest(TestCase):
+    """Test signed SSE channel tokens."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.other = User.objects.create_user(username="other", email="other@example.com", password="testpass123")
+        self.story = Story.objects.create(user=self.user, title="Private Story")
+        self.url = f"/stories/{self.story.uuid}/events/"
+        self.view_kwargs = {"format-channels": ["story-{story_uuid}"], "story_uuid": self.story.uuid}
+        self.manager = ChannelManager()
+        caches["stories"].clear()
+
+    def _connect(self, user, token=None):
+        request = RequestFactory().get(self.url, {"token": token} if token else {})
+        request.user = User.objects.get(pk=user.pk)
+        channels = self.manager.get_channels_for_request(request, self.view_kwargs)
+        return all(self.manager.can_read_channel(request.user, channel) for channel in channels)
+
+    def test_sse_url_embeds_token(self):
+        """Test that the detail page's sse-connect URL carries a token for the story channel."""
+        request = RequestFactory().get("/")
+        request.user = self.user
+        template = Template("{% load sse_tags %}{% sse_url 'stories:events' story_uuid=story.uuid %}")
+        url = template.render(Context({"request": request, "story": self.story}))
+
+        self.assertTrue(url.startswith(f"/stories/{self.story.uuid}/events/?token="))
+
+    def test_valid_token_skips_database(self):
+        """Test that a connect with a valid token authorizes without queries."""
+        token = sign_channel_token(self.user, [self.story.channel])
+        request = RequestFactory().get(self.url, {"token": token})
+        request.user = self.user
+        with self.assertNumQueries(0):
+            channels = self.manager.get_channels_for_request(request, self.view_kwargs)
+            self.assertTrue(self.manager.can_read_channel(request.user, self.story.channel))
+        self.assertEqual(channels, {self.story.channel})
+
+    def test_invalid_tokens_fall_back_to_ownership_check(self):
+        """Test that foreign, tampered or expired tokens don't grant access on their own."""
+        token = sign_channel_token(self.user, [self.story.channel])
+        self.assertFalse(self._connect(self.other, token))
+        self.assertFalse(self._connect(self.other, token[:-2] + "xx"))
+        with override_settings(SSE_CHANNEL_TOKEN_MAX_AGE=-1):
+            self.assertTrue(self._connect(self.user, token))  # still the owner, via the query path
+
+    def test_delete_and_transfer_revoke_tokens(self):
+        """Test that deleting or transferring a story revokes previously issued tokens."""
+        token = sign_channel_token(self.user, [self.story.channel])
+        story = Story.objects.get(pk=self.story.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            story.user = self.other
+            story.save()
+        self.assertFalse(self._connect(self.user, token))
+
+        token = sign_channel_token(self.other, [self.story.channel])
+        with self.captureOnCommitCallbacks(execute=True):
+            story.delete()
+        self.assertFalse(self._connect(self.other, token))
+
+    def test_transfer_revokes_the_conversation_channel_too(self):
+        """Test that a token for the story's conversation channel stops granting access once the story moves."""
+        channel = f"conversation-{self.story.conversation.uuid}"
+        token = sign_channel_token(self.user, [channel])
+        request = RequestFactory().get("/", {"token": token})
+        request.user = self.user
+        self.manager.get_channels_for_request(request, {"format-channels": [channel]})
+        story = Story.objects.get(pk=self.story.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            story.user = self.other
+            story.save()
+
+        self.assertTrue(_is_revoked(channel, request.user.sse_channel_grants[channel]))
+
+    @override_settings(DEBUG=False)
+    def test_per_process_revocation_cache_is_flagged(self):
+        """Test that the system check warns when revocations live in a per-process cache."""
+        self.assertEqual([warning.id for warning in check_revocation_cache(None)], ["common.W001"])
+        redis_cache = {"stories": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+        with override_settings(CACHES={**settings.CACHES, **redis_cache}):
+            self.assertEqual(check_revocation_cache(None), [])
+
+
+class ImageVariantsTest(TestCase):
+    """Test that page images get resized, re-encoded variants rendered after commit."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.story = Story.objects.create(user=self.user, title="Illustrated Story")
+        self.page = Page.objects.create(story=self.story, content="Once upon a time")
+        publish_patcher = patch("apps.common.outbox.publish_events")
+        self.publish = publish_patcher.start()
+        self.addCleanup(publish_patcher.stop)
+
+    def _png(self, width, height):
+        buffer = io.BytesIO()
+        PILImage.new("RGB", (width, height), "white").save(buffer, format="PNG")
+        return ContentFile(buffer.getvalue(), name="test.png")
+
+    def test_variants_are_rendered_after_commit(self):
+        """Test that saving an image renders every width and format bucket without upscaling."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.image.save("test.png", self._png(800, 400), save=True)
+            self.assertEqual(self.page.image_variants, [])
+
+        self.page.refresh_from_db()
+        self.assertEqual(
+            sorted((v["width"], v["height"], v["format"]) for v in self.page.image_variants),
+            [(320, 160, "avif"), (320, 160, "webp"), (640, 320, "avif"), (640, 320, "webp")]
+            + [(800, 400, "avif"), (800, 400, "webp")],
+        )
+        storage = FileSystemStorage(location=self.media_root)
+        for variant in self.page.image_variants:
+            with storage.open(variant["name"]) as f, PILImage.open(f) as image:
+                self.assertEqual((image.width, image.format.lower()), (variant["width"], variant["format"]))
+
+    def test_replacing_the_image_drops_old_variants(self):
+        """Test that a new image clears the stored variants and deletes the old files."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.image.save("first.png", self._png(400, 400), save=True)
+        self.page.refresh_from_db()
+        old_names = [v["name"] for v in self.page.image_variants]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.image = None
+            self.page.save()
+
+        self.page.refresh_from_db()
+        self.assertEqual(self.page.image_variants, [])
+        storage = FileSystemStorage(location=self.media_root)
+        self.assertFalse(any(storage.exists(name) for name in old_names))
+
+    def test_image_field_renders_srcset(self):
+        """Test that the image field offers the variants as sources, best format first."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.page.image.save("test.png", self._png(800, 400), save=True)
+        self.page.refresh_from_db()
+
+        html = render_to_string("cotton/stories/page/image_component.html", {"story": self.story, "page": self.page})
+        self.assertLess(html.index('type="image/avif"'), html.index('type="image/webp"'))
+        self.assertIn("_320w.webp 320w,", html)
+        self.assertIn('width="800" height="400"', html)
+
+
+class ContextImageCacheTest(TestCase):
+    """Test that story context images are downscaled once and then served from the cache."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        caches["stories"].clear()
+        context_image_cache.reset_stats()
+        self.story = Story.objects.create(user=self.user, title="Illustrated Story")
+        self.page = Page.objects.create(story=self.story, content="Once upon a time")
+        self.service = StoryService(self.story.uuid)
+
+    def _noise_png(self, width, height):
+        buffer = io.BytesIO()
+        PILImage.frombytes("RGB", (width, height), random.Random(0).randbytes(width * height * 3)).save(buffer, "PNG")
+        return ContentFile(buffer.getvalue(), name="noise.png")
+
+    def test_renditions_are_bounded_and_cached_by_content(self):
+        """Test that images are sent downscaled, and later requests don't read the originals."""
+        self.page.image.save("noise.png", self._noise_png(1600, 800), save=True)
+        self.page.refresh_from_db()
+        self.assertEqual(len(self.page.image_hash), 64)
+
+        parts = self.service.gemini_parts()
+        image_part = parts[-1]
+        self.assertEqual(image_part.inline_data.mime_type, "image/webp")
+        with PILImage.open(io.BytesIO(image_part.inline_data.data)) as image:
+            self.assertEqual(image.size, (768, 384))
+
+        with patch("apps.stories.cache.default_storage.open", side_effect=AssertionError("original read")):
+            self.assertEqual(self.service.gemini_parts()[-1].inline_data.data, image_part.inline_data.data)
+
+        stats = context_image_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["bytes_saved"], 2 * (self.page.image_size - len(image_part.inline_data.data)))
+        self.assertGreater(stats["bytes_saved"], 0)
+
+
+class ReferenceSelectionTest(TestCase):
+    """Test that illustration requests send a bounded, relevant set of reference images."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpass123")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        caches["stories"].clear()
+
+    def test_ranking_prefers_neighbours_then_recent_then_similar(self):
+        """Test the order of reference reasons, and that unrelated and unillustrated pages are left out."""
+        now = timezone.now()
+        texts = [
+            "A red kite over the hill",
+            "The dragon sleeps in a cave",
+            "Mia bakes bread",
+            "The dragon wakes up in the dark cave",
+            "Mia waters her garden",
+            "Mia reads a book",
+            "Mia goes to bed",
+        ]
+        candidates = [
+            Candidate(uuid4(), number, text, number != 5, now - timedelta(minutes=10 - number))
+            for number, text in enumerate(texts, start=1)
+        ]
+        ranked = rank_references(candidates, target=candidates[3].uuid, recent=1)
+
+        self.assertEqual(
+            [(r.page_number, r.reason) for r in ranked],
+            [(3, "adjacent"), (7, "recent"), (2, "similar")],
+        )
+        self.assertGreater(ranked[2].score, 0.3)
+
+    def test_selection_respects_image_and_byte_budgets(self):
+        """Test that reference_images stops at the configured image count and skips images over the byte budget."""
+        story = Story.objects.create(user=self.user, title="Long Story")
+        for number in range(1, 13):
+            page = Page.objects.create(story=story, content=f"Page {number}", image_text="a fox in the snow")
+            buffer = io.BytesIO()
+            PILImage.new("RGB", (64, 64), (number * 20, 0, 0)).save(buffer, format="PNG")
+            page.image.save("page.png", ContentFile(buffer.getvalue()), save=True)
+        service = StoryService(story.uuid)
+
+        with override_settings(ARTIST_REFERENCE_MAX_IMAGES=4):
+            references = service.reference_images(6, query="fox")
+        self.assertEqual(len(references), 4)
+        self.assertEqual({r.page_number for r in references if r.reason == "adjacent"}, {5, 7})
+        self.assertNotIn(6, [r.page_number for r in references])
+
+        parts = service.gemini_parts(references)
+        self.assertEqual(sum(1 for part in parts if not isinstance(part, str)), 4)
+
+        with override_settings(ARTIST_REFERENCE_MAX_BYTES=len(references[0].data)):
+            self.assertEqual(len(service.reference_images(6)), 1)
+
+    def test_recent_references_rank_by_when_the_image_was_drawn(self):
+        """Test that a text edit leaves image_updated_at alone, so an old illustration doesn't become "recent"."""
+        story = Story.objects.create(user=self.user, title="Edited Story")
+        now = timezone.now()
+        pages = []
+        for number in range(1, 4):
+            page = Page.objects.create(story=story, content=f"Page {number}")
+            buffer = io.BytesIO()
+            PILImage.new("RGB", (64, 64), (number * 20, 0, 0)).save(buffer, format="PNG")
+            page.image.save("page.png", ContentFile(buffer.getvalue()), save=True)
+            self.assertIsNotNone(page.image_updated_at)
+            Page.objects.filter(pk=page.pk).update(image_updated_at=now - timedelta(minutes=10 - number))
+            pages.append(page)
+        service = StoryService(story.uuid)
+
+        service.set_page_content(1, "The first page, rewritten")
+        pages[0].refresh_from_db()
+        self.assertEqual(pages[0].image_updated_at, now - timedelta(minutes=9))
+        self.assertEqual(
+            [(r.page_number, r.reason) for r in service.reference_images()][:2], [(3, "recent"), (2, "recent")]
+        )
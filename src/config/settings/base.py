@@ -66,7 +66,6 @@ INSTALLED_APPS = [
     "django_htmx",
     "crispy_forms",
     "crispy_tailwind",
-    "ordered_model",
     "django_celery_results",
     "markdownx",
     "django_browser_reload",
@@ -213,6 +212,21 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # Media files (User uploaded content)
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR.parent / "var" / "media"
+# Limits for downloading external media (our own media is read straight from storage)
+MEDIA_FETCH_TIMEOUT = env.float("MEDIA_FETCH_TIMEOUT", default=10)
+MEDIA_FETCH_MAX_BYTES = env.int("MEDIA_FETCH_MAX_BYTES", default=20 * 1024 * 1024)
+# Derived image variants, rendered by a Celery task in a pool of IMAGE_VARIANT_WORKERS processes (0 = inline)
+IMAGE_VARIANT_WIDTHS = [320, 640, 1024]
+IMAGE_VARIANT_FORMATS = ["avif", "webp"]
+IMAGE_VARIANT_QUALITY = 75
+IMAGE_VARIANT_WORKERS = env.int("IMAGE_VARIANT_WORKERS", default=2)
+# Page images sent to models as story context are downscaled to fit this edge and cached by content hash
+CONTEXT_IMAGE_MAX_EDGE = 768
+CONTEXT_IMAGE_FORMAT = "webp"
+CONTEXT_IMAGE_QUALITY = 80
+# Reference images per illustration request; at most one 768px tile each, so the image cap bounds tokens too
+ARTIST_REFERENCE_MAX_IMAGES = env.int("ARTIST_REFERENCE_MAX_IMAGES", default=6)
+ARTIST_REFERENCE_MAX_BYTES = env.int("ARTIST_REFERENCE_MAX_BYTES", default=2 * 1024 * 1024)
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -255,6 +269,31 @@ STRIPE_SECRET_KEY = env("STRIPE_SECRET_KEY", default=None)
 STRIPE_WEBHOOK_SECRET = env("STRIPE_WEBHOOK_SECRET", default=None)
 STRIPE_PRICE_ID = env("STRIPE_PRICE_ID", default=None)
 
+# Agent history: past the budget, older turns are replaced by stored summary checkpoints, keeping recent ones verbatim
+AI_HISTORY_TOKEN_BUDGET = env.int("AI_HISTORY_TOKEN_BUDGET", default=24_000)
+AI_HISTORY_KEEP_TOKENS = env.int("AI_HISTORY_KEEP_TOKENS", default=8_000)
+# Binary message parts larger than this are stored as Artifacts and referenced from the message row
+AI_MESSAGE_INLINE_MAX_BYTES = env.int("AI_MESSAGE_INLINE_MAX_BYTES", default=1024)
+
+# Agent runs: in async mode each worker process runs up to AI_AGENT_CONCURRENCY agent runs on one event loop
+AI_AGENT_ASYNC = env.bool("AI_AGENT_ASYNC", default=True)
+AI_AGENT_CONCURRENCY = env.int("AI_AGENT_CONCURRENCY", default=8)
+# Read-only tool calls from one model response that may run at once, per agent run
+AI_TOOL_READ_CONCURRENCY = env.int("AI_TOOL_READ_CONCURRENCY", default=4)
+# Chat replies stream into the AI panel, sending the partial message at most once per AI_STREAM_INTERVAL seconds
+AI_STREAM_REPLIES = env.bool("AI_STREAM_REPLIES", default=True)
+AI_STREAM_INTERVAL = env.float("AI_STREAM_INTERVAL", default=0.1)
+# Suggestion jobs (title, page text, scene, illustration) ask for structured output in one request and apply it
+# themselves; off, they run the writer agent, which does the same through its tools
+AI_DIRECT_JOBS = env.bool("AI_DIRECT_JOBS", default=True)
+# Steps of one workflow (e.g. the page branches of story generation) that may be queued or running at once
+AI_WORKFLOW_MAX_PARALLEL = env.int("AI_WORKFLOW_MAX_PARALLEL", default=4)
+# Workflow steps queued or running longer than this many seconds are failed, so a lost message or a dead worker can't
+# stall their workflow (see ai.fail_stale_steps, scheduled below)
+AI_WORKFLOW_STEP_TIMEOUT = env.int("AI_WORKFLOW_STEP_TIMEOUT", default=30 * 60)
+# Illustrating a whole story draws at most this many pages at a time
+AI_ILLUSTRATION_MAX_PARALLEL = env.int("AI_ILLUSTRATION_MAX_PARALLEL", default=3)
+
 # AI settings (env-only; no defaults)
 OPENAI_API_KEY = env("OPENAI_API_KEY", default=None)
 GOOGLE_API_KEY = env("GOOGLE_API_KEY", default=None)
@@ -267,10 +306,24 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    "fail-stale-workflow-steps": {"task": "ai.fail_stale_steps", "schedule": 5 * 60},
+}
 
 # Disable Celery's root logger hijacking to use Django logging config
 CELERY_WORKER_HIJACK_ROOT_LOGGER = False
 
+# Cache: environment overlays override this; the "stories" alias holds versioned story snapshots
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "stories": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "stories",
+    },
+}
+
 STORAGES = {
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
@@ -281,8 +334,19 @@ STORAGES = {
 }
 
 # EventStream configuration for Server-Sent Events
-EVENTSTREAM_STORAGE_CLASS = "django_eventstream.storage.DjangoModelStorage"
+# Events are stored in the database by default. Setting this to "apps.common.eventstorage.RedisStreamStorage" keeps
+# them in capped, expiring Redis streams (one per channel) so Last-Event-ID replay never touches Postgres; its tests
+# only run against a reachable Redis server
+EVENTSTREAM_STORAGE_CLASS = env("EVENTSTREAM_STORAGE_CLASS", default="django_eventstream.storage.DjangoModelStorage")
+EVENTSTREAM_STREAM_MAXLEN = env.int("EVENTSTREAM_STREAM_MAXLEN", default=1000)
+EVENTSTREAM_STREAM_TTL = env.int("EVENTSTREAM_STREAM_TTL", default=60 * 60 * 24)
 EVENTSTREAM_CHANNELMANAGER_CLASS = "apps.common.sse.ChannelManager"
+# Seconds over which repeated (channel, event) refreshes collapse into one leading and one trailing event
+SSE_COALESCE_WINDOW = env.float("SSE_COALESCE_WINDOW", default=0.25)
+# Push pre-rendered story fragments in SSE payloads instead of having every tab fetch them back
+SSE_PUSH_FRAGMENTS = env.bool("SSE_PUSH_FRAGMENTS", default=False)
+# Lifetime in seconds of the signed channel tokens embedded in sse-connect URLs
+SSE_CHANNEL_TOKEN_MAX_AGE = env.int("SSE_CHANNEL_TOKEN_MAX_AGE", default=600)
 
 # EventStream Redis configuration - default to localhost for development
 _event_redis_url = env("EVENTSTREAM_REDIS_URL", default=None) or env("REDIS_URL", default=None)
@@ -48,7 +48,19 @@ CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND", default="redis://localhost:
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-    }
+    },
+    # Story snapshots: shared with Celery workers through Redis when configured, local memory otherwise
+    "stories": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": env("REDIS_CACHE_URL"),
+        }
+        if env("REDIS_CACHE_URL", default=None)
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "stories",
+        }
+    ),
 }
 
 # Allauth: Relaxed email verification for development
@@ -13,13 +13,30 @@ EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-    }
+    },
+    "stories": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "stories",
+    },
 }
 
 # Celery: Synchronous execution for tests
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# SSE: Keep event storage in the test database rather than Redis
+EVENTSTREAM_STORAGE_CLASS = "django_eventstream.storage.DjangoModelStorage"
+
+# SSE: Publish batches immediately instead of coalescing them on background timers
+SSE_COALESCE_WINDOW = 0
+
+# Images: Render variants inline instead of in a process pool
+IMAGE_VARIANT_WORKERS = 0
+
+# Agents: Run on the calling thread so TestCase transactions are visible to tools and history processors
+# (AsyncAgentDatabaseTest covers async mode)
+AI_AGENT_ASYNC = False
+
 # Allauth: No email verification for tests
 ACCOUNT_EMAIL_VERIFICATION = "none"
 